@@ -0,0 +1,97 @@
+import os
+
+CPU_PERIOD = 100000  # Standard CFS period
+USER_MEMORY_BYTES = int(os.getenv("USER_MEMORY_BYTES", str(1024 * 1024 * 1024)))
+USER_CPUS = float(os.getenv("USER_CPUS", "1"))
+MIN_MEMORY_BYTES = int(os.getenv("MIN_CONTAINER_MEMORY_BYTES", str(64 * 1024 * 1024)))
+MIN_CPUS = float(os.getenv("MIN_CONTAINER_CPUS", "0.05"))
+## Memory a container gets on top of the peak it was seen using
+MEMORY_HEADROOM = float(os.getenv("MEMORY_HEADROOM", "1.25"))
+## How far each pass moves limits toward their new targets (1 = all the way)
+SMOOTHING = float(os.getenv("ALLOCATION_SMOOTHING", "0.5"))
+## Changes smaller than this fraction of the current limit are skipped
+HYSTERESIS = float(os.getenv("ALLOCATION_HYSTERESIS", "0.1"))
+
+## Split total between containers: everyone gets their minimum, then whatever they
+## demand above it. If that doesn't fit, the spare is shared in proportion to demand;
+## if it does, what's left over is shared evenly so idle containers can still burst.
+def share(total, minimums, demands):
+    count = len(minimums)
+    base = sum(minimums)
+    if base >= total:
+        return [total / count] * count
+    spare = total - base
+    extra = [max(0, demand - minimum) for demand, minimum in zip(demands, minimums)]
+    wanted = sum(extra)
+    if wanted <= spare:
+        leftover = (spare - wanted) / count
+        return [minimum + e + leftover for minimum, e in zip(minimums, extra)]
+    return [minimum + spare * e / wanted for minimum, e in zip(minimums, extra)]
+
+## Turns recent usage into per-container limits for one user's running containers.
+## usage: {container_id: {"cpu": recent CPUs in use, "memory": peak bytes}}, missing for
+## containers with no samples yet; current: {container_id: {"mem_limit", "cpu_quota"}}.
+## Returns {container_id: {"mem_limit", "cpu_period", "cpu_quota"}}.
+class demand_allocator:
+    def __init__(self, total_memory=USER_MEMORY_BYTES, total_cpus=USER_CPUS,
+                 smoothing=SMOOTHING, hysteresis=HYSTERESIS):
+        self.total_memory = total_memory
+        self.total_quota = int(CPU_PERIOD * total_cpus)
+        self.smoothing = smoothing
+        self.hysteresis = hysteresis
+
+    def allocate(self, container_ids, usage, current):
+        count = len(container_ids)
+        even_memory = self.total_memory / count
+        even_quota = self.total_quota / count
+
+        ## Containers we know nothing about yet are assumed to want an even share
+        memory_floor, memory_demand, quota_demand = [], [], []
+        for container_id in container_ids:
+            seen = usage.get(container_id)
+            if seen is None:
+                memory_floor.append(MIN_MEMORY_BYTES)
+                memory_demand.append(even_memory)
+                quota_demand.append(even_quota)
+            else:
+                ## Never plan a limit below what the container is using right now
+                memory_floor.append(max(MIN_MEMORY_BYTES, seen["memory"] * 1.05))
+                memory_demand.append(seen["memory"] * MEMORY_HEADROOM)
+                quota_demand.append(seen["cpu"] * CPU_PERIOD)
+        min_quota = MIN_CPUS * CPU_PERIOD
+
+        memory = share(self.total_memory, memory_floor, memory_demand)
+        quota = share(self.total_quota, [min_quota] * count, quota_demand)
+
+        raw = {
+            container_id: {"mem_limit": int(memory[i]), "cpu_quota": int(quota[i])}
+            for i, container_id in enumerate(container_ids)
+        }
+        smoothed = {
+            container_id: {
+                key: self.smooth(current.get(container_id, {}).get(key), value)
+                for key, value in limits.items()
+            }
+            for container_id, limits in raw.items()
+        }
+        for container_id, limits in smoothed.items():
+            if limits["mem_limit"] < memory_floor[container_ids.index(container_id)]:
+                limits["mem_limit"] = raw[container_id]["mem_limit"]
+
+        ## Smoothing lags behind the targets; never let that push the user past their totals
+        chosen = smoothed
+        if (sum(l["mem_limit"] for l in smoothed.values()) > self.total_memory
+                or sum(l["cpu_quota"] for l in smoothed.values()) > self.total_quota):
+            chosen = raw
+        return {
+            container_id: dict(limits, cpu_period=CPU_PERIOD)
+            for container_id, limits in chosen.items()
+        }
+
+    def smooth(self, old, target):
+        if not old or old <= 0:
+            return target
+        value = old + self.smoothing * (target - old)
+        if abs(value - old) < self.hysteresis * old:
+            return old
+        return int(value)
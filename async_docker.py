@@ -0,0 +1,142 @@
+import asyncio
+import collections
+import json
+import os
+import urllib.parse
+
+DOCKER_SOCKET = os.getenv("DOCKER_SOCKET", "/var/run/docker.sock")
+MAX_CONNECTIONS = int(os.getenv("ASYNC_DOCKER_CONNECTIONS", "32"))
+
+class async_docker_error(Exception):
+    def __init__(self, status, explanation):
+        super().__init__(f"{status}: {explanation}")
+        self.status = status
+        self.explanation = explanation
+
+## Minimal asyncio client for the Docker Engine API over its unix socket, or plain tcp://
+## for remote daemons (no TLS). Ordinary requests share a pool of keep-alive connections (at most max_connections
+## in flight); exec_start hijacks a dedicated connection and hands back its raw streams.
+class async_docker_client:
+    def __init__(self, path=DOCKER_SOCKET, max_connections=MAX_CONNECTIONS):
+        ## Takes a bare socket path or a docker base_url (unix:///..., tcp://host:port)
+        url = urllib.parse.urlparse(path)
+        if url.scheme == "tcp":
+            self.path = None
+            self.address = (url.hostname, url.port or 2375)
+        else:
+            self.path = url.path if url.scheme == "unix" else path
+            self.address = None
+        self.idle = collections.deque()
+        self.slots = asyncio.Semaphore(max_connections)
+        self.requests = 0
+        self.connections_opened = 0
+
+    async def connect(self):
+        self.connections_opened += 1
+        if self.address:
+            return await asyncio.open_connection(*self.address)
+        return await asyncio.open_unix_connection(self.path)
+
+    async def request(self, method, path, body=None, params=None):
+        if params:
+            path = f"{path}?{urllib.parse.urlencode(params)}"
+        payload = json.dumps(body).encode() if body is not None else b""
+        async with self.slots:
+            self.requests += 1
+            ## A pooled connection may have been closed by the daemon; retry once on a new one
+            for reused in (bool(self.idle), False):
+                conn = self.idle.pop() if reused else await self.connect()
+                try:
+                    status, headers, data = await self.exchange(conn, method, path, payload)
+                    break
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    conn[1].close()
+                    if not reused:
+                        raise
+            if headers.get("connection", "").lower() == "close":
+                conn[1].close()
+            else:
+                self.idle.append(conn)
+
+        if status >= 400:
+            try:
+                message = json.loads(data).get("message", "")
+            except ValueError:
+                message = data.decode(errors="replace")
+            raise async_docker_error(status, message)
+        if headers.get("content-type", "").startswith("application/json") and data:
+            return json.loads(data)
+        return data
+
+    async def exchange(self, conn, method, path, payload, extra_headers=None):
+        reader, writer = conn
+        head = [f"{method} {path} HTTP/1.1", "Host: docker"]
+        if payload:
+            head += ["Content-Type: application/json", f"Content-Length: {len(payload)}"]
+        head += extra_headers or []
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + payload)
+        await writer.drain()
+
+        status, headers = await self.read_head(reader)
+        if status == 101 or "upgrade" in headers.get("connection", "").lower():
+            return status, headers, b""
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                if size == 0:
+                    await reader.readuntil(b"\r\n")
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            data = b"".join(chunks)
+        else:
+            data = await reader.readexactly(int(headers.get("content-length", "0")))
+        return status, headers, data
+
+    async def read_head(self, reader):
+        lines = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+        status = int(lines[0].split(" ", 2)[1])
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+        return status, headers
+
+    async def exec_create(self, container_id, cmd, user=None, workdir=None, tty=True, stdin=True):
+        result = await self.request("POST", f"/containers/{container_id}/exec", {
+            "Cmd": cmd if isinstance(cmd, list) else [cmd],
+            "Tty": tty,
+            "AttachStdin": stdin,
+            "AttachStdout": True,
+            "AttachStderr": True,
+            "User": user or "",
+            "WorkingDir": workdir or "",
+        })
+        return result["Id"]
+
+    ## Start an exec and return the (reader, writer) of its hijacked connection.
+    ## With a tty the stream is the raw terminal, no multiplexing headers.
+    async def exec_start(self, exec_id, tty=True):
+        conn = await self.connect()
+        payload = json.dumps({"Detach": False, "Tty": tty}).encode()
+        status, headers, data = await self.exchange(
+            conn, "POST", f"/exec/{exec_id}/start", payload,
+            ["Connection: Upgrade", "Upgrade: tcp"]
+        )
+        if status >= 400:
+            conn[1].close()
+            raise async_docker_error(status, data.decode(errors="replace"))
+        return conn
+
+    async def close(self):
+        while self.idle:
+            self.idle.pop()[1].close()
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "connections_opened": self.connections_opened,
+            "idle": len(self.idle),
+        }
@@ -0,0 +1,248 @@
+## asyncio deployment: python-socketio's AsyncServer under an ASGI server (uvicorn),
+## with the Flask app mounted for HTTP. Terminals are native asyncio streams over an
+## async Docker client; every other Socket.IO event runs the existing handlers from
+## socket_routes on a bounded thread pool, inside a Flask request context built from
+## the connection's handshake so session and request.sid work as they do under Flask-SocketIO.
+##
+##   python async_server.py          (or: uvicorn async_server:asgi_app)
+import asyncio
+import concurrent.futures
+import inspect
+import os
+import time
+import socketio
+from asgiref.wsgi import WsgiToAsgi
+from flask import request, session
+from main import app, docker_mgr
+from socket_routes import register_socket_routes
+from async_docker import async_docker_client
+from async_terminal import async_terminal_session
+from terminal_session import ORPHAN_TIMEOUT
+import metrics
+from metrics import timed, handler_seconds
+
+HANDLER_WORKERS = int(os.getenv("ASYNC_HANDLER_WORKERS", "64"))
+## Events handled natively on the event loop instead of by socket_routes
+NATIVE_EVENTS = {"connect", "disconnect", "terminal_attach", "terminal_input", "terminal_ack", "terminal_close"}
+
+## Stands in for Flask-SocketIO's SocketIO object, so register_socket_routes can
+## register its handlers and emit from any thread against the AsyncServer
+class socketio_bridge:
+    def __init__(self, sio, app, workers=HANDLER_WORKERS):
+        self.sio = sio
+        self.app = app
+        self.pool = concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix="sio-handler")
+        self.environs = {}    # sid -> handshake environ
+        self.users = {}       # sid -> user_id, so terminal events skip decoding the session cookie
+        self.handlers = {}
+        self.loop = None
+
+    ## socket_routes calls socketio.server.enter_room
+    @property
+    def server(self):
+        return self
+
+    def on(self, event):
+        def decorator(fn):
+            self.handlers[event] = fn
+            if event not in NATIVE_EVENTS:
+                self.sio.on(event, self.bridge(fn))
+            return fn
+        return decorator
+
+    def bridge(self, fn):
+        async def handler(sid, *args):
+            return await self.loop.run_in_executor(self.pool, self.call, fn, sid, args)
+        return handler
+
+    def call(self, fn, sid, args):
+        with self.app.request_context(self.environs.get(sid, {})):
+            request.sid = sid
+            request.namespace = "/"
+            return fn(*args[:len(inspect.signature(fn).parameters)])
+
+    def user_for(self, environ):
+        with self.app.request_context(environ):
+            return session.get("user_id")
+
+    def run_soon(self, coro):
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            return self.loop.create_task(coro)
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def emit(self, event, data=None, to=None, room=None, **kwargs):
+        self.run_soon(self.sio.emit(event, data, to=to or room, **kwargs))
+
+    def enter_room(self, sid, room, namespace=None):
+        self.run_soon(self.sio.enter_room(sid, room, namespace=namespace))
+
+    ## For the emit queue depth in /metrics
+    @property
+    def eio(self):
+        return self.sio.eio
+
+
+MESSAGE_QUEUE = os.getenv("SOCKETIO_MESSAGE_QUEUE")
+sio = socketio.AsyncServer(
+    async_mode="asgi",
+    cors_allowed_origins="*",
+    client_manager=socketio.AsyncRedisManager(MESSAGE_QUEUE) if MESSAGE_QUEUE else None
+)
+bridge = socketio_bridge(sio, app)
+services = register_socket_routes(bridge, docker_mgr)
+file_watcher = services["file_watcher"]
+
+## One async client per Docker host, by endpoint name
+docker_async = {}
+## (user_id, container_name, tab_id) -> async_terminal_session
+async_terminals = {}
+opening = {}
+docker_mgr.idle.add_activity_source(lambda: {
+    (terminal.user_id, terminal.container_name): terminal.last_activity
+    for terminal in list(async_terminals.values())
+})
+metrics.add_terminal_source(lambda: list(async_terminals.values()))
+
+async def on_startup():
+    global docker_async
+    bridge.loop = asyncio.get_running_loop()
+    docker_async = {endpoint.name: async_docker_client(endpoint.base_url) for endpoint in docker_mgr.endpoints}
+    bridge.loop.create_task(reap_orphaned_sessions())
+
+@sio.event
+@timed(handler_seconds, "connect")
+async def connect(sid, environ, auth=None):
+    user_id = bridge.user_for(environ)
+    if not user_id:
+        print("Unauthenticated user tried to connect, disconnecting.")
+        return False
+    bridge.environs[sid] = environ
+    bridge.users[sid] = user_id
+    print(f"User {user_id} connected")
+
+@sio.event
+async def disconnect(sid, *args):
+    print(f"Client {sid} disconnected. Detaching terminals.")
+    for terminal in list(async_terminals.values()):
+        terminal.detach_client(sid)
+    handler = bridge.handlers.get("disconnect")
+    if handler:
+        await bridge.loop.run_in_executor(bridge.pool, bridge.call, handler, sid, ())
+    bridge.environs.pop(sid, None)
+    bridge.users.pop(sid, None)
+
+def user_of(sid):
+    return bridge.users.get(sid)
+
+## Get the live exec stream for this tab, starting a new shell if there isn't one.
+## Concurrent opens of the same tab share one attempt.
+async def open_terminal(user_id, container_name, tab_id):
+    key = (user_id, container_name, tab_id)
+    terminal = async_terminals.get(key)
+    if terminal and not terminal.closed:
+        return terminal
+    if key not in opening:
+        opening[key] = bridge.loop.create_task(start_terminal(key))
+    try:
+        return await asyncio.shield(opening[key])
+    finally:
+        opening.pop(key, None)
+
+async def start_terminal(key):
+    user_id, container_name, tab_id = key
+    container = await bridge.loop.run_in_executor(
+        bridge.pool, docker_mgr.find_container_by_logical_name, user_id, container_name
+    )
+    if not container:
+        raise Exception("Container not found.")
+
+    endpoint = docker_mgr.endpoints.of(container) or docker_mgr.endpoints.primary
+    client = docker_async[endpoint.name]
+    exec_id = await client.exec_create(
+        container.id, "/bin/bash", user=user_id, workdir=f"/home/{user_id}"
+    )
+    reader, writer = await client.exec_start(exec_id)
+    terminal = async_terminal_session(reader, writer, user_id, container_name, tab_id, sio.emit)
+    terminal.start()
+    async_terminals[key] = terminal
+    return terminal
+
+async def terminal_error(sid, tab_id, message):
+    print(message)
+    await sio.emit("terminal_output", {"output": message, "tab_id": tab_id}, to=sid)
+
+@sio.event
+@timed(handler_seconds, "terminal_attach")
+async def terminal_attach(sid, data):
+    user_id = user_of(sid)
+    if not user_id:
+        return
+    try:
+        terminal = await open_terminal(user_id, data.get("container_name"), data.get("tab_id"))
+        await terminal.attach_client(sid)
+    except Exception as e:
+        await terminal_error(sid, data.get("tab_id"), f"Terminal setup error: {str(e)}")
+
+@sio.event
+@timed(handler_seconds, "terminal_input")
+async def terminal_input(sid, data):
+    user_id = user_of(sid)
+    if not user_id:
+        return
+    container_name = data.get("container_name")
+    tab_id = data.get("tab_id")
+    input_data = data.get("input") or ""
+
+    if docker_mgr.idle.is_hibernated(user_id, container_name):
+        await bridge.loop.run_in_executor(bridge.pool, docker_mgr.idle.touch, user_id, container_name)
+
+    terminal = async_terminals.get((user_id, container_name, tab_id))
+    if not terminal or terminal.closed:
+        try:
+            terminal = await open_terminal(user_id, container_name, tab_id)
+            await terminal.attach_client(sid)
+        except Exception as e:
+            await terminal_error(sid, tab_id, f"Terminal setup error: {str(e)}")
+            return
+
+    try:
+        await terminal.send(input_data.encode())
+        ## A command was probably just run, so look for file changes soon
+        if "\r" in input_data:
+            file_watcher.nudge(user_id, container_name)
+    except Exception as e:
+        await terminal_error(sid, tab_id, f"Send error: {str(e)}")
+
+@sio.event
+@timed(handler_seconds, "terminal_ack")
+async def terminal_ack(sid, data):
+    terminal = async_terminals.get((user_of(sid), data.get("container_name"), data.get("tab_id")))
+    if terminal and terminal.sid == sid:
+        await terminal.ack(int(data.get("size", 0)))
+
+@sio.event
+@timed(handler_seconds, "terminal_close")
+async def terminal_close(sid, data):
+    terminal = async_terminals.pop((user_of(sid), data.get("container_name"), data.get("tab_id")), None)
+    if terminal:
+        terminal.close()
+
+## Close sessions nobody has reattached to within TERMINAL_ORPHAN_TIMEOUT
+async def reap_orphaned_sessions():
+    while True:
+        await asyncio.sleep(10)
+        now = time.monotonic()
+        for key, terminal in list(async_terminals.items()):
+            if terminal.closed or terminal.orphaned_for(now) > ORPHAN_TIMEOUT:
+                del async_terminals[key]
+                terminal.close()
+
+asgi_app = socketio.ASGIApp(sio, other_asgi_app=WsgiToAsgi(app), on_startup=on_startup)
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(asgi_app, host="0.0.0.0", port=int(os.getenv("PORT", "5000")))
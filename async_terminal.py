@@ -0,0 +1,165 @@
+import asyncio
+import time
+from terminal_session import (
+    output_framer, scrollback_buffer, stream_stats,
+    READ_BYTES, HIGH_WATERMARK, LOW_WATERMARK, BACKPRESSURE_POLICY,
+)
+
+## asyncio counterpart of terminal_session for the async server: one task per exec
+## stream instead of a reactor thread, with the same framing, scrollback, replay and
+## flow control. Everything runs on the event loop, so no locking is needed beyond
+## keeping a replay and a flush from interleaving their emits.
+class async_terminal_session:
+    def __init__(self, reader, writer, user_id, container_name, tab_id, emit):
+        self.reader = reader
+        self.writer = writer
+        self.user_id = user_id
+        self.container_name = container_name
+        self.tab_id = tab_id
+        self.emit = emit    # the AsyncServer's emit coroutine
+        self.sid = None
+        self.scrollback = scrollback_buffer()
+        self.detached_at = time.monotonic()
+        self.last_activity = time.monotonic()
+        self.closed = False
+        self.framer = output_framer()
+        self.policy = BACKPRESSURE_POLICY
+        self.unacked = 0
+        self.throttled = False
+        self.dropped = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.resumed = asyncio.Event()
+        self.resumed.set()
+        self.emit_lock = asyncio.Lock()
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self.pump())
+
+    async def pump(self):
+        try:
+            while True:
+                ## The pause policy simply stops reading, so the container process blocks
+                await self.resumed.wait()
+                deadline = self.framer.deadline()
+                try:
+                    if deadline is None:
+                        output = await self.reader.read(READ_BYTES)
+                    else:
+                        output = await asyncio.wait_for(
+                            self.reader.read(READ_BYTES), max(0, deadline - time.monotonic())
+                        )
+                except asyncio.TimeoutError:
+                    await self.flush()
+                    continue
+                if not output:
+                    await self.flush(final=True)
+                    break
+                self.bytes_out += len(output)
+                stream_stats["bytes_out"] += len(output)
+                if self.framer.feed(output):
+                    await self.flush()
+                elif self.throttled:
+                    self.drop_backlog()
+        except (ConnectionError, OSError) as e:
+            print(f"Terminal stream error for {self.container_name}/{self.tab_id}: {e}")
+        finally:
+            self.closed = True
+
+    async def flush(self, final=False):
+        if self.throttled and not final:
+            self.drop_backlog()
+            return
+
+        text = self.framer.take(final)
+        if not text:
+            return
+        self.scrollback.append(text)
+        self.last_activity = time.monotonic()
+        if self.sid is None:
+            return
+        if self.dropped:
+            text = f"\r\n[{self.dropped} bytes of output skipped]\r\n" + text
+            self.dropped = 0
+
+        size = len(text.encode())
+        self.unacked += size
+        async with self.emit_lock:
+            await self.emit("terminal_output", {
+                "output": text,
+                "tab_id": self.tab_id,
+                "size": size
+            }, to=self.sid)
+
+        if self.unacked >= HIGH_WATERMARK and not self.throttled:
+            self.throttled = True
+            stream_stats["watermark_hits"] += 1
+            if self.policy == "pause":
+                self.resumed.clear()
+
+    def drop_backlog(self):
+        if self.policy == "pause":
+            return
+        dropped = self.framer.trim(self.policy)
+        self.dropped += dropped
+        stream_stats["dropped_bytes"] += dropped
+
+    def unthrottle(self):
+        self.throttled = False
+        self.resumed.set()
+
+    async def ack(self, size: int):
+        self.unacked = max(0, self.unacked - size)
+        if not self.throttled or self.closed or self.unacked > LOW_WATERMARK:
+            return
+        self.unthrottle()
+        await self.flush()
+
+    async def attach_client(self, sid):
+        self.sid = sid
+        self.detached_at = None
+        self.unacked = 0
+        self.dropped = 0
+        self.unthrottle()
+        pending = self.framer.take()
+        if pending:
+            self.scrollback.append(pending)
+        replay = self.scrollback.contents()
+        size = len(replay.encode())
+        self.unacked += size
+        async with self.emit_lock:
+            await self.emit("terminal_output", {
+                "output": replay,
+                "tab_id": self.tab_id,
+                "size": size,
+                "replay": True
+            }, to=sid)
+
+    def detach_client(self, sid):
+        if self.sid != sid:
+            return
+        self.sid = None
+        self.detached_at = time.monotonic()
+        self.unthrottle()
+
+    def orphaned_for(self, now):
+        if self.detached_at is None:
+            return 0
+        return now - self.detached_at
+
+    async def send(self, data: bytes):
+        self.last_activity = time.monotonic()
+        self.bytes_in += len(data)
+        stream_stats["bytes_in"] += len(data)
+        self.writer.write(data)
+        await self.writer.drain()
+
+    def close(self):
+        self.closed = True
+        if self.task:
+            self.task.cancel()
+        try:
+            self.writer.close()
+        except Exception:
+            pass
@@ -0,0 +1,103 @@
+## Times container lookups through container_index against the old path, which asked
+## the daemon with containers.list and label filters on every lookup.
+##
+## With --docker both run against the daemon from the environment (DOCKER_HOST or the
+## local socket), using the user containers it already has, and a speedup is printed.
+## Without it the "daemon" is an in-memory fake: that only shows what each path costs
+## inside this process (filtering, SDK objects), not Docker's list latency, so no
+## speedup is claimed.
+##
+##   python bench_container_index.py [--docker] [--users 200] [--per-user 5] [--lookups 2000]
+import argparse
+import random
+import time
+from container_index import container_index
+
+class fake_container:
+    def __init__(self, client, container_id, user_id, container_name):
+        self.client = client
+        self.id = container_id
+        self.name = f"{user_id}_{container_name}"
+        self.labels = {"user_id": user_id, "container_name": container_name}
+        self.status = "running"
+        self.attrs = {"State": {"Status": "running"}}
+
+class fake_containers:
+    def __init__(self, client):
+        self.client = client
+        self.items = []
+
+    ## Only label filters matter here; name filters match nothing (no claimed containers)
+    def list(self, all=False, filters=None):
+        labels = (filters or {}).get("label")
+        if labels is None:
+            return []
+        labels = [labels] if isinstance(labels, str) else labels
+        wanted = [label.partition("=") for label in labels]
+        return [
+            c for c in self.items
+            if not [key for key, sep, value in wanted if key not in c.labels or (sep and c.labels[key] != value)]
+        ]
+
+class fake_api:
+    base_url = "fake://"
+
+class fake_client:
+    def __init__(self):
+        self.api = fake_api()
+        self.containers = fake_containers(self)
+
+def old_lookup(client, user_id, container_name):
+    containers = client.containers.list(
+        all=True,
+        filters={"label": [f"user_id={user_id}", f"container_name={container_name}"]}
+    )
+    return containers[0] if containers else None
+
+def timed(lookup, keys):
+    started = time.perf_counter()
+    found = sum(1 for key in keys if lookup(*key) is not None)
+    return (time.perf_counter() - started) / len(keys), found
+
+def fake_daemon(users, per_user):
+    client = fake_client()
+    owners = [(f"user{u}", f"box{c}") for u in range(users) for c in range(per_user)]
+    for i, (user_id, container_name) in enumerate(owners):
+        client.containers.items.append(fake_container(client, f"{i:064x}", user_id, container_name))
+    return client
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark container lookups: index vs containers.list.")
+    parser.add_argument("--docker", action="store_true", help="use the real Docker daemon")
+    parser.add_argument("--users", type=int, default=200, help="fake daemon only")
+    parser.add_argument("--per-user", type=int, default=5, help="fake daemon only")
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+
+    if args.docker:
+        import docker
+        client = docker.from_env()
+    else:
+        client = fake_daemon(args.users, args.per_user)
+
+    index = container_index(client)
+    index.load(client)
+    owners = list(index.by_name)
+    if not owners:
+        print("No user containers on this daemon to look up.")
+        return
+    keys = [random.choice(owners) for _ in range(args.lookups)]
+    ## The old path makes an API call per lookup; a tenth of the lookups is plenty to time it
+    old_keys = keys[:max(1, args.lookups // 10)]
+
+    old_avg, old_found = timed(lambda u, c: old_lookup(client, u, c), old_keys)
+    new_avg, new_found = timed(index.get, keys)
+    source = client.api.base_url if args.docker else "in-memory fake daemon, no API round trip"
+    print(f"{len(owners)} containers ({source})")
+    print(f"containers.list: {old_avg * 1e6:10.1f} us/lookup ({old_found}/{len(old_keys)} found)")
+    print(f"index.get:       {new_avg * 1e6:10.1f} us/lookup ({new_found}/{len(keys)} found)")
+    if args.docker:
+        print(f"speedup:         {old_avg / new_avg:10.0f}x")
+
+if __name__ == "__main__":
+    main()
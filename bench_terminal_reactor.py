@@ -0,0 +1,63 @@
+## Registers N idle terminal sockets (socketpairs standing in for exec sockets) with a
+## reactor_pool and reports thread count, RSS and CPU time spent while they sit idle,
+## for growing N. With the reactor, threads stay at the pool size and idle CPU stays
+## near zero however many tabs are open; RSS grows only by the per-socket buffers.
+##
+##   python bench_terminal_reactor.py [--tabs 10 100 1000] [--reactors 1] [--idle 2]
+import argparse
+import os
+import resource
+import socket
+import threading
+import time
+from terminal_reactor import reactor_pool
+
+class idle_handler:
+    def __init__(self, sock):
+        self.sock = sock
+
+    def on_readable(self):
+        return bool(self.sock.recv(65536))
+
+    def on_closed(self):
+        pass
+
+def rss_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def main():
+    parser = argparse.ArgumentParser(description="Idle cost of terminal sessions on the reactor.")
+    parser.add_argument("--tabs", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--reactors", type=int, default=1)
+    parser.add_argument("--idle", type=float, default=2, help="seconds to sit idle at each step")
+    args = parser.parse_args()
+
+    ## Two fds per tab
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    pool = reactor_pool(args.reactors)
+    pairs = []
+    print(f"{'tabs':>6} {'threads':>8} {'rss MiB':>8} {'idle cpu ms':>12}")
+    for tabs in sorted(args.tabs):
+        while len(pairs) < tabs:
+            ours, theirs = socket.socketpair()
+            pool.register(ours, idle_handler(ours))
+            pairs.append((ours, theirs))
+        ## Every session gets one write so each socket has been read at least once
+        for _, theirs in pairs:
+            theirs.send(b"$ ")
+        time.sleep(0.2)
+
+        cpu_before = time.process_time()
+        time.sleep(args.idle)
+        idle_cpu = time.process_time() - cpu_before
+        print(f"{tabs:>6} {threading.active_count():>8} {rss_bytes() / 2**20:>8.1f} {idle_cpu * 1000:>12.1f}")
+
+    for ours, theirs in pairs:
+        ours.close()
+        theirs.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+import re
+import threading
+import time
+import docker
+
+## Docker events that change which containers exist or what state they are in
+TRACKED_EVENTS = ["create", "start", "stop", "die", "destroy", "pause", "unpause", "rename", "update"]
+
+## Labels can't be changed once a container exists, so a warm pool container that gets
+## claimed by a user is renamed to claimed.<user_id>.<container_name> instead. Neither
+## part can contain a '.', so the name splits back unambiguously.
+CLAIMED_PREFIX = "claimed."
+
+def claimed_name(user_id: str, container_name: str):
+    return f"{CLAIMED_PREFIX}{user_id}.{container_name}"
+
+def owner_from(labels, name):
+    labels = labels or {}
+    user_id = labels.get("user_id")
+    container_name = labels.get("container_name")
+    if user_id and container_name:
+        return user_id, container_name
+    name = (name or "").lstrip("/")
+    if name.startswith(CLAIMED_PREFIX):
+        user_id, _, container_name = name[len(CLAIMED_PREFIX):].partition(".")
+        if user_id and container_name:
+            return user_id, container_name
+    return None
+
+## Every container owned by a user, across all Docker daemons (one event stream per daemon)
+class container_index:
+    def __init__(self, clients):
+        self.clients = clients if isinstance(clients, list) else [clients]
+        self.lock = threading.Lock()
+        self.by_id = {}       # container id -> container object
+        self.by_name = {}     # (user_id, container_name) -> container id
+        self.by_user = {}     # user_id -> set of container names
+        self.hits = 0
+        self.misses = 0
+        self.events_seen = 0
+        self.loaded = threading.Event()
+        self.loaded_clients = set()
+        self.threads = []
+        self.listeners = []
+
+    ## listener(owner, container) is called after every event that changes an indexed
+    ## container; container is None once it has been destroyed
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def notify(self, owner, container):
+        for listener in self.listeners:
+            try:
+                listener(owner, container)
+            except Exception as e:
+                print(f"Container index listener error: {e}")
+
+    def owner_of(self, container):
+        return owner_from(container.labels, container.name)
+
+    def start(self):
+        if self.threads:
+            return
+        for client in self.clients:
+            thread = threading.Thread(target=self.follow_events, args=(client,), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        self.loaded.wait(timeout=30)
+
+    def load(self, client):
+        containers = client.containers.list(all=True, filters={"label": "user_id"})
+        containers += client.containers.list(all=True, filters={"name": f"^/{re.escape(CLAIMED_PREFIX)}"})
+        with self.lock:
+            for container_id, container in list(self.by_id.items()):
+                if container.client is client:
+                    self._remove_locked(container_id)
+            for container in containers:
+                self._add_locked(container)
+        print(f"Container index loaded {len(containers)} containers from {client.api.base_url}")
+
+    ## Lookups fall back to asking the daemons until every one of them has loaded once
+    def mark_loaded(self, client):
+        self.loaded_clients.add(id(client))
+        if len(self.loaded_clients) >= len(self.clients):
+            self.loaded.set()
+
+    ## Load everything once, then keep the index current from the events stream.
+    ## If the stream breaks we reload from scratch, so missed events can't leave it stale.
+    def follow_events(self, client):
+        while True:
+            try:
+                since = int(time.time())
+                self.load(client)
+                self.mark_loaded(client)
+                events = client.events(
+                    since=since,
+                    decode=True,
+                    filters={"type": "container", "event": TRACKED_EVENTS}
+                )
+                for event in events:
+                    self.handle_event(event, client)
+            except Exception as e:
+                print(f"Container index event stream error: {e}")
+            time.sleep(1)
+
+    def handle_event(self, event, client):
+        action = event.get("Action") or event.get("status")
+        container_id = event.get("id") or event.get("Actor", {}).get("ID")
+        if not container_id:
+            return
+        self.events_seen += 1
+
+        if action == "destroy":
+            self.remove_and_notify(container_id)
+            return
+
+        attributes = event.get("Actor", {}).get("Attributes", {})
+        if not owner_from(attributes, attributes.get("name")) and container_id not in self.by_id:
+            return
+
+        try:
+            container = client.containers.get(container_id)
+        except docker.errors.NotFound:
+            self.remove_and_notify(container_id)
+            return
+        self.add(container)
+        owner = self.owner_of(container)
+        if owner:
+            self.notify(owner, container)
+
+    def remove_and_notify(self, container_id):
+        with self.lock:
+            container = self.by_id.get(container_id)
+            self._remove_locked(container_id)
+        owner = self.owner_of(container) if container else None
+        if owner:
+            self.notify(owner, None)
+
+    def _add_locked(self, container):
+        owner = self.owner_of(container)
+        if not owner:
+            return
+        self._remove_locked(container.id)
+        user_id, container_name = owner
+        self.by_id[container.id] = container
+        self.by_name[owner] = container.id
+        self.by_user.setdefault(user_id, set()).add(container_name)
+
+    def _remove_locked(self, container_id):
+        container = self.by_id.pop(container_id, None)
+        if not container:
+            return
+        owner = self.owner_of(container)
+        if not owner:
+            return
+        user_id, container_name = owner
+        if self.by_name.get(owner) == container_id:
+            del self.by_name[owner]
+            names = self.by_user.get(user_id)
+            if names:
+                names.discard(container_name)
+                if not names:
+                    del self.by_user[user_id]
+
+    def add(self, container):
+        with self.lock:
+            self._add_locked(container)
+
+    def remove(self, container_id):
+        with self.lock:
+            self._remove_locked(container_id)
+
+    def get(self, user_id: str, container_name: str):
+        with self.lock:
+            container_id = self.by_name.get((user_id, container_name))
+            container = self.by_id.get(container_id) if container_id else None
+            if container:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return container
+
+    def containers_for_user(self, user_id: str):
+        with self.lock:
+            names = self.by_user.get(user_id, ())
+            return [self.by_id[self.by_name[(user_id, name)]] for name in names]
+
+    def containers(self):
+        with self.lock:
+            return list(self.by_id.values())
+
+    def stats(self):
+        with self.lock:
+            return {
+                "containers": len(self.by_id),
+                "users": len(self.by_user),
+                "hits": self.hits,
+                "misses": self.misses,
+                "events": self.events_seen,
+            }
@@ -0,0 +1,188 @@
+import array
+import concurrent.futures
+import json
+import os
+import threading
+import time
+
+STATS_WINDOW = int(os.getenv("STATS_WINDOW", "60"))
+SYNC_INTERVAL = float(os.getenv("STATS_SYNC_INTERVAL", "10"))
+SAMPLE_INTERVAL = float(os.getenv("STATS_SAMPLE_INTERVAL", "2"))
+SAMPLE_WORKERS = int(os.getenv("STATS_WORKERS", "4"))
+CPU_PERCENTILE = float(os.getenv("STATS_CPU_PERCENTILE", "0.9"))
+## Append every sample as a JSON line here, for replay_trace.py
+TRACE_PATH = os.getenv("STATS_TRACE_FILE", "")
+
+## Fixed-size ring of (time, CPUs in use, memory bytes) samples for one container,
+## kept in flat arrays rather than a list of objects
+class usage_window:
+    def __init__(self, size=STATS_WINDOW):
+        self.size = size
+        self.times = array.array("d", [0.0] * size)
+        self.cpu = array.array("d", [0.0] * size)
+        self.memory = array.array("d", [0.0] * size)
+        self.count = 0
+        self.next = 0
+
+    def add(self, at, cpu, memory):
+        self.times[self.next] = at
+        self.cpu[self.next] = cpu
+        self.memory[self.next] = memory
+        self.next = (self.next + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def cpu_demand(self, percentile=CPU_PERCENTILE):
+        samples = sorted(self.cpu[:self.count])
+        return samples[min(len(samples) - 1, int(percentile * len(samples)))] if samples else 0.0
+
+    def memory_peak(self):
+        return max(self.memory[:self.count]) if self.count else 0.0
+
+    def latest(self):
+        last = (self.next - 1) % self.size
+        return {"cpu": self.cpu[last], "memory": self.memory[last]}
+
+    def summary(self):
+        return {"cpu": self.cpu_demand(), "memory": self.memory_peak()}
+
+## CPUs in use and memory in use (without reclaimable page cache) from one stats payload.
+## A one-shot payload has no precpu_stats, so the previous poll's cpu_stats go in precpu.
+def parse_stats(stats, precpu=None):
+    cpu_stats = stats.get("cpu_stats", {})
+    precpu = precpu if precpu is not None else stats.get("precpu_stats", {})
+    cpu_delta = cpu_stats.get("cpu_usage", {}).get("total_usage", 0) - precpu.get("cpu_usage", {}).get("total_usage", 0)
+    system_delta = cpu_stats.get("system_cpu_usage", 0) - precpu.get("system_cpu_usage", 0)
+    online = cpu_stats.get("online_cpus") or len(cpu_stats.get("cpu_usage", {}).get("percpu_usage") or []) or 1
+    if system_delta <= 0 or cpu_delta < 0:
+        return None
+    memory_stats = stats.get("memory_stats", {})
+    details = memory_stats.get("stats", {})
+    memory = memory_stats.get("usage", 0) - details.get("inactive_file", details.get("cache", 0))
+    return cpu_delta / system_delta * online, max(0, memory)
+
+## Polls one-shot Docker stats for every running container in the index, every
+## SAMPLE_INTERVAL seconds, on at most SAMPLE_WORKERS threads however many containers
+## there are, and keeps a usage_window for each. Every SYNC_INTERVAL it calls
+## on_tick(user_ids) with the users that have live samples, so their limits can be
+## revisited. Each server process runs its own sampler (the dashboards and idle monitor
+## read it), so under launcher.py the daemon sees WORKERS polls per container per interval;
+## no connection is held open between polls.
+class stats_sampler:
+    def __init__(self, index, on_tick=None, window=STATS_WINDOW, trace_path=TRACE_PATH,
+                 interval=SAMPLE_INTERVAL, workers=SAMPLE_WORKERS):
+        self.index = index
+        self.on_tick = on_tick
+        self.window = window
+        self.interval = interval
+        self.trace = open(trace_path, "a", buffering=1) if trace_path else None
+        self.pool = concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix="stats")
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.windows = {}     # container id -> usage_window
+        self.previous = {}    # container id -> cpu_stats from the last poll
+        self.polling = set()  # container ids with a poll queued or running
+        self.samples = 0
+        self.skipped = 0
+        self.thread = None
+
+    def start(self):
+        if self.thread:
+            return
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        next_tick = time.monotonic() + SYNC_INTERVAL
+        while True:
+            try:
+                users = self.sync()
+                if self.on_tick and users and time.monotonic() >= next_tick:
+                    next_tick = time.monotonic() + SYNC_INTERVAL
+                    self.on_tick(users)
+            except Exception as e:
+                print(f"Stats sampler error: {e}")
+            time.sleep(self.interval)
+
+    ## Queue a poll of every running container, and forget containers that stopped
+    def sync(self):
+        users = set()
+        running = {}
+        for container in self.index.containers():
+            if container.attrs.get("State", {}).get("Status", container.status) == "running":
+                running[container.id] = container
+        with self.lock:
+            for container_id in list(self.windows):
+                if container_id not in running:
+                    del self.windows[container_id]
+                    self.previous.pop(container_id, None)
+            due = []
+            for container_id, container in running.items():
+                owner = self.index.owner_of(container)
+                if container_id in self.windows and self.windows[container_id].count:
+                    users.add(owner[0])
+                ## A poll still outstanding from the last round means the pool is behind
+                if container_id in self.polling:
+                    self.skipped += 1
+                    continue
+                self.polling.add(container_id)
+                self.windows.setdefault(container_id, usage_window(self.window))
+                due.append((container, owner))
+        for container, owner in due:
+            self.pool.submit(self.poll, container, owner)
+        return users
+
+    def poll(self, container, owner):
+        try:
+            stats = container.stats(stream=False, one_shot=True)
+            with self.lock:
+                previous = self.previous.get(container.id)
+                self.previous[container.id] = stats.get("cpu_stats", {})
+            ## The first poll only gives the baseline for the CPU delta
+            sample = parse_stats(stats, previous) if previous is not None else None
+            if sample is None:
+                return
+            now = time.time()
+            with self.lock:
+                window = self.windows.get(container.id)
+                if window is None:
+                    return
+                window.add(now, *sample)
+                self.samples += 1
+                if self.trace:
+                    self.trace.write(json.dumps({
+                        "t": round(now, 3), "user": owner[0], "container": container.id[:12],
+                        "cpu": round(sample[0], 4), "memory": int(sample[1]),
+                    }) + "\n")
+        except Exception as e:
+            print(f"Stats poll for {container.name} failed: {e}")
+        finally:
+            with self.lock:
+                self.polling.discard(container.id)
+
+    ## {container_id: {"cpu", "memory"}} for the given containers that have samples
+    def usage(self, container_ids):
+        with self.lock:
+            return {
+                container_id: self.windows[container_id].summary()
+                for container_id in container_ids
+                if container_id in self.windows and self.windows[container_id].count
+            }
+
+    ## {container_id: {"cpu", "memory"}} from the most recent sample of each
+    def latest(self, container_ids):
+        with self.lock:
+            return {
+                container_id: self.windows[container_id].latest()
+                for container_id in container_ids
+                if container_id in self.windows and self.windows[container_id].count
+            }
+
+    def stats(self):
+        with self.lock:
+            return {
+                "containers": len(self.windows),
+                "polling": len(self.polling),
+                "workers": self.workers,
+                "samples": self.samples,
+                "skipped": self.skipped,
+            }
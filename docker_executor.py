@@ -0,0 +1,133 @@
+import collections
+import concurrent.futures
+import heapq
+import itertools
+import os
+import threading
+import time
+
+SLOW_WORKERS = int(os.getenv("DOCKER_SLOW_WORKERS", "4"))
+FAST_WORKERS = int(os.getenv("DOCKER_FAST_WORKERS", "16"))
+## Seconds before an operation is reported as timed out, per operation name
+OPERATION_TIMEOUTS = {
+    "create": float(os.getenv("DOCKER_CREATE_TIMEOUT", "300")),
+    "start": float(os.getenv("DOCKER_START_TIMEOUT", "60")),
+    "stop": float(os.getenv("DOCKER_STOP_TIMEOUT", "60")),
+    "delete": float(os.getenv("DOCKER_DELETE_TIMEOUT", "60")),
+}
+FAST_TIMEOUT = float(os.getenv("DOCKER_FAST_TIMEOUT", "30"))
+
+class operation_timeout(Exception):
+    pass
+
+## Runs blocking Docker SDK calls on two bounded thread pools: "slow" for container
+## lifecycle (create, start, stop, delete) and "fast" for execs and archive transfers,
+## so a stop waiting out its grace period never holds up someone's file read.
+## A thread can't be cancelled, so a timeout only stops anyone waiting on the
+## operation; the call itself finishes (or fails) in the background.
+class docker_executor:
+    def __init__(self, slow_workers=SLOW_WORKERS, fast_workers=FAST_WORKERS):
+        self.pools = {
+            "slow": concurrent.futures.ThreadPoolExecutor(slow_workers, thread_name_prefix="docker-slow"),
+            "fast": concurrent.futures.ThreadPoolExecutor(fast_workers, thread_name_prefix="docker-fast"),
+        }
+        self.lock = threading.Lock()
+        self.cond = threading.Condition(self.lock)
+        self.deadlines = []   # heap of (deadline, seq, job)
+        self.seq = itertools.count()
+        self.queued = collections.Counter()
+        self.running = collections.Counter()
+        self.completed = collections.Counter()
+        self.failed = collections.Counter()
+        self.timeouts = collections.Counter()
+        self.total_time = collections.Counter()
+        threading.Thread(target=self.watchdog, daemon=True).start()
+
+    def timeout_for(self, queue, op):
+        return OPERATION_TIMEOUTS.get(op, FAST_TIMEOUT if queue == "fast" else max(OPERATION_TIMEOUTS.values()))
+
+    ## Queue fn(*args) and call callback(result, error) exactly once: with its result,
+    ## with the exception it raised, or with operation_timeout once the deadline passes
+    def submit(self, queue, op, fn, *args, callback=None, timeout=None):
+        job = {"op": op, "queue": queue, "callback": callback, "done": False, "submitted": time.monotonic()}
+        deadline = job["submitted"] + (timeout or self.timeout_for(queue, op))
+        with self.cond:
+            self.queued[queue] += 1
+            heapq.heappush(self.deadlines, (deadline, next(self.seq), job))
+            self.cond.notify()
+        return self.pools[queue].submit(self.execute, job, fn, args)
+
+    def execute(self, job, fn, args):
+        queue = job["queue"]
+        with self.lock:
+            self.queued[queue] -= 1
+            self.running[queue] += 1
+        result, error = None, None
+        try:
+            result = fn(*args)
+        except Exception as e:
+            error = e
+        with self.lock:
+            self.running[queue] -= 1
+            self.total_time[job["op"]] += time.monotonic() - job["submitted"]
+            if error is None:
+                self.completed[job["op"]] += 1
+            else:
+                self.failed[job["op"]] += 1
+        self.finish(job, result, error)
+        if error is not None:
+            raise error
+        return result
+
+    def finish(self, job, result, error):
+        with self.lock:
+            if job["done"]:
+                return
+            job["done"] = True
+        if job["callback"]:
+            try:
+                job["callback"](result, error)
+            except Exception as e:
+                print(f"Docker executor callback error for {job['op']}: {e}")
+
+    ## Run fn(*args) on a pool and wait for it, raising operation_timeout if it takes too long
+    def run(self, queue, op, fn, *args, timeout=None):
+        timeout = timeout or self.timeout_for(queue, op)
+        future = self.submit(queue, op, fn, *args, timeout=timeout)
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            raise operation_timeout(f"Docker operation '{op}' timed out after {timeout:.0f}s")
+
+    def watchdog(self):
+        while True:
+            expired = []
+            with self.cond:
+                now = time.monotonic()
+                while self.deadlines and (self.deadlines[0][0] <= now or self.deadlines[0][2]["done"]):
+                    _, _, job = heapq.heappop(self.deadlines)
+                    if not job["done"]:
+                        expired.append(job)
+                if not expired:
+                    self.cond.wait(self.deadlines[0][0] - now if self.deadlines else None)
+                    continue
+                for job in expired:
+                    self.timeouts[job["op"]] += 1
+            for job in expired:
+                print(f"Docker operation '{job['op']}' timed out")
+                self.finish(job, None, operation_timeout(f"Docker operation '{job['op']}' timed out"))
+
+    def stats(self):
+        with self.lock:
+            ops = set(self.completed) | set(self.failed)
+            return {
+                "queued": dict(self.queued),
+                "running": dict(self.running),
+                "completed": dict(self.completed),
+                "failed": dict(self.failed),
+                "timeouts": dict(self.timeouts),
+                "avg_ms": {
+                    op: round(1000 * self.total_time[op] / (self.completed[op] + self.failed[op]), 1)
+                    for op in ops
+                },
+            }
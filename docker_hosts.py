@@ -0,0 +1,162 @@
+import os
+import threading
+import time
+import docker
+from metrics import instrument_docker_api
+
+## e.g. DOCKER_HOSTS="local=unix:///var/run/docker.sock,box2=tcp://10.0.0.2:2375"
+## Empty means just the daemon from the environment (DOCKER_HOST or the local socket).
+DOCKER_HOSTS = os.getenv("DOCKER_HOSTS", "")
+## least_loaded - spread containers out; binpack - fill the busiest host that still has room
+PLACEMENT_POLICY = os.getenv("PLACEMENT_POLICY", "least_loaded")
+CONTAINERS_PER_CPU = float(os.getenv("PLACEMENT_CONTAINERS_PER_CPU", "4"))
+BINPACK_MAX_LOAD = float(os.getenv("PLACEMENT_BINPACK_MAX_LOAD", "0.9"))
+REFRESH_INTERVAL = float(os.getenv("DOCKER_HOSTS_REFRESH", "30"))
+## How long a placement counts against its host before the index must have caught up
+PENDING_TIMEOUT = float(os.getenv("PLACEMENT_PENDING_TIMEOUT", "60"))
+
+def parse_hosts(spec: str):
+    hosts = []
+    for index, item in enumerate(spec.split(",")):
+        item = item.strip()
+        if not item:
+            continue
+        name, sep, url = item.partition("=")
+        hosts.append((name.strip(), url.strip()) if sep else (f"host{index}", item))
+    return hosts
+
+## One Docker daemon and what it reported about itself
+class docker_endpoint:
+    def __init__(self, name, base_url=None):
+        self.name = name
+        self.base_url = base_url or os.getenv("DOCKER_HOST", "unix:///var/run/docker.sock")
+        self.client = docker.DockerClient(base_url=base_url) if base_url else docker.from_env()
+        self.api = self.client.api
+        instrument_docker_api(self.api)
+        self.capacity = {"cpus": 1, "memory": 0}
+        self.healthy = True
+
+    def refresh(self):
+        try:
+            info = self.client.info()
+            self.capacity = {"cpus": info.get("NCPU") or 1, "memory": info.get("MemTotal") or 0}
+            self.healthy = True
+        except Exception as e:
+            if self.healthy:
+                print(f"Docker host {self.name} unreachable: {e}")
+            self.healthy = False
+
+## The set of daemons containers can live on. Every container object keeps the client
+## of the daemon it came from (container.client), so once a container is found, execs,
+## archives and lifecycle calls on it already go to the right host; this class only
+## decides where new containers go and maps containers back to their endpoint.
+## endpoints, if given, replaces the ones parsed from spec (anything with name, client,
+## capacity, healthy and refresh()).
+class docker_endpoints:
+    def __init__(self, spec=DOCKER_HOSTS, policy=PLACEMENT_POLICY, endpoints=None):
+        if endpoints is None:
+            endpoints = [docker_endpoint(name, url) for name, url in parse_hosts(spec)] or [docker_endpoint("local")]
+        self.endpoints = endpoints
+        self.by_name = {endpoint.name: endpoint for endpoint in self.endpoints}
+        self.policy = policy
+        self.placements = {endpoint.name: 0 for endpoint in self.endpoints}
+        ## Placements the index hasn't seen running yet; without these a burst of creates
+        ## would all land on the same host before the Docker events arrive
+        self.lock = threading.Lock()
+        self.choose_lock = threading.Lock()
+        self.pending = []     # {"host", "id", "until"}
+        for endpoint in self.endpoints:
+            endpoint.refresh()
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def __iter__(self):
+        return iter(self.endpoints)
+
+    @property
+    def primary(self):
+        return self.endpoints[0]
+
+    def of(self, container):
+        for endpoint in self.endpoints:
+            if container.client is endpoint.client:
+                return endpoint
+        return None
+
+    def run(self):
+        while True:
+            time.sleep(REFRESH_INTERVAL)
+            for endpoint in self.endpoints:
+                endpoint.refresh()
+
+    ## Running containers and memory reserved by their limits, per endpoint, from the index,
+    ## plus placements still on their way into it
+    def usage(self, index):
+        usage = {endpoint.name: {"running": 0, "memory": 0} for endpoint in self.endpoints}
+        running = set()
+        for container in index.containers():
+            endpoint = self.of(container)
+            if not endpoint or container.attrs.get("State", {}).get("Status", container.status) != "running":
+                continue
+            running.add(container.id)
+            usage[endpoint.name]["running"] += 1
+            usage[endpoint.name]["memory"] += container.attrs.get("HostConfig", {}).get("Memory") or 0
+        now = time.monotonic()
+        with self.lock:
+            self.pending = [p for p in self.pending if p["until"] > now and p["id"] not in running]
+            for placement in self.pending:
+                usage[placement["host"]]["running"] += 1
+        return usage
+
+    ## 0 is empty, 1 is full by whichever of CPU or memory is tighter
+    def load(self, endpoint, usage):
+        seen = usage[endpoint.name]
+        cpu_load = seen["running"] / (endpoint.capacity["cpus"] * CONTAINERS_PER_CPU)
+        memory_load = seen["memory"] / endpoint.capacity["memory"] if endpoint.capacity["memory"] else 0
+        return max(cpu_load, memory_load)
+
+    ## Returns the endpoint and a placement to pass to placed() once the container exists
+    ## (or with None if creating it failed). Choices are serialised, so concurrent creates
+    ## each see the ones before them.
+    def choose(self, index):
+        if len(self.endpoints) == 1:
+            return self.primary, None
+        with self.choose_lock:
+            usage = self.usage(index)
+            candidates = [endpoint for endpoint in self.endpoints if endpoint.healthy] or self.endpoints
+            chosen = None
+            if self.policy == "binpack":
+                fitting = [e for e in candidates if self.load(e, usage) < BINPACK_MAX_LOAD]
+                if fitting:
+                    chosen = max(fitting, key=lambda e: self.load(e, usage))
+            if chosen is None:
+                chosen = min(candidates, key=lambda e: self.load(e, usage))
+            placement = {"host": chosen.name, "id": None, "until": time.monotonic() + PENDING_TIMEOUT}
+            with self.lock:
+                self.placements[chosen.name] += 1
+                self.pending.append(placement)
+        return chosen, placement
+
+    ## The placement keeps counting until the index reports this container running
+    def placed(self, placement, container):
+        if placement is None:
+            return
+        with self.lock:
+            if container is None:
+                if placement in self.pending:
+                    self.pending.remove(placement)
+            else:
+                placement["id"] = container.id
+
+    def stats(self, index):
+        usage = self.usage(index)
+        return {
+            endpoint.name: dict(
+                usage[endpoint.name],
+                healthy=endpoint.healthy,
+                cpus=endpoint.capacity["cpus"],
+                memory_total=endpoint.capacity["memory"],
+                load=round(self.load(endpoint, usage), 3),
+                placements=self.placements[endpoint.name],
+            )
+            for endpoint in self.endpoints
+        }
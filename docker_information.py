@@ -1,17 +1,115 @@
 import docker
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
 import bleach
 import re
+import shlex
 import io
 import os
 import tarfile
 import magic
-
+import time
+import threading
+from container_index import container_index, claimed_name, owner_from
+from warm_pool import warm_pool
+from template_images import template_image_cache
+from file_cache import file_cache
+from docker_executor import docker_executor
+from docker_hosts import docker_endpoints
+from rebalancer import container_rebalancer
+from container_stats import stats_sampler
+import metrics
+from idle_monitor import idle_monitor
+
+STREAM_CHUNK_SIZE = 64 * 1024
+## Per user, summed over the home directories of all their containers
+UPLOAD_QUOTA_BYTES = int(os.getenv("USER_UPLOAD_QUOTA_BYTES", str(1024 * 1024 * 1024)))
+TREE_DEPTH = int(os.getenv("FILE_TREE_DEPTH", "4"))
+TREE_LIMIT = int(os.getenv("FILE_TREE_LIMIT", "10000"))
+## find -printf %y letters and stat -c %F names
+FILE_TYPES = {
+    "f": "file", "regular file": "file", "regular empty file": "file",
+    "d": "dir", "directory": "dir",
+    "l": "link", "symbolic link": "link",
+}
+## Go's os.ModeDir bit, as reported in the archive stat header
+MODE_DIR = 1 << 31
+## Only one process per deployment should fill the warm pool and hibernate idle containers.
+## The others still create containers (they just never have pooled ones to claim) and
+## still wake containers they are touched for.
+BACKGROUND_WORKER = os.getenv("BACKGROUND_WORKER", "1") == "1"
+
+## File-like wrapper around the get_archive chunk generator, so tarfile can
+## read it in streaming mode without the whole archive ever being in memory
+class archive_reader(io.RawIOBase):
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.buffer:
+            try:
+                self.buffer = memoryview(next(self.chunks))
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self.buffer))
+        b[:n] = self.buffer[:n]
+        self.buffer = self.buffer[n:]
+        return n
+
+## Every method call is timed for /metrics (see metrics.py)
+@metrics.timed_methods(metrics.manager_seconds)
 class docker_manager:
-    def __init__(self):
-        self.client = docker.from_env()
-        self.api_client = docker.APIClient(base_url='unix://var/run/docker.sock')
+    def __init__(self, background=BACKGROUND_WORKER):
+        ## New containers are placed on one of these daemons; everything else follows
+        ## the container to whichever daemon it lives on
+        self.endpoints = docker_endpoints()
+        self.client = self.endpoints.primary.client
+        self.api_client = self.endpoints.primary.api
+        self.index = container_index([endpoint.client for endpoint in self.endpoints])
+        self.executor = docker_executor()
+        self.rebalancer = container_rebalancer(self)
+        self.stats_sampler = stats_sampler(self.index, on_tick=self.rebalancer.schedule_users)
+        self.rebalancer.sampler = self.stats_sampler
+        self.idle = idle_monitor(self)
+        self.file_cache = file_cache()
+        self.workspace_sizes = {}     # container id -> bytes in the user's home, last measured
+        self.image_info = {}
+        self.image_lock = threading.Lock()
+        ## Images live on each daemon, so each one gets its own template image cache
+        self.template_images = {
+            endpoint.name: template_image_cache(
+                endpoint.client,
+                provision=lambda *args, endpoint=endpoint, **kwargs:
+                    self.provision_container(*args, cached=False, endpoint=endpoint, **kwargs)
+            )
+            for endpoint in self.endpoints
+        }
+        for cache in self.template_images.values():
+            cache.start()
+        self.pool = warm_pool(self)
+        if background:
+            self.pool.start()
+        self.index.start()
+        self.stats_sampler.start()
+        ## Hibernation runs in the background worker only; see idle_monitor.share
+        if background:
+            self.idle.start()
+
+        metrics.add_stats("index", self.index.stats)
+        metrics.add_stats("executor", self.executor.stats, label="op")
+        metrics.add_stats("warm_pool", self.pool.stats, label="pool")
+        metrics.add_keyed_stats("template_images", lambda: {
+            name: cache.stats() for name, cache in self.template_images.items()
+        }, label="host")
+        metrics.add_stats("file_cache", self.file_cache.stats)
+        metrics.add_stats("rebalancer", self.rebalancer.stats)
+        metrics.add_stats("stats_sampler", self.stats_sampler.stats)
+        metrics.add_stats("idle", self.idle.stats)
+        metrics.add_keyed_stats("docker_host", lambda: self.endpoints.stats(self.index), label="host")
 
     def contains_invalid_chars(self, s):
         return bool(re.search(r'[^a-zA-Z0-9\-_]', s))
@@ -19,62 +117,78 @@ class docker_manager:
     def return_result(self, type_return, message):
         return {"result": type_return, "message": message}
 
-    def find_container_by_logical_name(self, user_id: str, container_name: str):
-        containers = self.client.containers.list(
-            all=True,
-            filters={"label": [f"user_id={user_id}", f"container_name={container_name}"]}
-        )
-        return containers[0] if containers else None
-
-    def ensure_user_in_container(self, container, user_id):
-        # Check if user exists inside container
-        exit_code, _ = container.exec_run(f"id -u {user_id}", user="root")
-        if exit_code != 0:
-            # User doesn't exist, so create it without sudo and with /bin/false shell
-            container.exec_run(f"useradd -U -m -s /bin/bash {user_id}", user="root")
-            print(f"Created user '{user_id}' in container {container.name}")
-        else:
-            print(f"User '{user_id}' already exists in container {container.name}")
-
-    def rebalance_user_container_memory(self, user_id: str, only_running=True):
-        containers = self.client.containers.list(
-            all=not only_running,
-            filters={"label": f"user_id={user_id}"}
-        )
-        if not containers:
-            return
-
-        per_container_limit = int(1024 * 1024 * 1024 / len(containers))
-
-        for container in containers:
+    ## wake=False is for background work (e.g. the file watcher), which mustn't count as use
+    def find_container_by_logical_name(self, user_id: str, container_name: str, wake=True):
+        container = self.index.get(user_id, container_name)
+        if not container and not self.index.loaded.is_set():
+            ## Index hasn't loaded yet, ask the daemon directly
+            containers = self.list_user_containers(user_id, container_name=container_name)
+            container = containers[0] if containers else None
+        ## Anything that needs the container needs it awake
+        if container and wake:
+            self.idle.wake(container)
+        return container
+
+    ## A user's containers straight from the daemon: the ones created with owner labels,
+    ## plus warm pool containers they claimed (which carry the owner in their name instead)
+    def list_user_containers(self, user_id: str, all=True, container_name: str = None):
+        labels = [f"user_id={user_id}"]
+        if container_name:
+            labels.append(f"container_name={container_name}")
+        claimed = f"^/{re.escape(claimed_name(user_id, container_name or ''))}"
+        if container_name:
+            claimed += "$"
+        containers = []
+        for endpoint in self.endpoints:
             try:
-                container.update(mem_limit=per_container_limit)
-                print(f"Updated {container.name} to {per_container_limit} bytes")
-            except docker.errors.APIError as e:
-                print(f"Could not update {container.name}: {e.explanation}")
+                containers += endpoint.client.containers.list(all=all, filters={"label": labels})
+                containers += endpoint.client.containers.list(all=all, filters={"name": claimed})
+            except Exception as e:
+                print(f"Could not list containers on {endpoint.name}: {e}")
+        return containers
 
-    def rebalance_user_container_cpu(self, user_id: str, only_running=True):
-        containers = self.client.containers.list(
-            all=not only_running,
-            filters={"label": f"user_id={user_id}"}
+    def ensure_user_in_container(self, container, user_id):
+        # Create the user (without sudo) unless it already exists, in a single exec
+        _, output = container.exec_run(
+            ["sh", "-c", f"id -u {user_id} >/dev/null 2>&1 && echo exists || useradd -U -m -s /bin/bash {user_id}"],
+            user="root"
         )
-        if not containers:
-            return
-
-        num = len(containers)
-        cpu_period = 100000  # Standard CFS period
-        cpu_quota = int(cpu_period / num)  # Fair share of 1 CPU
+        if b"exists" in output:
+            print(f"User '{user_id}' already exists in container {container.name}")
+        else:
+            print(f"Created user '{user_id}' in container {container.name}")
 
-        for container in containers:
-            try:
-                container.update(cpu_period=cpu_period, cpu_quota=cpu_quota)
-                print(f"Updated CPU for {container.name} to {cpu_quota}/{cpu_period} (== {cpu_quota / cpu_period:.2f} CPUs)")
-            except docker.errors.APIError as e:
-                print(f"Failed to update CPU for {container.name}: {e.explanation}")
+    ## Start a container from os_image with the template mounted and run its startup script,
+    ## or start it from the cached template image, which already has the script applied.
+    ## Shared by create_container, the warm pool and the template image builds.
+    ## Without an endpoint, the placement policy picks the daemon.
+    def provision_container(self, os_image: str, template_type: str, name: str, labels: dict, cached=True, endpoint=None):
+        placement = None
+        if endpoint is None:
+            endpoint, placement = self.endpoints.choose(self.index)
+        container = None
+        try:
+            image = self.template_images[endpoint.name].image_for(os_image, template_type) if cached else None
+            container = endpoint.client.containers.run(
+                image=image or os_image,
+                name=name,
+                detach=True,
+                labels=labels,
+                tty=True,
 
-    def rebalace_all_containers(self, user_id: str, only_running=True):
-        self.rebalance_user_container_memory(user_id, only_running)
-        self.rebalance_user_container_cpu(user_id, only_running)
+                volumes = {
+                    ## TODO: Replace this with a reference to environment variables
+                    f'{os.getenv("DOCKER_TEMPLATES")}/{template_type}': {'bind': f'/mnt/{template_type}', 'mode': 'ro'},
+                    #f'/home/kram/projects/GlitchedRealms/docker_templates/java': {'bind': f'/mnt/java', 'mode': 'ro'},
+                }
+            )
+            if image is None:
+                container.exec_run(f"sh /mnt/{template_type}/startup.sh", privileged=True)
+                #container.exec_run(f"sh /mnt/java/startup.sh", privileged=True)
+        finally:
+            ## Counted against the host until the index sees it running (or dropped if it failed)
+            self.endpoints.placed(placement, container)
+        return container
 
     def create_container(self, os_image: str, user_id: str, container_name: str, template_type: str):
         try:
@@ -96,30 +210,23 @@ class docker_manager:
             if existing:
                 return self.return_result("error", f"Container with name '{container_name}' already exists for user {user_id}.")
 
-            unique_id = str(uuid.uuid4())
-            docker_name = f"user_{user_id}_{unique_id}"
-            container = self.client.containers.run(
-                image=os_image,
-                name=docker_name,
-                detach=True,
-                labels={
-                    "user_id": user_id,
-                    "container_name": container_name,
-                    "uid": unique_id
-                },
-                tty=True,
-
-                volumes = {
-                    ## TODO: Replace this with a reference to environment variables
-                    f'{os.getenv("DOCKER_TEMPLATES")}/{template_type}': {'bind': f'/mnt/{template_type}', 'mode': 'ro'},
-                    #f'/home/kram/projects/GlitchedRealms/docker_templates/java': {'bind': f'/mnt/java', 'mode': 'ro'},
-                }
-            )
-            container.exec_run(f"sh /mnt/{template_type}/startup.sh", privileged=True)
-            #container.exec_run(f"sh /mnt/java/startup.sh", privileged=True)
-
-            self.ensure_user_in_container(container, user_id)
-            self.rebalace_all_containers(user_id)
+            ## A pre-provisioned container from the warm pool skips straight to adding the user
+            container = self.pool.claim(os_image, template_type, user_id, container_name)
+            if container is None:
+                unique_id = str(uuid.uuid4())
+                container = self.provision_container(
+                    os_image,
+                    template_type,
+                    name=f"user_{user_id}_{unique_id}",
+                    labels={
+                        "user_id": user_id,
+                        "container_name": container_name,
+                        "uid": unique_id
+                    }
+                )
+                self.index.add(container)
+                self.ensure_user_in_container(container, user_id)
+            self.rebalancer.schedule(user_id)
 
             return self.return_result("success", f"Container '{container_name}' created for user {user_id}.")
         except docker.errors.ImageNotFound:
@@ -127,35 +234,86 @@ class docker_manager:
         except docker.errors.APIError as e:
             return self.return_result("error", f"Docker API error: {e.explanation}")
 
+    ## Tags and OS of an image, cached by image id (an id always names the same image)
+    def image_metadata(self, image_id: str, api):
+        with self.image_lock:
+            cached = self.image_info.get(image_id)
+        if cached:
+            return cached
+        try:
+            attrs = api.inspect_image(image_id)
+            info = {"tags": attrs.get("RepoTags") or [], "os": attrs.get("Os", "unknown")}
+        except docker.errors.NotFound:
+            info = {"tags": [], "os": "unknown"}
+        with self.image_lock:
+            self.image_info[image_id] = info
+        return info
+
+    ## Served from the low-level container listing (two calls per daemon: labelled and claimed
+    ## containers) plus the image cache, so the number of daemon requests doesn't grow with
+    ## the container count
     def get_containers_by_user(self, user_id: str):
         try:
-            containers = self.client.containers.list(all=True, filters={"label": f"user_id={user_id}"})
+            summaries = []
+            for endpoint in self.endpoints:
+                try:
+                    found = endpoint.api.containers(all=True, filters={"label": f"user_id={user_id}"})
+                    found += endpoint.api.containers(
+                        all=True, filters={"name": f"^/{re.escape(claimed_name(user_id, ''))}"}
+                    )
+                except docker.errors.APIError:
+                    raise
+                except Exception as e:
+                    print(f"Could not list containers on {endpoint.name}: {e}")
+                    continue
+                summaries += [(endpoint, summary) for summary in found]
             container_list = []
-            for c in containers:
-                c.reload()
-                info = c.attrs
-                state = info.get("State", {})
-                created = datetime.strptime(info["Created"][:19], "%Y-%m-%dT%H:%M:%S")
-                started_at = state.get("StartedAt")
-                last_started = (
-                    datetime.strptime(started_at[:19], "%Y-%m-%dT%H:%M:%S").isoformat()
-                    if started_at and started_at != "0001-01-01T00:00:00Z"
-                    else None
-                )
+            for endpoint, summary in summaries:
+                name = (summary.get("Names") or [""])[0]
+                owner = owner_from(summary.get("Labels"), name)
+                if not owner or owner[0] != user_id:
+                    continue
+                image = self.image_metadata(summary["ImageID"], endpoint.api)
+                status = summary.get("State", "unknown")
+                created = datetime.fromtimestamp(summary["Created"], timezone.utc).replace(tzinfo=None)
+                ## The listing has no start time; the index keeps full inspect data current from events
+                indexed = self.index.get(user_id, owner[1])
+                started_at = indexed.attrs.get("State", {}).get("StartedAt") if indexed else None
                 container_list.append({
-                    "id": c.id,
-                    "name": c.labels.get("container_name", "unknown"),
-                    "status": c.status,
-                    "image": c.image.tags[0] if c.image.tags else "unknown",
-                    "os": c.image.attrs.get("Os", "unknown"),
+                    "id": summary["Id"],
+                    "name": owner[1],
+                    "status": status,
+                    "image": image["tags"][0] if image["tags"] else "unknown",
+                    "os": image["os"],
                     "created": created.isoformat(),
-                    "last_started": last_started,
-                    "running": c.status == "running"
+                    "last_started": self.parse_started(started_at),
+                    "running": status == "running"
                 })
             return self.return_result("success", container_list)
         except docker.errors.APIError as e:
             return self.return_result("error", f"Docker API error: {e.explanation}")
 
+    def parse_started(self, started_at):
+        if not started_at or started_at == "0001-01-01T00:00:00Z":
+            return None
+        return datetime.strptime(started_at[:19], "%Y-%m-%dT%H:%M:%S").isoformat()
+
+    ## Same fields as a get_containers_by_user entry, from a container's (indexed) inspect data
+    def describe_container(self, container):
+        info = container.attrs
+        state = info.get("State", {})
+        image = self.image_metadata(info.get("Image", ""), container.client.api)
+        return {
+            "id": container.id,
+            "name": (owner_from(container.labels, container.name) or (None, "unknown"))[1],
+            "status": state.get("Status", container.status),
+            "image": image["tags"][0] if image["tags"] else "unknown",
+            "os": image["os"],
+            "created": datetime.strptime(info["Created"][:19], "%Y-%m-%dT%H:%M:%S").isoformat(),
+            "last_started": self.parse_started(state.get("StartedAt")),
+            "running": state.get("Status", container.status) == "running"
+        }
+
     def start_container_by_name(self, user_id: str, container_name: str):
         try:
             container = self.find_container_by_logical_name(user_id, container_name)
@@ -165,7 +323,7 @@ class docker_manager:
             container.reload()
             if container.status != "running":
                 container.start()
-                self.rebalace_all_containers(user_id)
+                self.rebalancer.schedule(user_id)
                 return self.return_result("success", f"Started container: {container_name}")
             else:
                 return self.return_result("success", f"Container {container_name} is already running.")
@@ -174,6 +332,7 @@ class docker_manager:
 
     def stop_container_by_name(self, user_id: str, container_name: str):
         try:
+            self.idle.forget(user_id, container_name)
             container = self.find_container_by_logical_name(user_id, container_name)
             if not container:
                 return self.return_result("error", f"No container named '{container_name}' found for user {user_id}.")
@@ -181,7 +340,7 @@ class docker_manager:
             container.reload()
             if container.status == "running":
                 container.stop()
-                self.rebalace_all_containers(user_id)
+                self.rebalancer.schedule(user_id)
                 return self.return_result("success", f"Stopped container: {container_name}")
             else:
                 return self.return_result("success", f"Container {container_name} is already stopped.")
@@ -190,42 +349,82 @@ class docker_manager:
 
     def delete_container_by_name(self, user_id: str, container_name: str):
         try:
+            self.idle.forget(user_id, container_name)
             container = self.find_container_by_logical_name(user_id, container_name)
             if not container:
                 return self.return_result("error", f"Container '{container_name}' not found.")
             container.remove(force=True)
-            self.rebalace_all_containers(user_id)
+            self.index.remove(container.id)
+            self.rebalancer.schedule(user_id)
             return self.return_result("success", f"Container '{container_name}' deleted.")
         except Exception as e:
             return self.return_result("error", str(e))
 
-    def list_files(self, user_id: str, container_name: str):
+    ## Everything under /home/<user_id>/<path> (down to `depth` levels, at most `limit` entries)
+    ## with type, size and mtime, from a single exec. GNU find can print all of it directly;
+    ## busybox find (alpine) has no -printf, so there we batch the paths through stat instead.
+    def list_tree(self, user_id: str, container_name: str, path: str = "", depth: int = TREE_DEPTH, limit: int = TREE_LIMIT, wake=True):
         if not user_id or not container_name:
-            return {"result": "error", "message": "Missing user or container info."}
+            return {"error": "Missing user or container info.", "entries": [], "container_name": container_name}
 
-        container = self.find_container_by_logical_name(user_id, container_name)
+        container = self.find_container_by_logical_name(user_id, container_name, wake=wake)
         if not container:
-            return {"result": "error", "message": f"Container '{container_name}' not found."}
+            return {"error": f"Container '{container_name}' not found.", "entries": [], "container_name": container_name}
+
+        path = path.strip("/")
+        home = f"/home/{user_id}"
+        root = f"{home}/{path}" if path else home
+        quoted_root = shlex.quote(root)
+        script = (
+            f"if find / -maxdepth 0 -printf '' >/dev/null 2>&1; then "
+            f"find {quoted_root} -mindepth 1 -maxdepth {int(depth)} -printf '%y|%s|%T@|%p\\n'; "
+            f"else find {quoted_root} -mindepth 1 -maxdepth {int(depth)} -exec stat -c '%F|%s|%Y|%n' {{}} +; "
+            f"fi 2>/dev/null | head -n {int(limit) + 1}"
+        )
 
         try:
-            # Run ls -p to mark directories with '/'
-            exec_result = container.exec_run(
-                cmd=f"ls -p /home/{user_id}",
-                user=user_id
-            )
-            output = exec_result.output.decode("utf-8")
-            files = [line for line in output.splitlines() if line.strip()]
-
-            return {
-                "files": files,
-                "container_name": container_name
-            }
+            exec_result = container.exec_run(cmd=["sh", "-c", script], user=user_id)
+            lines = exec_result.output.decode("utf-8", errors="replace").splitlines()
         except Exception as e:
-            return {
-                "files": [],
-                "error": str(e),
-                "container_name": container_name   
-            }
+            return {"error": str(e), "entries": [], "container_name": container_name}
+
+        entries = []
+        for line in lines[:limit]:
+            ## The path goes last, so a '|' inside a file name can't shift the other fields
+            parts = line.split("|", 3)
+            if len(parts) != 4 or not parts[3].startswith(root + "/"):
+                continue
+            kind, size, mtime, full_path = parts
+            entry_type = FILE_TYPES.get(kind, "other")
+            level = full_path[len(root) + 1:].count("/") + 1
+            try:
+                mtime = int(float(mtime))
+            except ValueError:
+                mtime = 0
+            entries.append({
+                "path": full_path[len(home) + 1:],
+                "type": entry_type,
+                "size": int(size) if size.isdigit() else 0,
+                "mtime": mtime,
+                ## Directories at the depth limit may have children we haven't listed yet
+                "unexplored": entry_type == "dir" and level >= depth
+            })
+
+        return {
+            "entries": entries,
+            "truncated": len(lines) > limit,
+            "path": path,
+            "container_name": container_name
+        }
+
+    ## Whole workspace listing. `files` keeps the old shape: paths, with a trailing '/' on directories.
+    def list_files(self, user_id: str, container_name: str, wake=True):
+        result = self.list_tree(user_id, container_name, wake=wake)
+        result["files"] = [
+            entry["path"] + "/" if entry["type"] == "dir" else entry["path"]
+            for entry in result["entries"]
+        ]
+        return result
 
     def read_file(self, user_id: str, container_name: str, file_path: str):
         if not user_id or not container_name or not file_path:
@@ -243,15 +442,30 @@ class docker_manager:
 
         try:
             full_path = f"/home/{user_id}/{file_path}"
-            stream, _ = container.get_archive(full_path)
+
+            ## A cheap stat tells us whether our cached copy is still current
+            stat = self.stat_path(container, full_path)
+            if stat is None:
+                raise KeyError(file_path)
+            cached = self.file_cache.get(container.id, file_path, stat)
+            if cached:
+                return {
+                    "file_path": file_path,
+                    "mime_type": cached["mime_type"],
+                    "content": cached["content"].decode("utf-8", errors="replace")
+                }
+
+            stream, stat = container.get_archive(full_path)
 
             tar_bytes = io.BytesIO(b''.join(stream))
             with tarfile.open(fileobj=tar_bytes) as tar:
-                member = tar.getmember(file_path)
+                ## get_archive names the member after the last path component
+                member = tar.getmember(file_path.rstrip("/").split("/")[-1])
                 file_obj = tar.extractfile(member)
                 content_bytes = file_obj.read()
 
             mime = magic.from_buffer(content_bytes, mime=True)
+            self.file_cache.put(container.id, file_path, stat, content_bytes, mime)
 
             return {
                 "file_path": file_path,
@@ -269,6 +483,141 @@ class docker_manager:
                 "file_path": file_path
             }
 
+    ## Stat a path through a HEAD on the archive endpoint, which only returns headers.
+    ## Returns None if the path doesn't exist.
+    def stat_path(self, container, full_path: str):
+        api = container.client.api
+        res = api.head(api._url("/containers/{0}/archive", container.id), params={"path": full_path})
+        if res.status_code == 404:
+            return None
+        api._raise_for_status(res)
+        encoded_stat = res.headers.get("x-docker-container-path-stat")
+        return docker.utils.decode_json_header(encoded_stat) if encoded_stat else None
+
+    ## Start streaming a file (or a directory, as a tar) out of the container.
+    ## Returns the archive stat header and the raw tar chunk generator; nothing is read yet.
+    def open_file_stream(self, user_id: str, container_name: str, file_path: str):
+        ## No '..' or absolute paths: downloads stay inside the user's home
+        clean_path = self.clean_relative_path(file_path)
+        if not clean_path:
+            raise ValueError(f"Invalid file path '{file_path}'.")
+        file_path = clean_path
+        container = self.find_container_by_logical_name(user_id, container_name)
+        if not container:
+            raise FileNotFoundError("Container not found.")
+
+        full_path = f"/home/{user_id}/{file_path}"
+        try:
+            stream, stat = container.get_archive(full_path, chunk_size=STREAM_CHUNK_SIZE)
+        except docker.errors.NotFound:
+            raise FileNotFoundError(f"File '{file_path}' not found.")
+        return stat or {}, stream
+
+    def is_directory_stat(self, stat):
+        return bool(stat.get("mode", 0) & MODE_DIR)
+
+    ## Yield bytes [start, stop) of the single file inside a get_archive stream
+    def iter_file_range(self, stream, start=0, stop=None):
+        with tarfile.open(fileobj=archive_reader(stream), mode="r|") as tar:
+            member = tar.next()
+            if member is None or not member.isfile():
+                return
+            file_obj = tar.extractfile(member)
+            stop = member.size if stop is None else min(stop, member.size)
+
+            ## The daemon can't seek, so skip up to the start of the range
+            position = 0
+            while position < start:
+                skipped = file_obj.read(min(STREAM_CHUNK_SIZE, start - position))
+                if not skipped:
+                    return
+                position += len(skipped)
+
+            while position < stop:
+                data = file_obj.read(min(STREAM_CHUNK_SIZE, stop - position))
+                if not data:
+                    return
+                position += len(data)
+                yield data
+
+    ## Bytes used by the user's home directory in a container
+    def workspace_usage(self, container, user_id: str):
+        exit_code, output = container.exec_run(f"du -sk /home/{user_id}", user="root")
+        if exit_code != 0:
+            return 0
+        return int(output.split()[0]) * 1024
+
+    ## Bytes used by the user's home directories across all of their containers, for the
+    ## upload quota. Running containers are measured; paused or stopped ones can't run du
+    ## (and mustn't be woken for it), so they count with what they used when last measured.
+    def user_usage(self, user_id: str, container=None):
+        containers = {c.id: c for c in self.index.containers_for_user(user_id)}
+        if container:
+            containers[container.id] = container
+        total = 0
+        for c in containers.values():
+            if c.attrs.get("State", {}).get("Status", c.status) == "running":
+                try:
+                    self.workspace_sizes[c.id] = self.workspace_usage(c, user_id)
+                except docker.errors.APIError as e:
+                    print(f"Could not measure {c.name}: {e.explanation}")
+            total += self.workspace_sizes.get(c.id, 0)
+        return total
+
+    ## Build a one-file tar stream around chunks as they arrive, so put_archive can send it
+    ## to the daemon without the file ever being held in memory
+    def tar_stream(self, file_path: str, size: int, chunks):
+        tarinfo = tarfile.TarInfo(name=file_path)
+        tarinfo.size = size
+        tarinfo.mtime = int(time.time())
+        yield tarinfo.tobuf()
+
+        received = 0
+        for chunk in chunks:
+            received += len(chunk)
+            if received > size:
+                raise ValueError("Upload is larger than its declared size.")
+            yield chunk
+        if received != size:
+            raise ValueError("Upload ended before its declared size.")
+
+        yield b"\0" * (-size % tarfile.BLOCKSIZE)
+        yield b"\0" * (tarfile.BLOCKSIZE * 2)
+
+    def upload_file(self, user_id: str, container_name: str, file_path: str, size: int, chunks):
+        ## The path becomes the tar member name and put_archive runs as root, so a '..'
+        ## would write outside the user's home
+        clean_path = self.clean_relative_path(file_path)
+        if not clean_path:
+            return self.return_result("error", f"Invalid file path '{file_path}'.")
+        file_path = clean_path
+        container = self.find_container_by_logical_name(user_id, container_name)
+        if not container:
+            return self.return_result("error", "Container not found.")
+
+        used = self.user_usage(user_id, container)
+        if used + size > UPLOAD_QUOTA_BYTES:
+            return self.return_result("error", f"Upload would exceed your {UPLOAD_QUOTA_BYTES} byte quota ({used} bytes used).")
+
+        started = time.monotonic()
+        self.file_cache.invalidate(container.id, file_path)
+        try:
+            success = container.put_archive(f"/home/{user_id}", self.tar_stream(file_path, size, chunks))
+        except (ValueError, docker.errors.APIError) as e:
+            return self.return_result("error", f"Upload failed: {e}")
+        if not success:
+            return self.return_result("error", f"Failed to upload {file_path}.")
+
+        seconds = max(time.monotonic() - started, 1e-6)
+        print(f"Uploaded {size} bytes to {container.name}:{file_path} at {size / seconds / 1e6:.1f} MB/s")
+        return {
+            "result": "success",
+            "file_path": file_path,
+            "bytes": size,
+            "seconds": round(seconds, 3),
+            "bytes_per_second": int(size / seconds)
+        }
+
     def write_file(self, user_id: str, container_name: str, file_path: str, content: str):
         container = self.find_container_by_logical_name(user_id, container_name)
         if not container:
@@ -293,14 +642,27 @@ class docker_manager:
         if not success:
             raise Exception(f"Failed to write file to container at {full_path}")
 
+        ## We know exactly what the file holds now, so keep it cached under its new stat
+        try:
+            stat = self.stat_path(container, full_path)
+            self.file_cache.put(container.id, file_path, stat, data, magic.from_buffer(data, mime=True))
+        except docker.errors.APIError:
+            self.file_cache.invalidate(container.id, file_path)
+
     def delete_file(self, user_id: str, container_name: str, file_path: str):
+        ## Same rules as batch deletes: no '..', no absolute paths, quoted for the shell
+        clean_path = self.clean_relative_path(file_path)
+        if not clean_path:
+            return {"error": f"Invalid file path '{file_path}'."}
+        file_path = clean_path
         container = self.find_container_by_logical_name(user_id, container_name)
         if not container:
             return {"error": "Container not found"}
 
+        self.file_cache.invalidate(container.id, file_path)
         try:
             exec_result = container.exec_run(
-                f"rm -rf '{file_path}'",
+                ["sh", "-c", f"rm -rf -- {shlex.quote(file_path)}"],
                 workdir=f"/home/{user_id}",
                 demux=True
             )
@@ -319,3 +681,120 @@ class docker_manager:
         exit_code, _ = container.exec_run(cmd=command)
         if exit_code != 0:
             raise Exception(f"Failed to create folder: {folder_path}")
+
+    ## Paths in batch operations must stay inside the user's home directory
+    def clean_relative_path(self, path):
+        if not isinstance(path, str):
+            return None
+        parts = [part for part in path.strip().split("/") if part not in ("", ".")]
+        if not parts or ".." in parts:
+            return None
+        return "/".join(parts)
+
+    ## Run many file operations with as few Docker calls as possible:
+    ## one exec for every mkdir/move/delete (in request order), one tar for every write,
+    ## one exec'd tar for every read, and one listing at the end.
+    ## Writes run after the mkdir/move/delete step and reads run after the writes.
+    def batch_file_ops(self, user_id: str, container_name: str, ops):
+        container = self.find_container_by_logical_name(user_id, container_name)
+        if not container:
+            return {"error": "Container not found.", "results": [], "container_name": container_name}
+
+        home = f"/home/{user_id}"
+        results = [None] * len(ops)
+        commands, writes, reads = [], [], []
+
+        for i, op in enumerate(ops):
+            kind = op.get("op")
+            path = self.clean_relative_path(op.get("path"))
+            if path is None:
+                results[i] = {"op": kind, "path": op.get("path"), "error": "Invalid path."}
+                continue
+
+            if kind == "mkdir":
+                commands.append((i, f"mkdir -p -- {shlex.quote(path)}"))
+            elif kind == "delete":
+                commands.append((i, f"rm -rf -- {shlex.quote(path)}"))
+            elif kind == "move":
+                dest = self.clean_relative_path(op.get("dest"))
+                if dest is None:
+                    results[i] = {"op": kind, "path": path, "error": "Invalid destination."}
+                    continue
+                commands.append((i, f"mkdir -p -- \"$(dirname -- {shlex.quote(dest)})\" && mv -- {shlex.quote(path)} {shlex.quote(dest)}"))
+            elif kind == "write":
+                writes.append((i, path, (op.get("content") or "").encode("utf-8")))
+            elif kind == "read":
+                reads.append((i, path))
+            else:
+                results[i] = {"op": kind, "path": path, "error": f"Unknown operation '{kind}'."}
+                continue
+            results[i] = {"op": kind, "path": path}
+
+        if commands:
+            ## Each command reports its own status line, so one failure doesn't hide the rest
+            script = "\n".join(f"if {command}; then echo {i}:ok; else echo {i}:error; fi" for i, command in commands)
+            try:
+                exec_result = container.exec_run(cmd=["sh", "-c", script], workdir=home)
+                for line in exec_result.output.decode(errors="replace").splitlines():
+                    index, _, status = line.partition(":")
+                    if index.isdigit() and int(index) < len(results) and status == "error":
+                        results[int(index)]["error"] = "Operation failed."
+            except Exception as e:
+                for i, _ in commands:
+                    results[i]["error"] = str(e)
+            for i, _ in commands:
+                self.file_cache.invalidate(container.id, results[i]["path"])
+
+        if writes:
+            tarstream = io.BytesIO()
+            with tarfile.open(fileobj=tarstream, mode="w") as tar:
+                for _, path, data in writes:
+                    tarinfo = tarfile.TarInfo(name=path)
+                    tarinfo.size = len(data)
+                    tarinfo.mtime = int(time.time())
+                    tar.addfile(tarinfo, io.BytesIO(data))
+            tarstream.seek(0)
+            try:
+                success = container.put_archive(home, tarstream)
+                error = None if success else "Failed to write files."
+            except docker.errors.APIError as e:
+                error = str(e)
+            for i, path, _ in writes:
+                self.file_cache.invalidate(container.id, path)
+                if error:
+                    results[i]["error"] = error
+
+        if reads:
+            paths = [shlex.quote(path) for _, path in reads]
+            try:
+                exec_result = container.exec_run(
+                    cmd=["sh", "-c", f"tar -cf - -- {' '.join(paths)} 2>/dev/null; true"],
+                    workdir=home,
+                    demux=True
+                )
+                stdout = exec_result.output[0] or b""
+                contents = {}
+                if stdout:
+                    with tarfile.open(fileobj=io.BytesIO(stdout)) as tar:
+                        for member in tar:
+                            if member.isfile():
+                                contents[member.name] = tar.extractfile(member).read()
+                for i, path in reads:
+                    data = contents.get(path)
+                    if data is None:
+                        results[i]["error"] = "File not found."
+                        continue
+                    results[i]["mime_type"] = magic.from_buffer(data, mime=True)
+                    results[i]["content"] = data.decode("utf-8", errors="replace")
+            except Exception as e:
+                for i, _ in reads:
+                    results[i]["error"] = str(e)
+
+        for result in results:
+            result.setdefault("result", "error" if result.get("error") else "success")
+
+        return {
+            "results": results,
+            "listing": self.list_files(user_id, container_name),
+            "container_name": container_name
+        }
@@ -0,0 +1,81 @@
+import collections
+import os
+import threading
+
+MAX_CACHE_BYTES = int(os.getenv("FILE_CACHE_BYTES", str(64 * 1024 * 1024)))
+MAX_ENTRY_BYTES = int(os.getenv("FILE_CACHE_ENTRY_BYTES", str(4 * 1024 * 1024)))
+
+## LRU cache of file contents and detected MIME types, keyed by (container_id, file_path).
+## Every entry remembers the size and mtime the file had when it was cached; a lookup
+## only hits if a fresh stat of the file still reports the same pair, so changes made
+## from the terminal are never served stale.
+class file_cache:
+    def __init__(self, max_bytes=MAX_CACHE_BYTES, max_entry_bytes=MAX_ENTRY_BYTES):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def get(self, container_id, file_path, stat):
+        key = (container_id, file_path)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry["size"] != stat.get("size") or entry["mtime"] != stat.get("mtime"):
+                self._pop(key)
+                self.stale += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, container_id, file_path, stat, content: bytes, mime_type: str):
+        if not stat or len(content) > self.max_entry_bytes:
+            self.invalidate(container_id, file_path)
+            return
+        key = (container_id, file_path)
+        with self.lock:
+            self._pop(key)
+            self.entries[key] = {
+                "size": stat.get("size"),
+                "mtime": stat.get("mtime"),
+                "content": content,
+                "mime_type": mime_type,
+            }
+            self.size += len(content)
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted["content"])
+                self.evictions += 1
+
+    def _pop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry:
+            self.size -= len(entry["content"])
+
+    ## Drop a path and, if it was a directory, everything under it
+    def invalidate(self, container_id, file_path):
+        prefix = file_path.rstrip("/") + "/"
+        with self.lock:
+            for key in list(self.entries):
+                if key[0] == container_id and (key[1] == file_path or key[1].startswith(prefix)):
+                    self._pop(key)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "evictions": self.evictions,
+            }
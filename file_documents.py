@@ -0,0 +1,85 @@
+import collections
+import os
+import threading
+import zlib
+
+MAX_DOCUMENT_BYTES = int(os.getenv("DOCUMENT_CACHE_BYTES", str(64 * 1024 * 1024)))
+
+## Same hash the editor computes in terminal.js: CRC-32 of the UTF-8 text, as 8 hex digits
+def content_hash(text: str):
+    return format(zlib.crc32(text.encode("utf-8", errors="replace")), "08x")
+
+class document_mismatch(Exception):
+    pass
+
+## Server-side copy of every file open in an editor, keyed by (user_id, container_name, file_path),
+## so edits can arrive as small patches instead of the whole file.
+## Least recently used documents are dropped once their total UTF-8 size passes max_bytes.
+class document_store:
+    def __init__(self, max_bytes=MAX_DOCUMENT_BYTES):
+        self.max_bytes = max_bytes
+        self.docs = collections.OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    ## on_change(text), if given, runs while the lock is still held, so whatever it hands
+    ## the text to (the write-behind buffer) sees versions in the order they were stored
+    def load(self, key, text: str, version=0, on_change=None):
+        with self.lock:
+            self._set(key, {"text": text, "hash": content_hash(text), "version": version or 0})
+            if on_change:
+                on_change(text)
+
+    def _set(self, key, doc):
+        doc["size"] = len(doc["text"].encode("utf-8", errors="replace"))
+        old = self.docs.pop(key, None)
+        if old:
+            self.size -= old["size"]
+        self.docs[key] = doc
+        self.size += doc["size"]
+        while self.size > self.max_bytes and len(self.docs) > 1:
+            _, evicted = self.docs.popitem(last=False)
+            self.size -= evicted["size"]
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.docs
+
+    def forget(self, user_id, container_name, file_path):
+        with self.lock:
+            for key in list(self.docs):
+                if key[:2] == (user_id, container_name) and (
+                    key[2] == file_path or key[2].startswith(file_path.rstrip("/") + "/")
+                ):
+                    self.size -= self.docs.pop(key)["size"]
+
+    ## Apply a list of {"start", "end", "text"} edits (code point offsets into the document,
+    ## applied in order) on top of the version whose hash is base_hash.
+    ## Returns the new text. A patch at or below the stored version (another tab got there
+    ## first, or it arrived out of order) is a mismatch too, so the editor resyncs.
+    def apply(self, key, base_hash, edits, new_hash=None, version=None, on_change=None):
+        with self.lock:
+            doc = self.docs.get(key)
+            if doc is None:
+                raise document_mismatch("Document not loaded.")
+            if version is not None and version <= doc["version"]:
+                raise document_mismatch("Patch is older than the stored version.")
+            if doc["hash"] != base_hash:
+                raise document_mismatch("Base hash does not match.")
+
+            text = doc["text"]
+            for edit in edits:
+                start, end = int(edit["start"]), int(edit["end"])
+                if not 0 <= start <= end <= len(text):
+                    raise document_mismatch("Edit out of range.")
+                text = text[:start] + edit.get("text", "") + text[end:]
+
+            text_hash = content_hash(text)
+            if new_hash and text_hash != new_hash:
+                raise document_mismatch("Result hash does not match.")
+
+            self.docs.move_to_end(key)
+            self._set(key, {"text": text, "hash": text_hash, "version": version or doc["version"]})
+            if on_change:
+                on_change(text)
+            return text
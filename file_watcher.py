@@ -0,0 +1,141 @@
+import os
+import threading
+import time
+
+WATCH_INTERVAL = float(os.getenv("FILE_WATCH_INTERVAL", "5"))
+NUDGE_DELAY = float(os.getenv("FILE_WATCH_NUDGE_MS", "300")) / 1000
+
+## Watches the file tree of every workspace someone has open and pushes only what changed.
+## There's one snapshot loop per workspace (user_id, container_name), shared by all the
+## tabs watching it. A workspace is re-listed every WATCH_INTERVAL seconds, or NUDGE_DELAY
+## after something that probably changed it (a command run in a terminal, a file operation).
+## With an executor, each due snapshot is its own job on the fast pool, so one slow
+## container only delays its own deltas; without one, snapshots run inline.
+class file_tree_watcher:
+    def __init__(self, snapshot, emit, executor=None, interval=WATCH_INTERVAL, nudge_delay=NUDGE_DELAY):
+        self.snapshot = snapshot  # snapshot(user_id, container_name) -> {"entries": [...]} or {"error": ...}
+        self.emit = emit
+        self.executor = executor
+        self.interval = interval
+        self.nudge_delay = nudge_delay
+        self.workspaces = {}
+        self.cond = threading.Condition()
+        self.snapshots_taken = 0
+        self.deltas_sent = 0
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def room(self, user_id, container_name):
+        return f"files:{user_id}:{container_name}"
+
+    ## Returns the last known listing, if we have one
+    def watch(self, user_id, container_name, sid):
+        key = (user_id, container_name)
+        with self.cond:
+            workspace = self.workspaces.get(key)
+            if workspace is None:
+                workspace = {"sids": set(), "files": None, "due": time.monotonic() + self.interval, "refreshing": False}
+                self.workspaces[key] = workspace
+                self.cond.notify()
+            workspace["sids"].add(sid)
+            return list(workspace["files"].values()) if workspace["files"] is not None else None
+
+    ## Record a listing fetched by someone else, so the next snapshot diffs against it
+    def seed(self, user_id, container_name, entries):
+        with self.cond:
+            workspace = self.workspaces.get((user_id, container_name))
+            if workspace is not None and workspace["files"] is None:
+                workspace["files"] = {entry["path"]: entry for entry in entries}
+
+    def unwatch(self, sid):
+        with self.cond:
+            for key, workspace in list(self.workspaces.items()):
+                workspace["sids"].discard(sid)
+                if not workspace["sids"]:
+                    del self.workspaces[key]
+
+    def nudge(self, user_id, container_name, delay=None):
+        with self.cond:
+            workspace = self.workspaces.get((user_id, container_name))
+            if workspace is None:
+                return
+            due = time.monotonic() + (self.nudge_delay if delay is None else delay)
+            if due < workspace["due"]:
+                workspace["due"] = due
+                self.cond.notify()
+
+    def run(self):
+        while True:
+            with self.cond:
+                now = time.monotonic()
+                idle = {key: workspace for key, workspace in self.workspaces.items() if not workspace["refreshing"]}
+                due = [key for key, workspace in idle.items() if workspace["due"] <= now]
+                if not due:
+                    deadlines = [workspace["due"] for workspace in idle.values()]
+                    self.cond.wait(min(deadlines) - now if deadlines else None)
+                    continue
+                for key in due:
+                    self.workspaces[key]["due"] = now + self.interval
+                    self.workspaces[key]["refreshing"] = True
+            for key in due:
+                if self.executor:
+                    self.executor.submit("fast", "list_files", self.refresh, *key)
+                else:
+                    self.refresh(*key)
+
+    def refresh(self, user_id, container_name):
+        try:
+            result = self.snapshot(user_id, container_name)
+            self.snapshots_taken += 1
+            self.update(user_id, container_name, result)
+        except Exception as e:
+            print(f"File watcher error for {(user_id, container_name)}: {e}")
+        finally:
+            with self.cond:
+                workspace = self.workspaces.get((user_id, container_name))
+                if workspace is not None:
+                    workspace["refreshing"] = False
+                ## A nudge may have come in while this snapshot was running
+                self.cond.notify()
+
+    ## Diff a fresh listing (ours or one somebody else just fetched) and push what changed
+    def update(self, user_id, container_name, result):
+        if result.get("error"):
+            return
+
+        files = {entry["path"]: entry for entry in result["entries"]}
+        with self.cond:
+            workspace = self.workspaces.get((user_id, container_name))
+            if workspace is None:
+                return
+            previous = workspace["files"]
+            workspace["files"] = files
+        if previous is None:
+            return
+
+        added = [entry for path, entry in files.items() if path not in previous]
+        removed = [path for path in previous if path not in files]
+        changed = [
+            entry for path, entry in files.items()
+            if path in previous and self.signature(entry) != self.signature(previous[path])
+        ]
+        if not (added or removed or changed):
+            return
+        self.deltas_sent += 1
+        self.emit("file_tree_delta", {
+            "container_name": container_name,
+            "added": added,
+            "removed": removed,
+            "changed": changed
+        }, to=self.room(user_id, container_name))
+
+    def signature(self, entry):
+        return entry["type"], entry["size"], entry["mtime"]
+
+    def stats(self):
+        with self.cond:
+            return {
+                "workspaces": len(self.workspaces),
+                "watchers": sum(len(w["sids"]) for w in self.workspaces.values()),
+                "snapshots": self.snapshots_taken,
+                "deltas": self.deltas_sent,
+            }
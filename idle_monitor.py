@@ -0,0 +1,238 @@
+import collections
+import os
+import threading
+import time
+import docker
+
+## Seconds without terminal activity or file operations before a container hibernates (0 = never)
+IDLE_TIMEOUT = float(os.getenv("IDLE_TIMEOUT", "1800"))
+IDLE_CHECK_INTERVAL = float(os.getenv("IDLE_CHECK_INTERVAL", "60"))
+## A container using more CPUs than this (p90 over the stats window) is busy, whoever is watching
+IDLE_CPU = float(os.getenv("IDLE_CPU", "0.02"))
+## pause - freeze the processes; resumes in milliseconds, but their memory stays resident
+## stop  - stop the container; frees its memory, resuming means booting it again
+IDLE_ACTION = os.getenv("IDLE_ACTION", "pause")
+## How often each process shares its activity through the session registry
+ACTIVITY_SHARE_INTERVAL = float(os.getenv("IDLE_SHARE_INTERVAL", "30"))
+
+## Hibernates containers nobody is using and wakes them again on the next access.
+## Activity comes from touch() (socket events and file operations), from activity
+## sources (callables returning {(user_id, container_name): last_activity} in
+## time.monotonic() terms, e.g. the live terminal sessions), and from CPU usage in the
+## stats sampler. Hibernated containers drop out of the rebalance, so their share of
+## the user's CPU and memory goes to the containers still running.
+##
+## Only one process per deployment hibernates (start() is only called there), but every
+## process sees activity: with share(), each one publishes what it saw to the session
+## registry and check() counts everybody's. Hibernations are marked in the registry too,
+## so any process resumes a container it is touched for, paused or stopped.
+class idle_monitor:
+    def __init__(self, manager, timeout=IDLE_TIMEOUT, action=IDLE_ACTION):
+        self.manager = manager
+        self.timeout = timeout
+        self.action = action
+        self.lock = threading.Lock()
+        self.activity = {}        # (user_id, container_name) -> last activity
+        self.sources = []
+        self.hibernated = {}      # (user_id, container_name) -> {"action", "at", "memory"}
+        self.started_at = time.monotonic()
+        self.hibernations = 0
+        self.resumes = 0
+        self.memory_recovered = 0
+        self.resume_times = collections.deque(maxlen=256)
+        self.registry = None
+        self.thread = None
+
+    def start(self):
+        if not self.timeout or self.thread:
+            return
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def add_activity_source(self, source):
+        self.sources.append(source)
+
+    ## Record activity on a container, waking it first if it is hibernating. The process
+    ## that paused it may be another one, so a paused state in the index counts too.
+    def touch(self, user_id, container_name):
+        if not user_id or not container_name:
+            return
+        key = (user_id, container_name)
+        with self.lock:
+            self.activity[key] = time.monotonic()
+            sleeping = key in self.hibernated
+        container = self.manager.index.get(user_id, container_name)
+        if container and (sleeping or container.attrs.get("State", {}).get("Status", container.status) == "paused"):
+            self.wake(container)
+
+    ## Publish this process's activity to the registry every interval, and count
+    ## everybody's in check()
+    def share(self, registry, interval=ACTIVITY_SHARE_INTERVAL):
+        self.registry = registry
+        threading.Thread(target=self.publish_activity, args=(interval,), daemon=True).start()
+
+    def publish_activity(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                ## The registry keeps wall-clock times, since monotonic ones are per process
+                offset = time.time() - time.monotonic()
+                self.registry.record_activity({
+                    key: at + offset for key, at in self.last_activity(shared=False).items()
+                })
+            except Exception as e:
+                print(f"Idle monitor activity sharing error: {e}")
+
+    ## The hibernation mark other processes see; without a registry there are none
+    def mark_shared(self, owner, action):
+        if not self.registry:
+            return
+        try:
+            self.registry.mark_hibernated(owner, action)
+        except Exception as e:
+            print(f"Idle monitor hibernation sharing error: {e}")
+
+    def shared_action(self, owner):
+        if not self.registry:
+            return None
+        try:
+            return self.registry.hibernated(owner)
+        except Exception as e:
+            print(f"Idle monitor hibernation sharing error: {e}")
+            return None
+
+    ## The user stopped or deleted it themselves, so don't bring it back
+    def forget(self, user_id, container_name):
+        with self.lock:
+            self.hibernated.pop((user_id, container_name), None)
+            self.activity.pop((user_id, container_name), None)
+        self.mark_shared((user_id, container_name), None)
+
+    ## Hibernated by any process: paused, or stopped with a hibernation mark
+    def is_hibernated(self, user_id, container_name):
+        with self.lock:
+            if (user_id, container_name) in self.hibernated:
+                return True
+        container = self.manager.index.get(user_id, container_name)
+        if not container:
+            return False
+        status = container.attrs.get("State", {}).get("Status", container.status)
+        return status == "paused" or (
+            status in ("exited", "created") and self.shared_action((user_id, container_name)) == "stop"
+        )
+
+    ## Resume a container hibernated by this or any other process (or any paused one, e.g.
+    ## from before a restart). Returns how long it took, or None if it was already awake.
+    def wake(self, container):
+        owner = self.manager.index.owner_of(container)
+        with self.lock:
+            entry = self.hibernated.pop(owner, None)
+        status = container.attrs.get("State", {}).get("Status", container.status)
+        if entry is None and status in ("exited", "created") and self.shared_action(owner) == "stop":
+            entry = {"action": "stop"}
+        if entry is None and status != "paused":
+            return None
+
+        started = time.monotonic()
+        try:
+            if status == "paused":
+                container.unpause()
+            elif status in ("exited", "created") and entry and entry["action"] == "stop":
+                container.start()
+            else:
+                return None
+            container.reload()
+        except docker.errors.APIError as e:
+            print(f"Could not resume {container.name}: {e.explanation}")
+            return None
+        elapsed = time.monotonic() - started
+        self.mark_shared(owner, None)
+        with self.lock:
+            self.activity[owner] = time.monotonic()
+            self.resumes += 1
+            self.resume_times.append(elapsed)
+        self.manager.index.add(container)
+        self.manager.rebalancer.schedule(owner[0])
+        print(f"Resumed {container.name} in {elapsed * 1000:.0f} ms")
+        return elapsed
+
+    def run(self):
+        while True:
+            time.sleep(IDLE_CHECK_INTERVAL)
+            try:
+                self.check()
+            except Exception as e:
+                print(f"Idle monitor error: {e}")
+
+    def last_activity(self, shared=True):
+        activity = {}
+        if shared and self.registry:
+            offset = time.monotonic() - time.time()
+            try:
+                for key, at in self.registry.activity().items():
+                    activity[key] = at + offset
+            except Exception as e:
+                print(f"Idle monitor shared activity error: {e}")
+        for source in self.sources:
+            try:
+                for key, at in source().items():
+                    activity[key] = max(at, activity.get(key, 0))
+            except Exception as e:
+                print(f"Idle monitor activity source error: {e}")
+        with self.lock:
+            for key, at in self.activity.items():
+                activity[key] = max(at, activity.get(key, 0))
+        return activity
+
+    def check(self):
+        now = time.monotonic()
+        activity = self.last_activity()
+        running = [
+            c for c in self.manager.index.containers()
+            if c.attrs.get("State", {}).get("Status", c.status) == "running"
+        ]
+        usage = self.manager.stats_sampler.usage([c.id for c in running])
+        for container in running:
+            owner = self.manager.index.owner_of(container)
+            ## Containers we haven't seen any activity for count from when we started watching
+            last = activity.get(owner, self.started_at)
+            seen = usage.get(container.id)
+            if now - last < self.timeout or (seen and seen["cpu"] > IDLE_CPU):
+                continue
+            self.hibernate(container, owner, seen["memory"] if seen else 0)
+
+    def hibernate(self, container, owner, memory):
+        try:
+            if self.action == "stop":
+                container.stop()
+            else:
+                container.pause()
+            container.reload()
+        except docker.errors.APIError as e:
+            print(f"Could not hibernate {container.name}: {e.explanation}")
+            return
+        with self.lock:
+            self.hibernated[owner] = {"action": self.action, "at": time.monotonic(), "memory": memory}
+            self.hibernations += 1
+            ## A paused container's memory stays resident; only stopping gives it back to the host
+            if self.action == "stop":
+                self.memory_recovered += int(memory)
+        self.mark_shared(owner, self.action)
+        self.manager.index.add(container)
+        self.manager.rebalancer.schedule(owner[0])
+        print(f"Hibernated idle container {container.name} ({self.action}, {int(memory) // (1024 * 1024)} MiB in use)")
+
+    def stats(self):
+        with self.lock:
+            times = list(self.resume_times)
+            return {
+                "hibernated": len(self.hibernated),
+                "hibernations": self.hibernations,
+                "resumes": self.resumes,
+                "memory_recovered_bytes": self.memory_recovered,
+                "memory_frozen_bytes": sum(
+                    int(entry["memory"]) for entry in self.hibernated.values() if entry["action"] == "pause"
+                ),
+                "resume_ms_avg": round(1000 * sum(times) / len(times), 1) if times else None,
+                "resume_ms_max": round(1000 * max(times), 1) if times else None,
+            }
@@ -0,0 +1,65 @@
+## Runs several server processes on consecutive ports, sharing a Socket.IO message queue,
+## a terminal session registry and a SECRET_KEY, and restarts any that die.
+## Put them behind a load balancer with sticky sessions (e.g. nginx ip_hash) so each
+## client's long-polling requests keep reaching the same worker.
+##
+##   WORKERS=4 SOCKETIO_MESSAGE_QUEUE=redis://localhost:6379/0 python launcher.py
+import os
+import secrets
+import signal
+import subprocess
+import sys
+import time
+
+WORKERS = int(os.getenv("WORKERS", str(os.cpu_count() or 1)))
+BASE_PORT = int(os.getenv("PORT", "5000"))
+MESSAGE_QUEUE = os.getenv("SOCKETIO_MESSAGE_QUEUE", "redis://localhost:6379/0")
+## ASYNC=1 runs async_server.py instead of the threaded main.py
+SERVER = "async_server.py" if os.getenv("ASYNC") == "1" else "main.py"
+
+def worker_env(index, secret_key):
+    env = dict(
+        os.environ,
+        WORKER_ID=f"{os.uname().nodename}-worker-{index}",
+        PORT=str(BASE_PORT + index),
+        SECRET_KEY=secret_key,
+        SOCKETIO_MESSAGE_QUEUE=MESSAGE_QUEUE,
+        SESSION_REGISTRY=os.getenv("SESSION_REGISTRY", MESSAGE_QUEUE),
+        FLASK_DEBUG="0",
+    )
+    ## Only one worker keeps the warm pool filled, or they would fight over its containers
+    if index:
+        env["BACKGROUND_WORKER"] = "0"
+    return env
+
+def spawn(index, secret_key):
+    print(f"Starting worker {index} on port {BASE_PORT + index}")
+    return subprocess.Popen([sys.executable, SERVER], env=worker_env(index, secret_key))
+
+def main():
+    ## The async server's native terminal handlers keep sessions on their event loop and
+    ## don't go through the session registry, so its terminals can't be forwarded between workers
+    if SERVER == "async_server.py" and WORKERS > 1:
+        sys.exit("ASYNC=1 supports a single worker only (terminal events are not forwarded between async workers)")
+    secret_key = os.getenv("SECRET_KEY") or secrets.token_hex(32)
+    workers = [spawn(index, secret_key) for index in range(WORKERS)]
+
+    def shutdown(signum, frame):
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.wait()
+        sys.exit(0)
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    while True:
+        time.sleep(1)
+        for index, worker in enumerate(workers):
+            if worker.poll() is not None:
+                print(f"Worker {index} exited with {worker.returncode}, restarting")
+                workers[index] = spawn(index, secret_key)
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,22 @@
 ## This looks really ugly, could we make it prettier?
-from flask import Flask, render_template, session, redirect, url_for, request, flash
+from flask import Flask, render_template, session, redirect, url_for, request, flash, Response, abort, jsonify
 from flask_socketio import SocketIO, disconnect
 import os
 import pyrebase
 from dotenv import load_dotenv
 from docker_information import docker_manager
 from socket_routes import register_socket_routes  # <- changed name!
+import metrics
 
 #Set up Flask and other libraries
 app = Flask(__name__)
-app.secret_key = os.urandom(24)
-sio = SocketIO(app, cors_allowed_origins="*", manage_session=False)
-docker_mgr = docker_manager()
+## Workers behind one load balancer must share SECRET_KEY to accept each other's session cookies
+app.secret_key = os.getenv("SECRET_KEY") or os.urandom(24)
+FLASK_DEBUG = os.getenv("FLASK_DEBUG", "1") == "1"
+## Under the debug reloader this module also runs in the parent process, which only
+## watches files and restarts the server; it must not run a second warm pool
+RELOADER_PARENT = __name__ == "__main__" and FLASK_DEBUG and os.getenv("WERKZEUG_RUN_MAIN") != "true"
+docker_mgr = docker_manager(background=not RELOADER_PARENT)
 load_dotenv(".env")
 
 
@@ -31,9 +36,6 @@ config = {
 firebase = pyrebase.initialize_app(config)
 auth = firebase.auth()
 
-## <Insert comment here oz>
-register_socket_routes(sio, docker_mgr)
-
 ## Homepage of app - varies based on login status
 @app.route('/')
 def index():
@@ -101,10 +103,97 @@ def terminal(container_name):
     user_id = session.get('user_id')
     if not user_id:
         return redirect(url_for('index'))
+    ## Finding the container also resumes it if it was hibernating
     container = docker_mgr.find_container_by_logical_name(user_id, container_name)
     if not container or container.status != "running":
         return redirect(url_for('index'))
     return render_template("terminal.html")
 
-## Run the app
-sio.run(app, host="0.0.0.0", port=5000,debug=True)
+## Stream a file out of a container without holding it in memory.
+## Supports Range requests (and If-Range) so large downloads can be resumed.
+## Directories are sent as a tar archive.
+@app.route('/download/<container_name>/<path:file_path>')
+def download(container_name, file_path):
+    user_id = session.get('user_id')
+    if not user_id:
+        abort(401)
+
+    try:
+        stat, stream = docker_mgr.open_file_stream(user_id, container_name, file_path)
+    except FileNotFoundError as e:
+        abort(404, str(e))
+    except ValueError as e:
+        abort(400, str(e))
+
+    filename = file_path.rstrip("/").split("/")[-1]
+    if docker_mgr.is_directory_stat(stat):
+        response = Response(stream, mimetype="application/x-tar")
+        response.headers["Content-Disposition"] = f'attachment; filename="{filename}.tar"'
+        return response
+
+    size = stat.get("size", 0)
+    etag = f'{size}-{stat.get("mtime", "")}'
+    byte_range = request.range
+    if byte_range and request.if_range and request.if_range.etag and request.if_range.etag != etag:
+        byte_range = None
+
+    start, stop = 0, size
+    status = 200
+    if byte_range:
+        bounds = byte_range.range_for_length(size)
+        if bounds is None:
+            stream.close()
+            response = Response(status=416)
+            response.headers["Content-Range"] = f"bytes */{size}"
+            return response
+        start, stop = bounds
+        status = 206
+
+    response = Response(docker_mgr.iter_file_range(stream, start, stop), status=status,
+                        mimetype="application/octet-stream")
+    response.headers["Content-Length"] = str(stop - start)
+    response.headers["Accept-Ranges"] = "bytes"
+    response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    response.set_etag(etag)
+    if status == 206:
+        response.headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+    return response
+
+## Stream an upload straight into a container.
+## The body is read in chunks and wrapped in a tar on the fly, so memory doesn't grow with file size.
+@app.route('/upload/<container_name>/<path:file_path>', methods=['PUT', 'POST'])
+def upload(container_name, file_path):
+    user_id = session.get('user_id')
+    if not user_id:
+        abort(401)
+    size = request.content_length
+    if size is None:
+        abort(411)
+
+    def chunks():
+        while True:
+            chunk = request.stream.read(64 * 1024)
+            if not chunk:
+                break
+            yield chunk
+
+    result = docker_mgr.upload_file(user_id, container_name, file_path, size, chunks())
+    return jsonify(result), 200 if result["result"] == "success" else 400
+
+## Prometheus scrape endpoint (see metrics.py)
+@app.route('/metrics')
+def metrics_endpoint():
+    if not metrics.METRICS_ENABLED:
+        abort(404)
+    if metrics.METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {metrics.METRICS_TOKEN}":
+        abort(401)
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+## Run the app (threading mode; see async_server.py for the asyncio deployment)
+if __name__ == "__main__":
+    ## With a message queue (e.g. redis://localhost:6379/0) any worker can emit to clients of the others
+    sio = SocketIO(app, cors_allowed_origins="*", manage_session=False,
+                   message_queue=os.getenv("SOCKETIO_MESSAGE_QUEUE") or None)
+    register_socket_routes(sio, docker_mgr)
+    sio.run(app, host="0.0.0.0", port=int(os.getenv("PORT", "5000")),
+            debug=FLASK_DEBUG, allow_unsafe_werkzeug=True)
@@ -0,0 +1,228 @@
+import bisect
+import functools
+import inspect
+import os
+import re
+import threading
+import time
+import urllib.parse
+
+## Prometheus text format for /metrics, without a client library. Recording is a
+## perf_counter pair, a bisect and a locked increment per call; everything else
+## (gauges from the components' stats() and live sessions) is only computed on scrape.
+## If set, /metrics wants "Authorization: Bearer <token>". No series carries user ids,
+## container names or tab ids, so the label set stays bounded however many users there are.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+## Off unless a token is set: the endpoint sits on the public app port. METRICS=1 turns
+## it on without a token (e.g. when the port is only reachable by Prometheus).
+METRICS_ENABLED = os.getenv("METRICS", "1" if METRICS_TOKEN else "0") == "1"
+PREFIX = "glitched_"
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels) + "}"
+
+def number(value):
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float)):
+        return value
+    return None
+
+## Latency histogram with a single label (handler event, method name, API call)
+class histogram:
+    def __init__(self, name, help, label, buckets=BUCKETS):
+        self.name = PREFIX + name
+        self.help = help
+        self.label = label
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.series = {}    # label value -> [bucket counts..., count, sum]
+
+    def observe(self, value, seconds):
+        slot = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            series = self.series.get(value)
+            if series is None:
+                series = self.series[value] = [0] * (len(self.buckets) + 2) + [0.0]
+            series[slot] += 1
+            series[-2] += 1
+            series[-1] += seconds
+
+    def render(self):
+        with self.lock:
+            series = {value: list(counts) for value, counts in self.series.items()}
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for value, counts in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{label_text([(self.label, value), ("le", bound)])} {cumulative}')
+            lines.append(f'{self.name}_bucket{label_text([(self.label, value), ("le", "+Inf")])} {counts[-2]}')
+            lines.append(f"{self.name}_count{label_text([(self.label, value)])} {counts[-2]}")
+            lines.append(f"{self.name}_sum{label_text([(self.label, value)])} {counts[-1]:.6f}")
+        return lines
+
+handler_seconds = histogram("socket_handler_seconds", "Socket.IO event handler latency", "event")
+manager_seconds = histogram("docker_manager_seconds", "docker_manager method latency", "method")
+docker_api_seconds = histogram("docker_api_seconds", "Docker Engine API call latency, to response headers", "call")
+histograms = [handler_seconds, manager_seconds, docker_api_seconds]
+
+## Wrap fn (plain or async) so every call is observed in hist under value
+def timed(hist, value):
+    def decorator(fn):
+        if not METRICS_ENABLED:
+            return fn
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    hist.observe(value, time.perf_counter() - started)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                hist.observe(value, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+## Class decorator: time every method defined on the class. Generator functions are
+## left alone, since their work happens while the caller iterates, not in the call.
+def timed_methods(hist):
+    def decorator(cls):
+        for name, fn in list(vars(cls).items()):
+            if name.startswith("__") or not inspect.isfunction(fn) or inspect.isgeneratorfunction(fn):
+                continue
+            setattr(cls, name, timed(hist, name)(fn))
+        return cls
+    return decorator
+
+## Socket.IO registration that times the handler, for socketio.on(event)
+def timed_on(socketio, event):
+    def decorator(fn):
+        return socketio.on(event)(timed(handler_seconds, event)(fn))
+    return decorator
+
+## "GET /containers/{id}/json" from a Docker API URL, so ids and names don't become labels
+COLLECTIONS = {"containers", "exec", "images", "networks", "volumes", "plugins"}
+COLLECTION_ACTIONS = {"json", "create", "prune", "load", "search", "get"}
+
+def api_call(method, url):
+    parts = urllib.parse.urlparse(url).path.strip("/").split("/")
+    if parts and re.fullmatch(r"v[\d.]+", parts[0]):
+        parts = parts[1:]
+    if len(parts) >= 2 and parts[0] in COLLECTIONS and parts[1] not in COLLECTION_ACTIONS:
+        parts = [parts[0], "{id}"] + (parts[-1:] if len(parts) > 2 else [])
+    return f"{method} /{'/'.join(parts)}"
+
+## requests response hook for a docker APIClient (api.hooks["response"])
+def docker_response_hook(response, *args, **kwargs):
+    docker_api_seconds.observe(
+        api_call(response.request.method, response.request.url), response.elapsed.total_seconds()
+    )
+    return response
+
+def instrument_docker_api(api):
+    if METRICS_ENABLED:
+        api.hooks["response"].append(docker_response_hook)
+
+
+## Scrape-time collectors: callables returning lists of exposition lines
+collectors = []
+
+def add_collector(collector):
+    if METRICS_ENABLED:
+        collectors.append(collector)
+
+## values is a number, or {labels: number} where labels is a tuple of (name, value) pairs
+def sample_lines(name, help, values, kind="gauge"):
+    name = PREFIX + name
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    if not isinstance(values, dict):
+        values = {(): values}
+    for labels, value in values.items():
+        lines.append(f"{name}{label_text(labels)} {value}")
+    return lines
+
+def add_gauge(name, help, source, kind="gauge"):
+    add_collector(lambda: sample_lines(name, help, source(), kind))
+
+## One gauge per numeric field of a component's stats() dict. Nested dicts become a
+## label: {"queued": {"slow": 2}} is <prefix>_queued{key="slow"} 2, and a dict of
+## dicts ({"local": {"running": 3}}) is <prefix>_running{key="local"} 3.
+def flatten_stats(prefix, stats, label="key"):
+    gauges = {}
+    for field, value in stats.items():
+        if number(value) is not None:
+            gauges.setdefault(f"{prefix}_{field}", {})[()] = number(value)
+        elif isinstance(value, dict):
+            for key, inner in value.items():
+                if number(inner) is not None:
+                    gauges.setdefault(f"{prefix}_{field}", {})[((label, key),)] = number(inner)
+                elif isinstance(inner, dict):
+                    for sub, sub_value in inner.items():
+                        if number(sub_value) is not None:
+                            gauges.setdefault(f"{prefix}_{field}_{sub}", {})[((label, key),)] = number(sub_value)
+    return gauges
+
+## Fields named in counters only ever go up, so they are exported as <name>_total counters
+def stats_lines(prefix, stats, label="key", help=None, counters=()):
+    lines = []
+    for name, values in flatten_stats(prefix, stats, label).items():
+        if name[len(prefix) + 1:] in counters:
+            lines += sample_lines(name + "_total", help or f"{prefix} stats", values, "counter")
+        else:
+            lines += sample_lines(name, help or f"{prefix} stats", values)
+    return lines
+
+def add_stats(prefix, source, label="key", help=None, counters=()):
+    add_collector(lambda: stats_lines(prefix, source(), label, help, counters))
+
+## For stats keyed by name, like the docker hosts': {"local": {"running": 3}} becomes
+## <prefix>_running{<label>="local"} 3
+def add_keyed_stats(prefix, source, label):
+    def pivot():
+        fields = {}
+        for key, stats in source().items():
+            for field, value in stats.items():
+                fields.setdefault(field, {})[key] = value
+        return fields
+    add_stats(prefix, pivot, label)
+
+## Live terminal sessions come from the threaded routes or the async server, whichever
+## is running; each source returns its sessions (anything with bytes_in/bytes_out)
+terminal_sources = []
+
+def add_terminal_source(source):
+    terminal_sources.append(source)
+
+## Only the number of open sessions: per-terminal series would expose user ids and grow
+## without bound. Terminal traffic totals come from stream_stats (terminal_stream_bytes_*_total).
+def collect_terminals():
+    sessions = [terminal for source in terminal_sources for terminal in source() if not terminal.closed]
+    return sample_lines("terminal_sessions", "Open terminal sessions", len(sessions))
+
+add_collector(collect_terminals)
+
+def render():
+    lines = []
+    for hist in histograms:
+        lines += hist.render()
+    for collector in collectors:
+        try:
+            lines += collector()
+        except Exception as e:
+            print(f"Metrics collector error: {e}")
+    return "\n".join(lines) + "\n"
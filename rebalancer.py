@@ -0,0 +1,130 @@
+import concurrent.futures
+import os
+import threading
+import time
+import docker
+from allocator import demand_allocator, CPU_PERIOD, USER_MEMORY_BYTES, USER_CPUS
+
+REBALANCE_DELAY = float(os.getenv("REBALANCE_DELAY_MS", "500")) / 1000
+## even  - split each user's allowance evenly across their running containers
+## demand - split it by recent usage from the stats sampler (see allocator.py)
+ALLOCATION = os.getenv("RESOURCE_ALLOCATION", "demand")
+
+## Splits each user's memory and CPU allowance across their running containers.
+## Lifecycle calls just schedule() the user and return; a burst of creates/starts/stops
+## for one user is merged into a single pass REBALANCE_DELAY after the last of them.
+## A pass reads containers and their current limits from the container index (kept
+## fresh by Docker events), and only updates the containers whose limits differ,
+## all at once on the Docker executor.
+class container_rebalancer:
+    def __init__(self, manager, sampler=None, delay=REBALANCE_DELAY, allocation=ALLOCATION):
+        self.manager = manager
+        self.sampler = sampler
+        self.delay = delay
+        self.allocation = allocation
+        self.allocator = demand_allocator()
+        self.pending = {}     # user_id -> due time
+        self.cond = threading.Condition()
+        self.passes = 0
+        self.coalesced = 0
+        self.updates = 0
+        self.unchanged = 0
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def schedule_users(self, user_ids):
+        for user_id in user_ids:
+            self.schedule(user_id)
+
+    def schedule(self, user_id: str):
+        with self.cond:
+            if user_id in self.pending:
+                self.coalesced += 1
+            self.pending[user_id] = time.monotonic() + self.delay
+            self.cond.notify()
+
+    def run(self):
+        while True:
+            with self.cond:
+                now = time.monotonic()
+                due = [user_id for user_id, at in self.pending.items() if at <= now]
+                if not due:
+                    self.cond.wait(min(self.pending.values()) - now if self.pending else None)
+                    continue
+                for user_id in due:
+                    del self.pending[user_id]
+            for user_id in due:
+                try:
+                    self.rebalance(user_id)
+                except Exception as e:
+                    print(f"Rebalance error for {user_id}: {e}")
+
+    def running_containers(self, user_id: str):
+        if self.manager.index.loaded.is_set():
+            containers = self.manager.index.containers_for_user(user_id)
+        else:
+            containers = self.manager.list_user_containers(user_id, all=False)
+        return [c for c in containers if c.attrs.get("State", {}).get("Status", c.status) == "running"]
+
+    ## container id -> limits
+    def targets(self, containers):
+        if self.allocation == "demand" and self.sampler:
+            container_ids = [c.id for c in containers]
+            current = {c.id: self.current(c) for c in containers}
+            return self.allocator.allocate(container_ids, self.sampler.usage(container_ids), current)
+
+        count = len(containers)
+        even = {
+            "mem_limit": int(USER_MEMORY_BYTES / count),
+            "cpu_period": CPU_PERIOD,
+            "cpu_quota": int(CPU_PERIOD * USER_CPUS / count),
+        }
+        return {c.id: even for c in containers}
+
+    def current(self, container):
+        host_config = container.attrs.get("HostConfig", {})
+        return {
+            "mem_limit": host_config.get("Memory"),
+            "cpu_period": host_config.get("CpuPeriod"),
+            "cpu_quota": host_config.get("CpuQuota"),
+        }
+
+    def rebalance(self, user_id: str):
+        containers = self.running_containers(user_id)
+        self.passes += 1
+        if not containers:
+            return
+
+        targets = self.targets(containers)
+        changed = [c for c in containers if self.current(c) != targets[c.id]]
+        self.unchanged += len(containers) - len(changed)
+
+        futures = {
+            self.manager.executor.submit("fast", "update", self.update, container, targets[container.id]): container
+            for container in changed
+        }
+        for future in concurrent.futures.as_completed(futures):
+            container = futures[future]
+            target = targets[container.id]
+            try:
+                future.result()
+                self.updates += 1
+                print(f"Updated {container.name} to {target['mem_limit']} bytes, {target['cpu_quota']}/{target['cpu_period']} CPU")
+            except docker.errors.APIError as e:
+                print(f"Could not update {container.name}: {e.explanation}")
+
+    ## Also patch the cached attrs, so a pass before the index sees the update event doesn't redo it
+    def update(self, container, target):
+        container.update(**target)
+        container.attrs.setdefault("HostConfig", {}).update(
+            Memory=target["mem_limit"], CpuPeriod=target["cpu_period"], CpuQuota=target["cpu_quota"]
+        )
+
+    def stats(self):
+        with self.cond:
+            return {
+                "pending": len(self.pending),
+                "passes": self.passes,
+                "coalesced": self.coalesced,
+                "updates": self.updates,
+                "unchanged": self.unchanged,
+            }
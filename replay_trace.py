@@ -0,0 +1,87 @@
+## Replays a stats trace recorded with STATS_TRACE_FILE through the allocator and reports
+## how it would have done against the even split: how many limit updates it makes, how
+## much CPU demand goes over the quota, and how many samples would have hit their memory limit.
+##
+##   python replay_trace.py stats.jsonl [--interval 10] [--window 60]
+import argparse
+import collections
+import json
+from allocator import demand_allocator, CPU_PERIOD, USER_MEMORY_BYTES, USER_CPUS
+from container_stats import usage_window
+
+def load_trace(path):
+    samples = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                samples.append(json.loads(line))
+    samples.sort(key=lambda sample: sample["t"])
+    return samples
+
+def even_limits(container_ids):
+    count = len(container_ids)
+    return {
+        container_id: {
+            "mem_limit": int(USER_MEMORY_BYTES / count),
+            "cpu_quota": int(CPU_PERIOD * USER_CPUS / count),
+            "cpu_period": CPU_PERIOD,
+        }
+        for container_id in container_ids
+    }
+
+def replay(samples, interval, window, policy):
+    allocator = demand_allocator()
+    windows = collections.defaultdict(lambda: usage_window(window))
+    users = collections.defaultdict(set)
+    limits = {}
+    result = {"updates": 0, "cpu_demand": 0.0, "cpu_over_quota": 0.0, "memory_hits": 0, "samples": 0}
+    next_pass = samples[0]["t"] if samples else 0
+
+    for sample in samples:
+        ## Allocation passes happen every interval, using only what was seen before them
+        while sample["t"] >= next_pass:
+            for user_id, container_ids in users.items():
+                container_ids = sorted(container_ids)
+                if policy == "even":
+                    targets = even_limits(container_ids)
+                else:
+                    usage = {c: windows[c].summary() for c in container_ids if windows[c].count}
+                    targets = allocator.allocate(container_ids, usage, limits)
+                for container_id, target in targets.items():
+                    if limits.get(container_id) != target:
+                        result["updates"] += 1
+                        limits[container_id] = target
+            next_pass += interval
+
+        container_id = sample["container"]
+        users[sample["user"]].add(container_id)
+        windows[container_id].add(sample["t"], sample["cpu"], sample["memory"])
+
+        limit = limits.get(container_id)
+        if limit:
+            demand = sample["cpu"] * CPU_PERIOD
+            result["samples"] += 1
+            result["cpu_demand"] += demand
+            result["cpu_over_quota"] += max(0.0, demand - limit["cpu_quota"])
+            if sample["memory"] >= limit["mem_limit"]:
+                result["memory_hits"] += 1
+
+    result["cpu_over_quota_pct"] = round(100 * result["cpu_over_quota"] / result["cpu_demand"], 2) if result["cpu_demand"] else 0.0
+    del result["cpu_demand"], result["cpu_over_quota"]
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a container stats trace through the allocator.")
+    parser.add_argument("trace")
+    parser.add_argument("--interval", type=float, default=10, help="seconds between allocation passes")
+    parser.add_argument("--window", type=int, default=60, help="samples kept per container")
+    args = parser.parse_args()
+
+    samples = load_trace(args.trace)
+    print(f"{len(samples)} samples from {len({s['container'] for s in samples})} containers")
+    for policy in ("even", "demand"):
+        print(f"{policy:>6}: {replay(samples, args.interval, args.window, policy)}")
+
+if __name__ == "__main__":
+    main()
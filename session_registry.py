@@ -0,0 +1,248 @@
+import json
+import os
+import socket
+import threading
+import time
+
+## Identifies this process among the workers sharing a registry
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+## "" keeps everything in-process; redis://host:port/db shares it between workers and hosts
+REGISTRY_URL = os.getenv("SESSION_REGISTRY", "")
+HEARTBEAT_TTL = int(os.getenv("SESSION_REGISTRY_TTL", "15"))
+## Seconds another worker's ownership of a session is trusted before asking the registry again
+OWNER_CACHE_TTL = float(os.getenv("SESSION_OWNER_CACHE_TTL", "5"))
+
+## Which worker owns each terminal session, plus a channel per worker for forwarding
+## terminal events to it. A terminal's exec socket lives in the process that opened it,
+## so any other worker that receives an event for it publishes the event to the owner.
+## publish(None, ...) goes to every worker.
+##
+## The local registry does all of this in one process; several workers (e.g. in a test)
+## can share one instance.
+class local_session_registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.owners = {}
+        self.subscribers = {}
+        self.last_activity = {}
+        self.hibernated_as = {}
+        self.forwarded = 0
+
+    def claim(self, key, worker_id):
+        with self.lock:
+            self.owners[key] = worker_id
+
+    def release(self, key, worker_id):
+        with self.lock:
+            if self.owners.get(key) == worker_id:
+                del self.owners[key]
+
+    def owner(self, key):
+        with self.lock:
+            return self.owners.get(key)
+
+    def alive(self, worker_id):
+        with self.lock:
+            return worker_id in self.subscribers
+
+    def subscribe(self, worker_id, callback):
+        with self.lock:
+            self.subscribers[worker_id] = callback
+
+    def publish(self, worker_id, message):
+        with self.lock:
+            targets = list(self.subscribers.values()) if worker_id is None else [self.subscribers.get(worker_id)]
+            self.forwarded += 1
+        for callback in targets:
+            if callback:
+                callback(message)
+
+    ## {(user_id, container_name): wall-clock time}, keeping the latest per key
+    def record_activity(self, activity):
+        with self.lock:
+            for key, at in activity.items():
+                self.last_activity[key] = max(at, self.last_activity.get(key, 0))
+
+    def activity(self):
+        with self.lock:
+            return dict(self.last_activity)
+
+    ## What the hibernating process did to a container ("pause"/"stop"), so any worker can resume it
+    def mark_hibernated(self, key, action):
+        with self.lock:
+            if action:
+                self.hibernated_as[key] = action
+            else:
+                self.hibernated_as.pop(key, None)
+
+    def hibernated(self, key):
+        with self.lock:
+            return self.hibernated_as.get(key)
+
+    def stats(self):
+        with self.lock:
+            return {"sessions": len(self.owners), "workers": len(self.subscribers), "forwarded": self.forwarded}
+
+
+## Same thing on redis: ownership in a hash, liveness as a key each worker keeps
+## refreshing, and forwarding over pub/sub
+class redis_session_registry:
+    def __init__(self, url, ttl=HEARTBEAT_TTL):
+        import redis
+        self.redis = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = "glitched:"
+        self.forwarded = 0
+        self.pubsub = None
+
+    def field(self, key):
+        return json.dumps(list(key))
+
+    def claim(self, key, worker_id):
+        self.redis.hset(self.prefix + "terminals", self.field(key), worker_id)
+
+    def release(self, key, worker_id):
+        if self.owner(key) == worker_id:
+            self.redis.hdel(self.prefix + "terminals", self.field(key))
+
+    def owner(self, key):
+        owner = self.redis.hget(self.prefix + "terminals", self.field(key))
+        return owner.decode() if owner else None
+
+    def alive(self, worker_id):
+        return bool(self.redis.exists(f"{self.prefix}worker:{worker_id}"))
+
+    def heartbeat(self, worker_id):
+        while True:
+            try:
+                self.redis.set(f"{self.prefix}worker:{worker_id}", "1", ex=self.ttl)
+            except Exception as e:
+                print(f"Session registry heartbeat error: {e}")
+            time.sleep(self.ttl / 3)
+
+    def subscribe(self, worker_id, callback):
+        def handle(message):
+            try:
+                callback(json.loads(message["data"]))
+            except Exception as e:
+                print(f"Session registry message error: {e}")
+
+        threading.Thread(target=self.heartbeat, args=(worker_id,), daemon=True).start()
+        self.pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe(**{
+            f"{self.prefix}events:{worker_id}": handle,
+            f"{self.prefix}events:all": handle,
+        })
+        self.pubsub.run_in_thread(sleep_time=1, daemon=True)
+
+    def publish(self, worker_id, message):
+        self.forwarded += 1
+        self.redis.publish(f"{self.prefix}events:{worker_id or 'all'}", json.dumps(message))
+
+    ## A sorted set scored by time; GT keeps the latest time when workers report the same key
+    def record_activity(self, activity):
+        if not activity:
+            return
+        pipe = self.redis.pipeline()
+        pipe.zadd(self.prefix + "activity", {self.field(key): at for key, at in activity.items()}, gt=True)
+        pipe.zremrangebyscore(self.prefix + "activity", 0, time.time() - 86400)
+        pipe.execute()
+
+    def activity(self):
+        return {
+            tuple(json.loads(member)): score
+            for member, score in self.redis.zrange(self.prefix + "activity", 0, -1, withscores=True)
+        }
+
+    def mark_hibernated(self, key, action):
+        if action:
+            self.redis.hset(self.prefix + "hibernated", self.field(key), action)
+        else:
+            self.redis.hdel(self.prefix + "hibernated", self.field(key))
+
+    def hibernated(self, key):
+        action = self.redis.hget(self.prefix + "hibernated", self.field(key))
+        return action.decode() if action else None
+
+    def stats(self):
+        return {
+            "sessions": self.redis.hlen(self.prefix + "terminals"),
+            "forwarded": self.forwarded,
+        }
+
+
+## Runs terminal events on this worker or forwards them to the worker that owns the
+## session. Ownership is cached, so a keystroke for a session this worker owns never
+## asks the registry, and one owned elsewhere only does every OWNER_CACHE_TTL seconds
+## (then the owner's liveness is checked too, so a dead worker's sessions come back here).
+## handlers maps event -> handler(user_id, sid, data); forwarded events arrive there too.
+class terminal_router:
+    def __init__(self, registry, worker_id, handlers, ttl=OWNER_CACHE_TTL):
+        self.registry = registry
+        self.worker_id = worker_id
+        self.handlers = handlers
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.owners = {}      # key -> (worker_id, checked_at)
+        self.lookups = 0
+        self.forwarded = 0
+        registry.subscribe(worker_id, self.on_forwarded)
+
+    def claim(self, key):
+        self.registry.claim(key, self.worker_id)
+        with self.lock:
+            self.owners[key] = (self.worker_id, time.monotonic())
+
+    def release(self, key):
+        self.registry.release(key, self.worker_id)
+        with self.lock:
+            self.owners.pop(key, None)
+
+    ## The live worker owning key, or None
+    def owner(self, key):
+        now = time.monotonic()
+        with self.lock:
+            cached = self.owners.get(key)
+        if cached and (cached[0] == self.worker_id or now - cached[1] < self.ttl):
+            return cached[0]
+
+        owner = self.registry.owner(key)
+        if owner and owner != self.worker_id and not self.registry.alive(owner):
+            owner = None
+        with self.lock:
+            self.lookups += 1
+            if owner:
+                self.owners[key] = (owner, now)
+            else:
+                self.owners.pop(key, None)
+        return owner
+
+    ## If the owner is gone its exec socket went with it, so the handler here reopens the session
+    def dispatch(self, event, user_id, sid, data):
+        key = (user_id, data.get("container_name"), data.get("tab_id"))
+        owner = self.owner(key)
+        if owner and owner != self.worker_id:
+            with self.lock:
+                self.forwarded += 1
+            self.registry.publish(owner, {"event": event, "user_id": user_id, "sid": sid, "data": data})
+        else:
+            self.handlers[event](user_id, sid, data)
+
+    ## Run event on every worker, this one included
+    def broadcast(self, event, user_id, sid, data):
+        self.registry.publish(None, {"event": event, "user_id": user_id, "sid": sid, "data": data})
+
+    def on_forwarded(self, message):
+        handler = self.handlers.get(message["event"])
+        if handler:
+            handler(message["user_id"], message["sid"], message["data"])
+
+    def stats(self):
+        with self.lock:
+            return {"cached_owners": len(self.owners), "lookups": self.lookups, "forwarded": self.forwarded}
+
+
+def make_session_registry(url=REGISTRY_URL):
+    if url.startswith("redis://") or url.startswith("rediss://"):
+        return redis_session_registry(url)
+    return local_session_registry()
@@ -1,14 +1,35 @@
 from flask import session, request
 from flask_socketio import disconnect
+import concurrent.futures
+import os
 import threading
-import select
+import time
 import docker
-import base64
-
+from terminal_reactor import reactor_pool
+from terminal_session import terminal_session, stream_stats, ORPHAN_TIMEOUT
+from write_behind import write_behind_buffer
+from file_documents import document_store, document_mismatch, content_hash
+from file_watcher import file_tree_watcher
+from docker_executor import operation_timeout
+from status_push import container_status_push
+from session_registry import make_session_registry, terminal_router, WORKER_ID
+import metrics
+from metrics import timed_on
+
+## (user_id, container_name, tab_id) -> terminal_session
 terminal_sessions = {}
+## (user_id, container_name, tab_id) -> Future of a terminal being opened
+opening = {}
+sessions_lock = threading.Lock()
+reactors = None
+registry = None
 
 def register_socket_routes(socketio, docker_mgr):
-    @socketio.on("connect")
+    global reactors, registry
+    reactors = reactor_pool(int(os.getenv("TERMINAL_REACTORS", "1")))
+    registry = make_session_registry()
+
+    @timed_on(socketio, "connect")
     def on_connect():
         user_id = session.get("user_id")
         if user_id:
@@ -17,104 +38,168 @@ def register_socket_routes(socketio, docker_mgr):
             print("Unauthenticated user tried to connect, disconnecting.")
             disconnect()
 
-    @socketio.on("disconnect")
+    @timed_on(socketio, "disconnect")
     def on_disconnect():
         print("User disconnected")
 
-    @socketio.on("request_devices")
+    status_push = container_status_push(docker_mgr, socketio.emit)
+
+    ## Subscribe this client to container_status / container_stats pushes for its containers
+    @timed_on(socketio, "watch_devices")
+    def handle_watch_devices(data):
+        user_id = session.get("user_id")
+        if not user_id:
+            return
+        socketio.server.enter_room(request.sid, status_push.room(user_id))
+        status_push.watch(user_id, request.sid)
+
+    @timed_on(socketio, "request_devices")
     def request_devices(data):
         user_id = session.get("user_id")
         if not user_id:
             return {"result": "error", "message": "User not authenticated"}
         return docker_mgr.get_containers_by_user(user_id)
 
-    @socketio.on("create_container")
+    ## Container lifecycle calls can take a long time (an image pull, a stop waiting out its
+    ## grace period), so they run on the executor's slow pool. The ack only says the action
+    ## was queued; the outcome arrives later as container_action_result.
+    def queue_container_action(action, container_name, fn, *args):
+        sid = request.sid
+
+        def done(result, error):
+            if error is not None:
+                result = {"result": "error", "message": f"Could not {action} '{container_name}': {error}"}
+            socketio.emit("container_action_result", dict(result, action=action, container_name=container_name), to=sid)
+
+        docker_mgr.executor.submit("slow", action, fn, *args, callback=done)
+        return {"result": "queued", "action": action, "container_name": container_name}
+
+    @timed_on(socketio, "create_container")
     def create_container(data):
         user_id = session.get("user_id")
         if not user_id:
             return {"result": "error", "message": "User not authenticated"}
-        return docker_mgr.create_container(
+        return queue_container_action(
+            "create",
+            data.get("container_name"),
+            docker_mgr.create_container,
             data.get("os_image"),
             user_id,
             data.get("container_name"),
             data.get("template_type"),
         )
 
-    @socketio.on("start_container")
+    @timed_on(socketio, "start_container")
     def start_container(data):
         user_id = session.get("user_id")
         if not user_id:
             return {"result": "error", "message": "User not authenticated"}
-        return docker_mgr.start_container_by_name(user_id, data.get("container_name"))
+        return queue_container_action("start", data.get("container_name"), docker_mgr.start_container_by_name, user_id, data.get("container_name"))
 
-    @socketio.on("stop_container")
+    @timed_on(socketio, "stop_container")
     def stop_container(data):
         user_id = session.get("user_id")
         if not user_id:
             return {"result": "error", "message": "User not authenticated"}
-        return docker_mgr.stop_container_by_name(user_id, data.get("container_name"))
+        return queue_container_action("stop", data.get("container_name"), docker_mgr.stop_container_by_name, user_id, data.get("container_name"))
 
-    @socketio.on("delete_container")
+    @timed_on(socketio, "delete_container")
     def delete_container(data):
         user_id = session.get("user_id")
         if not user_id:
             return {"result": "error", "message": "User not authenticated"}
-        return docker_mgr.delete_container_by_name(user_id, data.get("container_name"))
+        return queue_container_action("delete", data.get("container_name"), docker_mgr.delete_container_by_name, user_id, data.get("container_name"))
 
+    ## File operations (execs and archive transfers) run on the executor's fast pool,
+    ## and come back as an error result instead of hanging if they time out
+    def docker_call(op, fn, *args):
+        try:
+            return docker_mgr.executor.run("fast", op, fn, *args)
+        except operation_timeout as e:
+            return {"error": str(e)}
+
+
+    ## Get the live exec session for this tab, starting a new shell if there isn't one.
+    ## The Docker calls run outside sessions_lock; concurrent opens of the same tab wait
+    ## on the first one's future instead of starting a second shell.
+    def open_terminal(user_id, container_name, tab_id):
+        key = (user_id, container_name, tab_id)
+        with sessions_lock:
+            terminal = terminal_sessions.get(key)
+            if terminal and not terminal.closed:
+                return terminal
+            pending = opening.get(key)
+            if pending is None:
+                pending = opening[key] = concurrent.futures.Future()
+                leader = True
+            else:
+                leader = False
+        if not leader:
+            return pending.result()
 
-    @socketio.on('terminal_input')
-    def handle_terminal_input(data):
-        user_id = session.get("user_id")
+        try:
+            terminal = start_terminal(user_id, container_name, tab_id)
+        except Exception as e:
+            with sessions_lock:
+                opening.pop(key, None)
+            pending.set_exception(e)
+            raise
+        with sessions_lock:
+            terminal_sessions[key] = terminal
+            opening.pop(key, None)
+        router.claim(key)
+        pending.set_result(terminal)
+        return terminal
+
+    def start_terminal(user_id, container_name, tab_id):
+        container = docker_mgr.find_container_by_logical_name(user_id, container_name)
+        if not container:
+            raise Exception("Container not found.")
+
+        exec_id = container.client.api.exec_create(
+            container.id,
+            cmd="/bin/bash",
+            tty=True,
+            stdin=True,
+            user=user_id,
+            workdir=f"/home/{user_id}"
+        )["Id"]
+
+        sock = container.client.api.exec_start(
+            exec_id,
+            tty=True,
+            stream=False,
+            detach=False,
+            socket=True
+        )._sock
+
+        terminal = terminal_session(sock, user_id, container_name, tab_id, socketio.emit)
+        terminal.attach(reactors)
+        return terminal
+
+    ## The terminal handlers below run on the worker that owns the session's exec socket.
+    ## They take the user and sid explicitly, since a forwarded event has no request context.
+    def terminal_attach(user_id, sid, data):
+        tab_id = data.get("tab_id")
+        try:
+            open_terminal(user_id, data.get("container_name"), tab_id).attach_client(sid)
+        except Exception as e:
+            print(f"Terminal setup error: {e}")
+            socketio.emit("terminal_output", {
+                "output": f"Terminal setup error: {str(e)}",
+                "tab_id": tab_id
+            }, to=sid)
+
+    def terminal_input(user_id, sid, data):
         container_name = data.get("container_name")
         tab_id = data.get("tab_id")
         input_data = data.get("input")
-        sid = request.sid
-        session_key = f"{sid}:{tab_id}"
-
-        container = docker_mgr.find_container_by_logical_name(user_id, container_name)
-        if not container:
-            socketio.emit('terminal_output', {'output': 'Error: Container not found.'}, to=sid)
-            return
 
-        if session_key not in terminal_sessions:
+        terminal = terminal_sessions.get((user_id, container_name, tab_id))
+        if not terminal or terminal.closed:
             try:
-                exec_id = docker_mgr.api_client.exec_create(
-                    container.id,
-                    cmd="/bin/bash",
-                    tty=True,
-                    stdin=True,
-                    user=user_id,
-                    workdir=f"/home/{user_id}"
-                )["Id"]
-
-
-                sock = docker_mgr.api_client.exec_start(
-                    exec_id,
-                    tty=True,
-                    stream=False,
-                    detach=False,
-                    socket=True
-                )._sock
-
-                terminal_sessions[session_key] = sock
-
-                def stream_output(sock, sid, tab_id):
-                    try:
-                        while True:
-                            rlist, _, _ = select.select([sock], [], [], 0.1)
-                            if rlist:
-                                output = sock.recv(1024)
-                                if not output:
-                                    break
-                                socketio.emit("terminal_output", {
-                                    "output": output.decode(errors="ignore"),
-                                    "tab_id": tab_id
-                                }, to=sid)
-                    except Exception as e:
-                        print(f"Stream error: {e}")
-
-                threading.Thread(target=stream_output, args=(sock, sid, tab_id), daemon=True).start()
-
+                terminal = open_terminal(user_id, container_name, tab_id)
+                terminal.attach_client(sid)
             except Exception as e:
                 print(f"Terminal setup error: {e}")
                 socketio.emit("terminal_output", {
@@ -124,7 +209,7 @@ def register_socket_routes(socketio, docker_mgr):
                 return
 
         try:
-            terminal_sessions[session_key].send(input_data.encode())
+            terminal.send(input_data.encode())
         except Exception as e:
             print(f"Send error: {e}")
             socketio.emit("terminal_output", {
@@ -132,39 +217,178 @@ def register_socket_routes(socketio, docker_mgr):
                 "tab_id": tab_id
             }, to=sid)
 
-    @socketio.on('disconnect')
+    def terminal_ack(user_id, sid, data):
+        terminal = terminal_sessions.get((user_id, data.get("container_name"), data.get("tab_id")))
+        if terminal and terminal.sid == sid:
+            terminal.ack(int(data.get("size", 0)))
+
+    def terminal_close(user_id, sid, data):
+        key = (user_id, data.get("container_name"), data.get("tab_id"))
+        with sessions_lock:
+            terminal = terminal_sessions.pop(key, None)
+        if terminal:
+            terminal.close()
+            router.release(key)
+
+    def detach_sid(user_id, sid, data):
+        for terminal in list(terminal_sessions.values()):
+            if terminal.sid == sid:
+                terminal.detach_client(sid)
+
+    router = terminal_router(registry, WORKER_ID, {
+        "terminal_attach": terminal_attach,
+        "terminal_input": terminal_input,
+        "terminal_ack": terminal_ack,
+        "terminal_close": terminal_close,
+        "detach_sid": detach_sid,
+    })
+
+    ## Run a terminal event here, or forward it to the live worker that owns the session
+    def dispatch_terminal(event, data):
+        user_id = session.get("user_id")
+        if not user_id:
+            return
+        if event in ("terminal_attach", "terminal_input"):
+            docker_mgr.idle.touch(user_id, data.get("container_name"))
+        router.dispatch(event, user_id, request.sid, data)
+
+    @timed_on(socketio, "terminal_attach")
+    def handle_terminal_attach(data):
+        dispatch_terminal("terminal_attach", data)
+
+    @timed_on(socketio, 'terminal_input')
+    def handle_terminal_input(data):
+        dispatch_terminal("terminal_input", data)
+        ## A command was probably just run, so look for file changes soon
+        if "\r" in (data.get("input") or ""):
+            file_watcher.nudge(session.get("user_id"), data.get("container_name"))
+
+    @timed_on(socketio, "terminal_ack")
+    def handle_terminal_ack(data):
+        dispatch_terminal("terminal_ack", data)
+
+    @timed_on(socketio, "terminal_close")
+    def handle_terminal_close(data):
+        dispatch_terminal("terminal_close", data)
+
+    @timed_on(socketio, 'disconnect')
     def handle_disconnect():
         sid = request.sid
-        print(f"Client {sid} disconnected. Cleaning up terminals.")
-        for key in list(terminal_sessions.keys()):
-            if key.startswith(f"{sid}:"):
-                try:
-                    terminal_sessions[key].close()
-                except Exception:
-                    pass
-                del terminal_sessions[key]
-
-    @socketio.on("list_files")
+        print(f"Client {sid} disconnected. Detaching terminals.")
+        ## Terminals this client had open on other workers are detached there
+        router.broadcast("detach_sid", None, sid, None)
+        write_behind.flush_sid(sid)
+        file_watcher.unwatch(sid)
+        status_push.unwatch(sid)
+
+    ## Close sessions nobody has reattached to within TERMINAL_ORPHAN_TIMEOUT
+    def reap_orphaned_sessions():
+        while True:
+            time.sleep(10)
+            now = time.monotonic()
+            with sessions_lock:
+                for key, terminal in list(terminal_sessions.items()):
+                    if terminal.closed or terminal.orphaned_for(now) > ORPHAN_TIMEOUT:
+                        del terminal_sessions[key]
+                        terminal.close()
+                        router.release(key)
+
+    threading.Thread(target=reap_orphaned_sessions, daemon=True).start()
+
+    ## Terminal output and input both count as activity for the idle monitor
+    docker_mgr.idle.add_activity_source(lambda: {
+        (terminal.user_id, terminal.container_name): terminal.last_activity
+        for terminal in list(terminal_sessions.values())
+    })
+    ## The process that hibernates containers may not be this one
+    docker_mgr.idle.share(registry)
+
+    ## Tell the editor which version of the file is now durable in the container
+    def on_file_flushed(key, entry, error):
+        _, _, file_path = key
+        if error:
+            socketio.emit("file_edit_error", {
+                "error": str(error),
+                "file_path": file_path,
+                "version": entry["version"]
+            }, to=entry["sid"])
+        else:
+            socketio.emit("file_saved", {
+                "file_path": file_path,
+                "version": entry["version"]
+            }, to=entry["sid"])
+
+    write_behind = write_behind_buffer(docker_mgr.write_file, on_file_flushed, executor=docker_mgr.executor)
+    documents = document_store()
+    ## Only running containers are polled, and polling never wakes one: an open tab isn't
+    ## use, and whichever process hibernated the container may not be this one
+    def watch_snapshot(user_id, container_name):
+        container = docker_mgr.index.get(user_id, container_name)
+        if not container or container.attrs.get("State", {}).get("Status", container.status) != "running":
+            return {"error": "Container is not running."}
+        return docker_mgr.list_files(user_id, container_name, wake=False)
+
+    ## Snapshots run as fast-pool jobs of their own, so watch_snapshot calls Docker directly
+    file_watcher = file_tree_watcher(watch_snapshot, socketio.emit, executor=docker_mgr.executor)
+
+    @timed_on(socketio, "list_files")
     def list_files(data):
         user_id = session.get("user_id")
         container_name = data.get("container_name")
         sid = request.sid
 
-        socketio.emit("file_list", docker_mgr.list_files(user_id, container_name), to=sid)
+        socketio.emit("file_list", docker_call("list_files", docker_mgr.list_files, user_id, container_name), to=sid)
+
+    ## Subscribe this client to file_tree_delta pushes for a workspace and send the current listing
+    @timed_on(socketio, "watch_files")
+    def handle_watch_files(data):
+        user_id = session.get("user_id")
+        container_name = data.get("container_name")
+        sid = request.sid
+        if not user_id or not container_name:
+            return
+
+        socketio.server.enter_room(sid, file_watcher.room(user_id, container_name))
+        entries = file_watcher.watch(user_id, container_name, sid)
+        if entries is not None:
+            socketio.emit("file_list", {"entries": entries, "container_name": container_name}, to=sid)
+            return
+
+        result = docker_call("list_files", docker_mgr.list_files, user_id, container_name)
+        if not result.get("error"):
+            file_watcher.seed(user_id, container_name, result["entries"])
+        socketio.emit("file_list", result, to=sid)
+
+    ## Lazily list a directory the sidebar expanded past the initial depth limit
+    @timed_on(socketio, "list_tree")
+    def handle_list_tree(data):
+        user_id = session.get("user_id")
+        container_name = data.get("container_name")
+        if not user_id:
+            return
+        result = docker_call("list_tree", docker_mgr.list_tree, user_id, container_name, data.get("path", ""))
+        socketio.emit("file_tree", result, to=request.sid)
 
-    @socketio.on("read_file")
+    @timed_on(socketio, "read_file")
     def read_file(data):
         user_id = session.get("user_id")
         container_name = data.get("container_name")
+        docker_mgr.idle.touch(user_id, container_name)
         file_path = data.get("file_path")
         sid = request.sid
 
-        socketio.emit("file_content", docker_mgr.read_file(user_id, container_name, file_path), to=sid)
+        write_behind.flush(user_id, container_name, file_path)
+        result = docker_call("read_file", docker_mgr.read_file, user_id, container_name, file_path)
+        if not result.get("error"):
+            documents.load((user_id, container_name, file_path), result["content"])
+            result["hash"] = content_hash(result["content"])
+        socketio.emit("file_content", result, to=sid)
 
-    @socketio.on("file_edit")
+    @timed_on(socketio, "file_edit")
     def handle_file_edit(data):
         user_id = session.get("user_id")
         container_name = data.get("container_name")
+        docker_mgr.idle.touch(user_id, container_name)
         file_path = data.get("file_path")
         content = data.get("content")
         sid = request.sid
@@ -177,61 +401,103 @@ def register_socket_routes(socketio, docker_mgr):
             socketio.emit("file_edit_error", {"error": "Missing required data."}, to=sid)
             return
 
-        try:
-            docker_mgr.write_file(user_id, container_name, file_path, content)
-            # Optional: confirm success to the client
-            socketio.emit("file_saved", {"file_path": file_path}, to=sid)
-        except Exception as e:
-            socketio.emit("file_edit_error", {
-                "error": str(e),
-                "file_path": file_path
-            }, to=sid)
+        version = data.get("version")
+        documents.load((user_id, container_name, file_path), content, version, on_change=lambda text:
+            write_behind.submit(user_id, container_name, file_path, text, version, sid))
 
-    @socketio.on("download_file")
-    def handle_download_file(data):
+    ## Apply a small patch to our copy of the file instead of receiving the whole thing.
+    ## If our copy doesn't match what the editor based its edits on, ask for the full text.
+    @timed_on(socketio, "file_patch")
+    def handle_file_patch(data):
         user_id = session.get("user_id")
         container_name = data.get("container_name")
+        docker_mgr.idle.touch(user_id, container_name)
         file_path = data.get("file_path")
+        version = data.get("version")
         sid = request.sid
 
         if not user_id or not container_name or not file_path:
-            socketio.emit("download_error", {
-                "file_path": file_path,
-                "error": "Missing required fields or not authenticated."
-            }, to=sid)
+            socketio.emit("file_edit_error", {"error": "Missing required data."}, to=sid)
             return
 
+        key = (user_id, container_name, file_path)
+        if key not in documents:
+            write_behind.flush(user_id, container_name, file_path)
+            result = docker_call("read_file", docker_mgr.read_file, user_id, container_name, file_path)
+            if not result.get("error"):
+                documents.load(key, result["content"])
+
+        ## Submitted under the document lock, so two racing patches reach the buffer in order
         try:
-            # Use your existing Docker manager to read file contents
-            result = docker_mgr.read_file(user_id, container_name, file_path)
+            documents.apply(key, data.get("base_hash"), data.get("edits", []), data.get("hash"), version,
+                on_change=lambda text: write_behind.submit(user_id, container_name, file_path, text, version, sid))
+        except (document_mismatch, KeyError, TypeError, ValueError) as e:
+            print(f"Patch for {file_path} rejected: {e}")
+            socketio.emit("file_resync_required", {"file_path": file_path}, to=sid)
+
+    @timed_on(socketio, "file_save")
+    def handle_file_save(data):
+        user_id = session.get("user_id")
+        container_name = data.get("container_name")
+        docker_mgr.idle.touch(user_id, container_name)
+        file_path = data.get("file_path")
+        if not user_id:
+            return
 
-            if result.get("error"):
-                socketio.emit("download_error", {
-                    "file_path": file_path,
-                    "error": result["error"]
-                }, to=sid)
-                return
+        ## A finished write (or failed one) was already reported by on_file_flushed, and nothing
+        ## buffered means the last flush made this version durable. A timeout is not saved yet.
+        flushed, error = write_behind.flush(user_id, container_name, file_path)
+        if isinstance(error, operation_timeout):
+            socketio.emit("file_edit_error", {
+                "error": "Save is taking longer than expected; it will be reported when it finishes.",
+                "file_path": file_path,
+                "version": data.get("version")
+            }, to=request.sid)
+        elif not flushed and not error:
+            socketio.emit("file_saved", {
+                "file_path": file_path,
+                "version": data.get("version")
+            }, to=request.sid)
 
-            # Encode file content as base64 to safely send binary data over socket
-            content = result.get("content", "")
-            encoded_content = base64.b64encode(content.encode("latin1")).decode("ascii")
+    ## Many reads/writes/deletes/mkdirs/moves in one go, answered with per-operation
+    ## results and a single fresh listing
+    @timed_on(socketio, "batch_file_ops")
+    def handle_batch_file_ops(data):
+        user_id = session.get("user_id")
+        container_name = data.get("container_name")
+        docker_mgr.idle.touch(user_id, container_name)
+        ops = data.get("ops")
+        sid = request.sid
 
-            socketio.emit("download_file_response", {
-                "file_path": file_path,
-                "filename": file_path.split("/")[-1],
-                "content": encoded_content
+        if not user_id or not container_name or not isinstance(ops, list):
+            socketio.emit("batch_file_ops_result", {
+                "error": "Missing required data.",
+                "container_name": container_name
             }, to=sid)
+            return
 
-        except Exception as e:
-            socketio.emit("download_error", {
-                "file_path": file_path,
-                "error": str(e)
-            }, to=sid)
-            
-    @socketio.on("delete_file")
+        ## Buffered editor edits must land before reads, and must not resurrect
+        ## files this batch deletes, moves or overwrites
+        for op in ops:
+            path = op.get("path") if isinstance(op, dict) else None
+            if not isinstance(path, str):
+                continue
+            if op.get("op") == "read":
+                write_behind.flush(user_id, container_name, path)
+            else:
+                write_behind.discard(user_id, container_name, path)
+                documents.forget(user_id, container_name, path)
+
+        result = docker_call("batch_file_ops", docker_mgr.batch_file_ops, user_id, container_name, [op if isinstance(op, dict) else {} for op in ops])
+        socketio.emit("batch_file_ops_result", result, to=sid)
+        if result.get("listing"):
+            file_watcher.update(user_id, container_name, result["listing"])
+
+    @timed_on(socketio, "delete_file")
     def handle_delete_file(data):
         user_id = session.get("user_id")
         container_name = data.get("container_name")
+        docker_mgr.idle.touch(user_id, container_name)
         file_path = data.get("file_path")
         sid = request.sid
 
@@ -243,7 +509,9 @@ def register_socket_routes(socketio, docker_mgr):
             return
 
         try:
-            result = docker_mgr.delete_file(user_id, container_name, file_path)
+            write_behind.discard(user_id, container_name, file_path)
+            documents.forget(user_id, container_name, file_path)
+            result = docker_call("delete_file", docker_mgr.delete_file, user_id, container_name, file_path)
             if result.get("error"):
                 socketio.emit("delete_error", {
                     "file_path": file_path,
@@ -255,8 +523,7 @@ def register_socket_routes(socketio, docker_mgr):
                 "file_path": file_path
             }, to=sid)
 
-            # Optional: Refresh the file list
-            socketio.emit("file_list", docker_mgr.list_files(user_id, container_name), to=sid)
+            file_watcher.nudge(user_id, container_name, delay=0)
 
         except Exception as e:
             socketio.emit("delete_error", {
@@ -264,10 +531,11 @@ def register_socket_routes(socketio, docker_mgr):
                 "error": str(e)
             }, to=sid)
 
-    @socketio.on("create_file")
+    @timed_on(socketio, "create_file")
     def handle_create_file(data):
         user_id = session.get("user_id")
         container_name = data.get("container_name")
+        docker_mgr.idle.touch(user_id, container_name)
         file_path = data.get("file_path")
         sid = request.sid
 
@@ -279,22 +547,23 @@ def register_socket_routes(socketio, docker_mgr):
             return
 
         try:
-            docker_mgr.write_file(user_id, container_name, file_path, "")
+            docker_mgr.executor.run("fast", "write_file", docker_mgr.write_file, user_id, container_name, file_path, "")
+            documents.forget(user_id, container_name, file_path)
             socketio.emit("file_created", {
                 "file_path": file_path
             }, to=sid)
-            # Optionally refresh the file list
-            socketio.emit("file_list", docker_mgr.list_files(user_id, container_name), to=sid)
+            file_watcher.nudge(user_id, container_name, delay=0)
         except Exception as e:
             socketio.emit("file_create_error", {
                 "error": str(e),
                 "file_path": file_path
             }, to=sid)
 
-    @socketio.on("create_folder")
+    @timed_on(socketio, "create_folder")
     def handle_create_folder(data):
         user_id = session.get("user_id")
         container_name = data.get("container_name")
+        docker_mgr.idle.touch(user_id, container_name)
         folder_path = data.get("folder_path")
         sid = request.sid
 
@@ -306,14 +575,34 @@ def register_socket_routes(socketio, docker_mgr):
             return
 
         try:
-            docker_mgr.create_folder(user_id, container_name, folder_path)
+            docker_mgr.executor.run("fast", "create_folder", docker_mgr.create_folder, user_id, container_name, folder_path)
             socketio.emit("folder_created", {
                 "folder_path": folder_path
             }, to=sid)
-            socketio.emit("file_list", docker_mgr.list_files(user_id, container_name), to=sid)
+            file_watcher.nudge(user_id, container_name, delay=0)
         except Exception as e:
             socketio.emit("folder_create_error", {
                 "error": str(e),
                 "folder_path": folder_path
             }, to=sid)
 
+
+    metrics.add_stats("status_push", status_push.stats)
+    metrics.add_stats("session_registry", registry.stats)
+    metrics.add_stats("terminal_router", router.stats)
+    metrics.add_stats("write_behind", write_behind.stats)
+    metrics.add_stats("file_watcher", file_watcher.stats)
+    metrics.add_stats("terminal_stream", lambda: stream_stats, counters=set(stream_stats))
+    metrics.add_terminal_source(lambda: list(terminal_sessions.values()))
+    ## Packets waiting in each client's Engine.IO send queue
+    metrics.add_gauge("emit_queue_depth", "Socket.IO packets queued for sending, all clients", lambda: sum(
+        client.queue.qsize() for client in list(socketio.server.eio.sockets.values())
+    ))
+    metrics.add_gauge("threads", "Threads by kind", lambda: {
+        (("kind", "terminal_reactor"),): reactors.thread_count(),
+        (("kind", "stats_poller"),): docker_mgr.stats_sampler.stats()["workers"],
+        (("kind", "all"),): threading.active_count(),
+    })
+
+    ## Shared with the asyncio server's native terminal handlers
+    return {"file_watcher": file_watcher}
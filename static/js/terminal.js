@@ -3,6 +3,25 @@ let currentTabId = null;
 const socket = io(); // Global socket connection
 const editor = ace.edit("editor");
 
+// CRC-32 of the UTF-8 text, matching content_hash() in file_documents.py
+const crcTable = (() => {
+  const table = new Uint32Array(256);
+  for (let n = 0; n < 256; n++) {
+    let c = n;
+    for (let k = 0; k < 8; k++) c = c & 1 ? 0xEDB88320 ^ (c >>> 1) : c >>> 1;
+    table[n] = c >>> 0;
+  }
+  return table;
+})();
+
+function contentHash(text) {
+  let crc = 0xFFFFFFFF;
+  for (const byte of new TextEncoder().encode(text)) {
+    crc = crcTable[(crc ^ byte) & 0xFF] ^ (crc >>> 8);
+  }
+  return ((crc ^ 0xFFFFFFFF) >>> 0).toString(16).padStart(8, "0");
+}
+
 // Create terminal tab element
 function createTerminalTab(id, label) {
   const tab = document.createElement("div");
@@ -22,11 +41,9 @@ function createTerminalInstance(id) {
   const term = new Terminal({ theme: { background: "#000", foreground: "#fff" }, fontSize: 14 });
   term.open(instance);
 
-  socket.emit("terminal_input", {
-    container_name: pathname,
-    tab_id: id,
-    input: "clear\n",
-  });
+  // Reattach to the shell this tab had before a reload, or start a new one.
+  // While disconnected, the connect handler below takes care of it.
+  if (socket.connected) attachTerminal(id);
 
   term.onData(data => {
     socket.emit("terminal_input", {
@@ -34,13 +51,20 @@ function createTerminalInstance(id) {
       tab_id: id,
       input: data,
     });
-
-    setTimeout(() => loadFileList(pathname), 500);
   });
 
   terminals[id] = { term };
 }
 
+function attachTerminal(id) {
+  socket.emit("terminal_attach", { container_name: pathname, tab_id: id });
+}
+
+// Reattach every open tab after a (re)connect; the server replays each scrollback
+socket.on("connect", () => {
+  Object.keys(terminals).forEach(attachTerminal);
+});
+
 // Switch between terminal tabs
 function switchToTab(id) {
   document.querySelectorAll(".terminal-tab").forEach(tab => {
@@ -70,6 +94,7 @@ function closeTab(id) {
   document.querySelector(`.terminal-tab[data-id='${id}']`)?.remove();
   document.getElementById(`terminal-${id}`)?.remove();
   delete terminals[id];
+  socket.emit("terminal_close", { container_name: pathname, tab_id: id });
 
   if (currentTabId === id) {
     const first = document.querySelector(".terminal-tab");
@@ -119,35 +144,101 @@ function loadFileList(containerName) {
   socket.emit("list_files", { container_name: containerName });
 }
 
+// The server pushes file_tree_delta whenever the workspace changes, so we never poll
+function watchFiles(containerName) {
+  socket.emit("watch_files", { container_name: containerName });
+}
+
+socket.on("connect", () => watchFiles(pathname));
+
+// Workspace tree: path -> { path, type, size, mtime, unexplored }
+let currentFiles = new Map();
+const expandedDirs = new Set();
+
 socket.on("file_list", data => {
   if (data.container_name !== pathname) return;
 
-  const fileList = document.querySelector("#sidebar ul");
-  fileList.innerHTML = "";
-
   if (data.error) {
-    fileList.innerHTML = `<li>Error loading files: ${data.error}</li>`;
+    document.querySelector("#sidebar ul").innerHTML = `<li>Error loading files: ${data.error}</li>`;
     return;
   }
+  currentFiles = new Map(data.entries.map(entry => [entry.path, entry]));
+  renderFileList();
+});
+
+socket.on("file_tree_delta", data => {
+  if (data.container_name !== pathname) return;
+  data.removed.forEach(path => currentFiles.delete(path));
+  data.added.concat(data.changed || []).forEach(entry => {
+    const known = currentFiles.get(entry.path);
+    // Keep directories we've already expanded past the server's depth limit marked as loaded
+    if (known && !known.unexplored) entry.unexplored = false;
+    currentFiles.set(entry.path, entry);
+  });
+  renderFileList();
+});
+
+// Children of a directory that was beyond the initial depth limit
+socket.on("file_tree", data => {
+  if (data.container_name !== pathname || data.error) return;
+  const dir = currentFiles.get(data.path);
+  if (dir) dir.unexplored = false;
+  data.entries.forEach(entry => currentFiles.set(entry.path, entry));
+  renderFileList();
+});
+
+function toggleDir(path) {
+  if (expandedDirs.has(path)) {
+    expandedDirs.delete(path);
+  } else {
+    expandedDirs.add(path);
+    if (currentFiles.get(path)?.unexplored) {
+      socket.emit("list_tree", { container_name: pathname, path });
+    }
+  }
+  renderFileList();
+}
+
+// A path is shown when every directory above it is expanded
+function isVisible(path) {
+  const parts = path.split("/");
+  for (let i = 1; i < parts.length; i++) {
+    if (!expandedDirs.has(parts.slice(0, i).join("/"))) return false;
+  }
+  return true;
+}
+
+function renderFileList() {
+  const fileList = document.querySelector("#sidebar ul");
+  fileList.innerHTML = "";
+
+  Array.from(currentFiles.keys()).sort().filter(isVisible).forEach(path => {
+    const entry = currentFiles.get(path);
+    const isDir = entry.type === "dir";
+    const depth = path.split("/").length - 1;
 
-  data.files.forEach(file => {
     const li = document.createElement("li");
     li.classList.add("file-item");
+    li.style.paddingLeft = `${depth * 12}px`;
 
     const span = document.createElement("span");
-    span.textContent = file;
+    const name = path.split("/").pop();
+    span.textContent = isDir ? `${expandedDirs.has(path) ? "▾" : "▸"} ${name}/` : name;
+    span.title = isDir ? path : `${path} (${entry.size} bytes)`;
     span.style.flex = "1";
     span.style.cursor = "pointer";
 
-    const cleanFileName = file.replace(/\/$/, '');
-    if (!file.endsWith("/")) {
-      span.addEventListener("click", () => {
-        socket.emit("read_file", {
-          container_name: pathname,
-          file_path: cleanFileName
-        });
+    const cleanFileName = path;
+    span.addEventListener("click", () => {
+      if (isDir) {
+        toggleDir(path);
+        return;
+      }
+      socket.emit("read_file", {
+        container_name: pathname,
+        file_path: cleanFileName
       });
-    }
+    });
 
     const menuBtn = document.createElement("span");
     menuBtn.className = "menu-btn";
@@ -170,7 +261,7 @@ socket.on("file_list", data => {
     dropdown.addEventListener("click", e => {
       const action = e.target.dataset.action;
       if (action === "download") {
-        socket.emit("download_file", { container_name: pathname, file_path: cleanFileName });
+        downloadFile(cleanFileName);
       } else if (action === "delete") {
         if (confirm(`Are you sure you want to delete "${cleanFileName}"?`)) {
           socket.emit("delete_file", { container_name: pathname, file_path: cleanFileName });
@@ -186,38 +277,136 @@ socket.on("file_list", data => {
     li.appendChild(dropdown);
     fileList.appendChild(li);
   });
-});
+}
+
+// Downloads are streamed over plain HTTP so the browser handles large files and resume
+function downloadFile(filePath) {
+  const encodedPath = filePath.split("/").map(encodeURIComponent).join("/");
+  const a = document.createElement("a");
+  a.href = `/download/${encodeURIComponent(pathname)}/${encodedPath}`;
+  a.download = filePath.split("/").pop();
+  a.click();
+}
 
 // Close all dropdowns on click
 document.addEventListener("click", () => {
   document.querySelectorAll(".dropdown-menu, .file-menu-dropdown").forEach(menu => menu.classList.add("hidden"));
 });
 
-socket.on("download_file_response", ({ content, filename }) => {
-  const binary = atob(content);
-  const bytes = new Uint8Array(binary.length);
-  for (let i = 0; i < binary.length; i++) bytes[i] = binary.charCodeAt(i);
-  const blob = new Blob([bytes]);
-  const url = URL.createObjectURL(blob);
-  const a = document.createElement("a");
-  a.href = url;
-  a.download = filename;
-  a.click();
-  URL.revokeObjectURL(url);
+// Every edit gets a version number; the server buffers edits and tells us
+// (file_saved) which version it has actually written to the container.
+// Versions keep counting up across files so the server can spot stale patches.
+editor.version = 0;
+editor.savedVersion = 0;
+editor.baseHash = null;
+
+// Edits are sent as small patches against the server's copy of the file,
+// identified by its hash. The server asks for the full text if they disagree.
+let pendingEdits = [];
+let patchTimer = null;
+
+// Offsets are in code points, as the server slices Python strings; Ace counts UTF-16
+// units, so every astral character (emoji, some CJK) before an edit counts once, not twice
+function codePoints(text) {
+  const surrogatePairs = text.match(/[\uD800-\uDBFF][\uDC00-\uDFFF]/g);
+  return text.length - (surrogatePairs ? surrogatePairs.length : 0);
+}
+
+editor.session.on("change", delta => {
+  if (!editor.currentFile) return;
+  const doc = editor.session.getDocument();
+  // The text before delta.start is the same before and after the change
+  const start = codePoints(doc.getTextRange({ start: { row: 0, column: 0 }, end: delta.start }));
+  const text = delta.lines.join(doc.getNewLineCharacter());
+  if (delta.action === "insert") {
+    pendingEdits.push({ start, end: start, text });
+  } else {
+    pendingEdits.push({ start, end: start + codePoints(text), text: "" });
+  }
+  if (!patchTimer) patchTimer = setTimeout(sendPatch, 30);
+});
+
+function sendPatch() {
+  patchTimer = null;
+  if (!editor.currentFile) pendingEdits = [];
+  if (pendingEdits.length === 0) return;
+  const hash = contentHash(editor.getValue());
+  editor.version += 1;
+  socket.emit("file_patch", {
+    container_name: pathname,
+    file_path: editor.currentFile,
+    base_hash: editor.baseHash,
+    hash: hash,
+    edits: pendingEdits,
+    version: editor.version
+  });
+  editor.baseHash = hash;
+  pendingEdits = [];
+}
+
+socket.on("file_resync_required", ({ file_path }) => {
+  if (file_path !== editor.currentFile) return;
+  clearTimeout(patchTimer);
+  patchTimer = null;
+  pendingEdits = [];
+  const content = editor.getValue();
+  editor.version += 1;
+  editor.baseHash = contentHash(content);
+  socket.emit("file_edit", {
+    container_name: pathname,
+    file_path: editor.currentFile,
+    content: content,
+    version: editor.version
+  });
 });
 
-socket.on("file_content", ({ error, content, file_path, mime_type }) => {
+socket.on("file_content", ({ error, content, file_path, mime_type, hash }) => {
   if (error) return alert(`Error loading file "${file_path}": ${error}`);
 
+  // Send what's left for the old file, then clear it so loading isn't sent as an edit
+  sendPatch();
+  editor.currentFile = null;
   editor.setValue(content, -1);
   editor.currentFile = file_path;
+  editor.savedVersion = editor.version;
+  editor.baseHash = hash || contentHash(content);
 
   const mode = getAceModeFromMime(mime_type || "") || getAceModeFromFilename(file_path);
   editor.session.setMode(mode);
 });
 
-socket.on("terminal_output", ({ tab_id, output }) => {
-  if (terminals[tab_id]) terminals[tab_id].term.write(output);
+// Acknowledge output once xterm has actually written it, so the server can
+// stop streaming to us while we're behind. Acks are batched per tab.
+const pendingAcks = {};
+
+function ackOutput(tabId, size) {
+  if (pendingAcks[tabId]) {
+    pendingAcks[tabId].size += size;
+    return;
+  }
+  pendingAcks[tabId] = { size };
+  setTimeout(() => {
+    socket.emit("terminal_ack", { container_name: pathname, tab_id: tabId, size: pendingAcks[tabId].size });
+    delete pendingAcks[tabId];
+  }, 50);
+}
+
+socket.on("file_saved", ({ file_path, version }) => {
+  if (file_path === editor.currentFile && version > editor.savedVersion) {
+    editor.savedVersion = version;
+  }
+});
+
+socket.on("terminal_output", ({ tab_id, output, size, replay }) => {
+  if (!terminals[tab_id]) {
+    if (size) ackOutput(tab_id, size);
+    return;
+  }
+  // A replay is the whole scrollback, so start from a clean screen
+  if (replay) terminals[tab_id].term.reset();
+  terminals[tab_id].term.write(output, () => {
+    if (size) ackOutput(tab_id, size);
+  });
 });
 
 document.addEventListener("DOMContentLoaded", () => {
@@ -242,15 +431,16 @@ document.addEventListener("DOMContentLoaded", () => {
   editor.session.setMode("ace/mode/sh");
   editor.setOptions({ fontSize: "14px", showPrintMargin: false });
 
-  let lastSentContent = "";
-  editor.session.on("change", () => {
-    const content = editor.getValue();
-    if (content !== lastSentContent && editor.currentFile) {
-      lastSentContent = content;
-      socket.emit("file_edit", {
+  editor.commands.addCommand({
+    name: "save",
+    bindKey: { win: "Ctrl-S", mac: "Command-S" },
+    exec: () => {
+      if (!editor.currentFile) return;
+      sendPatch();
+      socket.emit("file_save", {
         container_name: pathname,
         file_path: editor.currentFile,
-        content: content
+        version: editor.version
       });
     }
   });
@@ -276,7 +466,6 @@ document.addEventListener("DOMContentLoaded", () => {
   });
 
   loadLayout();
-  loadFileList(pathname);
 });
 
 // File menu dropdown
@@ -293,10 +482,31 @@ fileMenuDropdown.addEventListener("click", e => {
   const action = e.target.dataset.action;
   if (action === "new_file" || action === "new_folder") {
     createInlineInput(action === "new_file" ? "file" : "folder");
+  } else if (action === "upload") {
+    document.getElementById("uploadInput").click();
   }
   fileMenuDropdown.classList.add("hidden");
 });
 
+// Uploads are streamed to the server as the raw request body
+document.getElementById("uploadInput").addEventListener("change", async e => {
+  const file = e.target.files[0];
+  e.target.value = "";
+  if (!file) return;
+
+  const response = await fetch(`/upload/${encodeURIComponent(pathname)}/${encodeURIComponent(file.name)}`, {
+    method: "PUT",
+    body: file
+  });
+  const result = await response.json().catch(() => ({ message: response.statusText }));
+  if (result.result !== "success") {
+    alert(`Upload of "${file.name}" failed: ${result.message}`);
+    return;
+  }
+  console.log(`Uploaded ${result.bytes} bytes in ${result.seconds}s (${result.bytes_per_second} B/s)`);
+  loadFileList(pathname);
+});
+
 // Inline input for new files/folders
 function createInlineInput(type = "file") {
   const list = document.querySelector(".sidebar ul");
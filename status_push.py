@@ -0,0 +1,82 @@
+import os
+import threading
+import time
+
+STATS_INTERVAL = float(os.getenv("DASHBOARD_STATS_INTERVAL", "5"))
+
+## Keeps open dashboards current without polling. Every change the container index sees
+## (from Docker events) goes to the owner's devices room as a container_status delta:
+## the container's dashboard entry, or {"name", "removed": True} once it is gone.
+## Users with a dashboard open also get container_stats with the latest CPU and memory
+## figures of their running containers, at most once every STATS_INTERVAL seconds.
+class container_status_push:
+    def __init__(self, manager, emit, interval=STATS_INTERVAL):
+        self.manager = manager
+        self.emit = emit
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.watchers = {}    # user_id -> set of sids
+        self.deltas_sent = 0
+        self.stats_sent = 0
+        manager.index.add_listener(self.on_change)
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def room(self, user_id):
+        return f"devices:{user_id}"
+
+    def watch(self, user_id, sid):
+        with self.lock:
+            self.watchers.setdefault(user_id, set()).add(sid)
+
+    def unwatch(self, sid):
+        with self.lock:
+            for user_id, sids in list(self.watchers.items()):
+                sids.discard(sid)
+                if not sids:
+                    del self.watchers[user_id]
+
+    def watched(self):
+        with self.lock:
+            return list(self.watchers)
+
+    def on_change(self, owner, container):
+        user_id, container_name = owner
+        with self.lock:
+            if user_id not in self.watchers:
+                return
+            self.deltas_sent += 1
+        if container is None:
+            delta = {"name": container_name, "removed": True}
+        else:
+            delta = self.manager.describe_container(container)
+        self.emit("container_status", delta, to=self.room(user_id))
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            for user_id in self.watched():
+                try:
+                    self.push_stats(user_id)
+                except Exception as e:
+                    print(f"Dashboard stats error for {user_id}: {e}")
+
+    def push_stats(self, user_id):
+        containers = {c.id: c for c in self.manager.index.containers_for_user(user_id)}
+        latest = self.manager.stats_sampler.latest(list(containers))
+        if not latest:
+            return
+        figures = {}
+        for container_id, sample in latest.items():
+            owner = self.manager.index.owner_of(containers[container_id])
+            figures[owner[1]] = {"cpu": round(sample["cpu"], 3), "memory": int(sample["memory"])}
+        with self.lock:
+            self.stats_sent += 1
+        self.emit("container_stats", {"containers": figures}, to=self.room(user_id))
+
+    def stats(self):
+        with self.lock:
+            return {
+                "watching_users": len(self.watchers),
+                "deltas": self.deltas_sent,
+                "stats": self.stats_sent,
+            }
@@ -0,0 +1,179 @@
+import hashlib
+import os
+import threading
+import time
+import uuid
+import docker
+
+TEMPLATE_DIR = os.getenv("DOCKER_TEMPLATES")
+IMAGE_CACHE_ENABLED = os.getenv("TEMPLATE_IMAGE_CACHE", "1") == "1"
+IMAGE_REPOSITORY = os.getenv("TEMPLATE_IMAGE_REPOSITORY", "glitched-template")
+GC_INTERVAL = float(os.getenv("TEMPLATE_IMAGE_GC_INTERVAL", "600"))
+IMAGE_LABEL = "glitched_template"
+HASH_LABEL = "glitched_template_hash"
+
+## Derived images with a template's startup.sh already applied, one per
+## (os_image, hash of the template directory's contents). A container started from one
+## doesn't need to run startup.sh again. The first request for a new combination gets
+## None straight away (the caller provisions the slow way) while the image is built in
+## the background by committing a freshly provisioned container. Editing the template
+## changes its hash, so the next request builds a new image; images that are no longer
+## current and have no containers left are removed by the GC thread.
+class template_image_cache:
+    def __init__(self, client, provision, template_dir=TEMPLATE_DIR, enabled=IMAGE_CACHE_ENABLED, gc_interval=GC_INTERVAL):
+        self.client = client
+        ## provision(os_image, template_type, name, labels) starts a container from the base
+        ## image and runs startup.sh in it, exactly like an uncached create
+        self.provision = provision
+        self.template_dir = template_dir
+        self.enabled = enabled and bool(template_dir)
+        self.gc_interval = gc_interval
+        self.lock = threading.Lock()
+        self.hashes = {}      # template_type -> (signature, content hash)
+        self.building = set()
+        self.hits = 0
+        self.misses = 0
+        self.builds = 0
+        self.removed = 0
+        self.thread = None
+
+    def start(self):
+        if not self.enabled or self.thread:
+            return
+        self.thread = threading.Thread(target=self.run_gc, daemon=True)
+        self.thread.start()
+
+    ## Hash of every file in the template directory. Contents are only re-read when some
+    ## file's size or mtime changed since the last call.
+    def template_hash(self, template_type: str):
+        root = os.path.join(self.template_dir, template_type)
+        files = []
+        for directory, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                path = os.path.join(directory, filename)
+                stat = os.stat(path)
+                files.append((os.path.relpath(path, root), stat.st_size, stat.st_mtime_ns, stat.st_mode))
+        if not files:
+            return None
+        signature = tuple(files)
+
+        with self.lock:
+            cached = self.hashes.get(template_type)
+        if cached and cached[0] == signature:
+            return cached[1]
+
+        digest = hashlib.sha256()
+        for relpath, _, _, mode in files:
+            digest.update(relpath.encode() + b"\0" + oct(mode & 0o777).encode() + b"\0")
+            with open(os.path.join(root, relpath), "rb") as f:
+                for chunk in iter(lambda: f.read(64 * 1024), b""):
+                    digest.update(chunk)
+        content_hash = digest.hexdigest()[:16]
+        with self.lock:
+            self.hashes[template_type] = (signature, content_hash)
+        return content_hash
+
+    def tag_for(self, os_image: str, template_type: str, content_hash: str):
+        return f"{os_image}-{template_type}-{content_hash}"
+
+    ## The cached image for this combination, or None (and a build is started) if there isn't one yet
+    def image_for(self, os_image: str, template_type: str):
+        if not self.enabled:
+            return None
+        try:
+            content_hash = self.template_hash(template_type)
+        except OSError as e:
+            print(f"Could not hash template '{template_type}': {e}")
+            return None
+        if not content_hash:
+            return None
+
+        image = f"{IMAGE_REPOSITORY}:{self.tag_for(os_image, template_type, content_hash)}"
+        try:
+            self.client.images.get(image)
+            with self.lock:
+                self.hits += 1
+            return image
+        except docker.errors.ImageNotFound:
+            pass
+
+        key = (os_image, template_type, content_hash)
+        with self.lock:
+            self.misses += 1
+            if key in self.building:
+                return None
+            self.building.add(key)
+        threading.Thread(target=self.build, args=(key,), daemon=True).start()
+        return None
+
+    def build(self, key):
+        os_image, template_type, content_hash = key
+        labels = {IMAGE_LABEL: f"{os_image}/{template_type}", HASH_LABEL: content_hash}
+        container = None
+        started = time.monotonic()
+        try:
+            container = self.provision(os_image, template_type, name=f"template_build_{uuid.uuid4()}", labels=labels)
+            container.commit(
+                repository=IMAGE_REPOSITORY,
+                tag=self.tag_for(os_image, template_type, content_hash),
+                message=f"{template_type} template on {os_image}"
+            )
+            with self.lock:
+                self.builds += 1
+            print(f"Built template image for {os_image}/{template_type} ({content_hash}) in {time.monotonic() - started:.1f}s")
+        except Exception as e:
+            print(f"Template image build failed for {key}: {e}")
+        finally:
+            if container is not None:
+                try:
+                    container.remove(force=True)
+                except docker.errors.APIError as e:
+                    print(f"Could not remove template build container {container.name}: {e.explanation}")
+            with self.lock:
+                self.building.discard(key)
+        self.safe_collect()
+
+    def run_gc(self):
+        while True:
+            time.sleep(self.gc_interval)
+            self.safe_collect()
+
+    def safe_collect(self):
+        try:
+            self.collect()
+        except Exception as e:
+            print(f"Template image GC error: {e}")
+
+    ## Remove images built from an older version of their template that no container uses anymore
+    def collect(self):
+        current = {}
+        for image in self.client.images.list(filters={"label": IMAGE_LABEL}):
+            labels = image.labels or {}
+            template_type = labels.get(IMAGE_LABEL, "").partition("/")[2]
+            if template_type not in current:
+                try:
+                    current[template_type] = self.template_hash(template_type)
+                except OSError:
+                    current[template_type] = None
+            if labels.get(HASH_LABEL) == current[template_type]:
+                continue
+            if self.client.containers.list(all=True, filters={"ancestor": image.id}):
+                continue
+            try:
+                self.client.images.remove(image.id)
+                with self.lock:
+                    self.removed += 1
+                print(f"Removed stale template image {', '.join(image.tags) or image.short_id}")
+            except docker.errors.APIError as e:
+                print(f"Could not remove template image {image.short_id}: {e.explanation}")
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "builds": self.builds,
+                "building": len(self.building),
+                "removed": self.removed,
+            }
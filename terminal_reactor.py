@@ -0,0 +1,161 @@
+import heapq
+import itertools
+import os
+import select
+import threading
+import time
+
+READ_EVENTS = select.EPOLLIN | select.EPOLLHUP | select.EPOLLERR | select.EPOLLRDHUP
+
+## One thread multiplexing every registered socket with epoll.
+## Handlers are objects with on_readable() -> bool (False once the stream is done)
+## and on_closed(). Idle sockets cost nothing: poll() blocks until something happens.
+class terminal_reactor:
+    def __init__(self, name="terminal-reactor"):
+        self.epoll = select.epoll()
+        self.handlers = {}   # fd -> handler
+        self.lock = threading.Lock()
+        self.timers = []     # heap of (deadline, seq, callback)
+        self.counter = itertools.count()
+        self.paused = set()  # fds registered but not being read
+        self.wake_r, self.wake_w = os.pipe()
+        os.set_blocking(self.wake_r, False)
+        os.set_blocking(self.wake_w, False)
+        self.epoll.register(self.wake_r, select.EPOLLIN)
+        self.thread = threading.Thread(target=self.run, name=name, daemon=True)
+        self.thread.start()
+
+    def register(self, sock, handler):
+        sock.setblocking(False)
+        fd = sock.fileno()
+        with self.lock:
+            self.handlers[fd] = handler
+        self.epoll.register(fd, READ_EVENTS)
+
+    def unregister(self, sock):
+        try:
+            fd = sock.fileno()
+        except OSError:
+            return
+        self._drop(fd)
+
+    def _drop(self, fd):
+        with self.lock:
+            handler = self.handlers.pop(fd, None)
+            was_paused = fd in self.paused
+            self.paused.discard(fd)
+        if handler is None:
+            return None
+        if not was_paused:
+            try:
+                self.epoll.unregister(fd)
+            except (OSError, ValueError):
+                pass
+        return handler
+
+    ## Stop reading a socket without forgetting it, so the kernel buffer fills
+    ## and the writer inside the container blocks.
+    def pause(self, sock):
+        fd = sock.fileno()
+        with self.lock:
+            if fd not in self.handlers or fd in self.paused:
+                return
+            self.paused.add(fd)
+        self.epoll.unregister(fd)
+
+    def resume(self, sock):
+        fd = sock.fileno()
+        with self.lock:
+            if fd not in self.paused:
+                return
+            self.paused.discard(fd)
+        self.epoll.register(fd, READ_EVENTS)
+
+    def call_at(self, deadline, callback):
+        with self.lock:
+            heapq.heappush(self.timers, (deadline, next(self.counter), callback))
+        if threading.get_ident() != self.thread.ident:
+            self.wake()
+
+    ## Run a callback on the reactor thread as soon as possible
+    def call_soon(self, callback):
+        self.call_at(0, callback)
+
+    def wake(self):
+        try:
+            os.write(self.wake_w, b"x")
+        except BlockingIOError:
+            pass
+
+    def _drain_wake(self):
+        try:
+            while os.read(self.wake_r, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _next_timeout(self):
+        with self.lock:
+            if not self.timers:
+                return -1
+            return max(0.0, self.timers[0][0] - time.monotonic())
+
+    def _run_timers(self):
+        now = time.monotonic()
+        due = []
+        with self.lock:
+            while self.timers and self.timers[0][0] <= now:
+                due.append(heapq.heappop(self.timers)[2])
+        for callback in due:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Reactor timer error: {e}")
+
+    def run(self):
+        while True:
+            try:
+                events = self.epoll.poll(self._next_timeout())
+            except InterruptedError:
+                continue
+            for fd, _ in events:
+                if fd == self.wake_r:
+                    self._drain_wake()
+                    continue
+                handler = self.handlers.get(fd)
+                if handler is None:
+                    continue
+                try:
+                    alive = handler.on_readable()
+                except Exception as e:
+                    print(f"Stream error: {e}")
+                    alive = False
+                if not alive and self._drop(fd) is handler:
+                    handler.on_closed()
+            self._run_timers()
+
+    def __len__(self):
+        return len(self.handlers)
+
+    def paused_count(self):
+        return len(self.paused)
+
+
+## A fixed set of reactors; each socket is pinned to one shard by its fd.
+class reactor_pool:
+    def __init__(self, size=1):
+        self.reactors = [terminal_reactor(f"terminal-reactor-{i}") for i in range(max(1, size))]
+
+    def shard(self, sock):
+        return self.reactors[sock.fileno() % len(self.reactors)]
+
+    def register(self, sock, handler):
+        reactor = self.shard(sock)
+        reactor.register(sock, handler)
+        return reactor
+
+    def session_count(self):
+        return sum(len(r) for r in self.reactors)
+
+    def thread_count(self):
+        return len(self.reactors)
@@ -0,0 +1,281 @@
+import codecs
+import collections
+import os
+import select
+import time
+
+READ_BYTES = int(os.getenv("TERMINAL_READ_BYTES", "65536"))
+FLUSH_BYTES = int(os.getenv("TERMINAL_FLUSH_BYTES", "16384"))
+FLUSH_MS = float(os.getenv("TERMINAL_FLUSH_MS", "5"))
+
+## Flow control: once a client has this many unacknowledged bytes we stop sending,
+## and we start again when its acks bring it back under the low watermark.
+HIGH_WATERMARK = int(os.getenv("TERMINAL_HIGH_WATERMARK", str(256 * 1024)))
+LOW_WATERMARK = int(os.getenv("TERMINAL_LOW_WATERMARK", str(64 * 1024)))
+## pause   - stop reading the exec socket so the container process blocks
+## drop    - keep reading but only keep the last TERMINAL_TAIL_BYTES of output
+## compact - keep reading but only keep the last TERMINAL_SCREEN_ROWS lines
+BACKPRESSURE_POLICY = os.getenv("TERMINAL_BACKPRESSURE", "pause")
+TAIL_BYTES = int(os.getenv("TERMINAL_TAIL_BYTES", str(64 * 1024)))
+SCREEN_ROWS = int(os.getenv("TERMINAL_SCREEN_ROWS", "50"))
+
+## Detached sessions keep reading into their scrollback until they are reattached or reaped
+SCROLLBACK_BYTES = int(os.getenv("TERMINAL_SCROLLBACK_BYTES", str(256 * 1024)))
+ORPHAN_TIMEOUT = int(os.getenv("TERMINAL_ORPHAN_TIMEOUT", "300"))
+
+stream_stats = {
+    "watermark_hits": 0,
+    "dropped_bytes": 0,
+    "bytes_in": 0,
+    "bytes_out": 0,
+}
+
+## Collects raw terminal bytes into text frames.
+## The incremental decoder keeps a multibyte character split across two reads intact,
+## and a frame is released once it holds max_bytes or has waited max_delay seconds.
+class output_framer:
+    def __init__(self, max_bytes=FLUSH_BYTES, max_delay=FLUSH_MS / 1000):
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.pending = []
+        self.pending_bytes = 0
+        self.first_at = None
+
+    def feed(self, data: bytes):
+        text = self.decoder.decode(data)
+        if text:
+            if not self.pending:
+                self.first_at = time.monotonic()
+            self.pending.append(text)
+        self.pending_bytes += len(data)
+        return self.pending_bytes >= self.max_bytes
+
+    def deadline(self):
+        return self.first_at + self.max_delay if self.pending else None
+
+    ## Throw away everything but the newest output while a client is behind
+    def trim(self, policy):
+        text = "".join(self.pending)
+        if policy == "compact":
+            kept = "\n".join(text.split("\n")[-SCREEN_ROWS:])
+        else:
+            ## Cutting at a byte offset can split a character; the partial one is dropped
+            kept = text.encode()[-TAIL_BYTES:].decode(errors="ignore")
+        dropped = len(text.encode()) - len(kept.encode())
+        if dropped:
+            self.pending = [kept]
+            self.pending_bytes = len(kept.encode())
+        return dropped
+
+    def take(self, final=False):
+        if final:
+            tail = self.decoder.decode(b"", final=True)
+            if tail:
+                self.pending.append(tail)
+        text = "".join(self.pending)
+        self.pending = []
+        self.pending_bytes = 0
+        self.first_at = None
+        return text
+
+
+## Ring buffer of recent output, bounded by bytes, replayed when a client reattaches
+class scrollback_buffer:
+    def __init__(self, max_bytes=SCROLLBACK_BYTES):
+        self.max_bytes = max_bytes
+        self.chunks = collections.deque()
+        self.size = 0
+
+    def append(self, text: str):
+        data = text.encode()
+        if len(data) > self.max_bytes:
+            data = data[-self.max_bytes:]
+        self.chunks.append(data)
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            self.size -= len(self.chunks.popleft())
+
+    def contents(self):
+        return b"".join(self.chunks).decode(errors="ignore")
+
+
+## One exec'd shell attached to a terminal tab.
+## Sessions are keyed by (user_id, container_name, tab_id), not by Socket.IO sid, so
+## they outlive a page reload: on disconnect the sid is cleared and output keeps
+## going into the scrollback until a client reattaches or the session is reaped.
+## The reactor calls on_readable() whenever the exec socket has data.
+class terminal_session:
+    def __init__(self, sock, user_id, container_name, tab_id, emit):
+        self.sock = sock
+        self.user_id = user_id
+        self.container_name = container_name
+        self.sid = None
+        self.tab_id = tab_id
+        self.emit = emit
+        self.scrollback = scrollback_buffer()
+        self.detached_at = time.monotonic()
+        self.last_activity = time.monotonic()
+        self.reactor = None
+        self.closed = False
+        self.framer = output_framer()
+        self.flush_scheduled = False
+        self.policy = BACKPRESSURE_POLICY
+        self.unacked = 0
+        self.throttled = False
+        self.dropped = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def attach(self, reactors):
+        self.reactor = reactors.register(self.sock, self)
+
+    def on_readable(self):
+        try:
+            output = self.sock.recv(READ_BYTES)
+        except BlockingIOError:
+            return True
+        if not output:
+            self.flush(final=True)
+            return False
+
+        self.bytes_out += len(output)
+        stream_stats["bytes_out"] += len(output)
+        if self.framer.feed(output):
+            self.flush()
+        elif self.throttled:
+            self.drop_backlog()
+        elif not self.flush_scheduled and self.framer.deadline() is not None:
+            self.flush_scheduled = True
+            self.reactor.call_at(self.framer.deadline(), self.on_flush_timer)
+        return True
+
+    def on_flush_timer(self):
+        self.flush_scheduled = False
+        self.flush()
+
+    def flush(self, final=False):
+        if self.throttled and not final:
+            self.drop_backlog()
+            return
+
+        text = self.framer.take(final)
+        if not text:
+            return
+        self.scrollback.append(text)
+        self.last_activity = time.monotonic()
+        if self.sid is None:
+            return
+        if self.dropped:
+            text = f"\r\n[{self.dropped} bytes of output skipped]\r\n" + text
+            self.dropped = 0
+
+        ## Flow control counts UTF-8 bytes, like the watermarks; the client acks back this size
+        size = len(text.encode())
+        self.unacked += size
+        self.emit("terminal_output", {
+            "output": text,
+            "tab_id": self.tab_id,
+            "size": size
+        }, to=self.sid)
+
+        if self.unacked >= HIGH_WATERMARK and not self.throttled:
+            self.throttled = True
+            stream_stats["watermark_hits"] += 1
+            if self.policy == "pause":
+                self.reactor.pause(self.sock)
+
+    def drop_backlog(self):
+        if self.policy == "pause":
+            return
+        dropped = self.framer.trim(self.policy)
+        self.dropped += dropped
+        stream_stats["dropped_bytes"] += dropped
+
+    ## Called from the socket handler when the browser has written out `size` bytes.
+    ## All flow control state is only touched on the reactor thread.
+    def ack(self, size: int):
+        if self.reactor:
+            self.reactor.call_soon(lambda: self.apply_ack(size))
+
+    def apply_ack(self, size: int):
+        self.unacked = max(0, self.unacked - size)
+        if not self.throttled or self.closed or self.unacked > LOW_WATERMARK:
+            return
+        self.throttled = False
+        if self.policy == "pause":
+            self.reactor.resume(self.sock)
+        self.flush()
+
+    ## Point the session at a (new) client and replay its scrollback.
+    ## Both run on the reactor thread so they can't interleave with a flush.
+    def attach_client(self, sid):
+        self.reactor.call_soon(lambda: self._attach_client(sid))
+
+    def _attach_client(self, sid):
+        self.sid = sid
+        self.detached_at = None
+        self.unacked = 0
+        self.dropped = 0
+        if self.throttled:
+            self.throttled = False
+            if self.policy == "pause":
+                self.reactor.resume(self.sock)
+        pending = self.framer.take()
+        if pending:
+            self.scrollback.append(pending)
+        replay = self.scrollback.contents()
+        size = len(replay.encode())
+        self.unacked += size
+        self.emit("terminal_output", {
+            "output": replay,
+            "tab_id": self.tab_id,
+            "size": size,
+            "replay": True
+        }, to=sid)
+
+    def detach_client(self, sid):
+        self.reactor.call_soon(lambda: self._detach_client(sid))
+
+    def _detach_client(self, sid):
+        if self.sid != sid:
+            return
+        self.sid = None
+        self.detached_at = time.monotonic()
+        if self.throttled:
+            self.throttled = False
+            if self.policy == "pause":
+                self.reactor.resume(self.sock)
+
+    def orphaned_for(self, now):
+        if self.detached_at is None:
+            return 0
+        return now - self.detached_at
+
+    def on_closed(self):
+        self.closed = True
+
+    ## The socket is non-blocking for the reactor, so wait for room when a big paste fills it.
+    ## poll, not select: with thousands of tabs the fd is easily past select's 1024 limit.
+    def send(self, data: bytes):
+        self.last_activity = time.monotonic()
+        self.bytes_in += len(data)
+        stream_stats["bytes_in"] += len(data)
+        view = memoryview(data)
+        while view:
+            try:
+                sent = self.sock.send(view)
+                view = view[sent:]
+            except BlockingIOError:
+                writable = select.poll()
+                writable.register(self.sock, select.POLLOUT)
+                writable.poll(1000)
+
+    def close(self):
+        if self.reactor:
+            self.reactor.unregister(self.sock)
+        self.closed = True
+        try:
+            self.sock.close()
+        except Exception:
+            pass
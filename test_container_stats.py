@@ -0,0 +1,62 @@
+import threading
+import time
+from container_stats import stats_sampler
+
+class fake_container:
+    def __init__(self, number):
+        self.id = f"{number:064x}"
+        self.name = f"box{number}"
+        self.status = "running"
+        self.attrs = {"State": {"Status": "running"}}
+        self.polls = 0
+
+    ## Half a CPU of usage per poll on a 2-CPU host, 100 MiB of memory
+    def stats(self, stream=True, one_shot=False):
+        assert not stream and one_shot
+        self.polls += 1
+        return {
+            "cpu_stats": {
+                "cpu_usage": {"total_usage": self.polls * 50},
+                "system_cpu_usage": self.polls * 200,
+                "online_cpus": 2,
+            },
+            "memory_stats": {"usage": 100 * 2**20, "stats": {}},
+        }
+
+class fake_index:
+    def __init__(self, containers):
+        self.items = containers
+
+    def containers(self):
+        return list(self.items)
+
+    def owner_of(self, container):
+        return "alice", container.name
+
+def wait_idle(sampler):
+    for _ in range(200):
+        if not sampler.stats()["polling"]:
+            return
+        time.sleep(0.01)
+
+def test_polls_many_containers_on_a_bounded_pool():
+    containers = [fake_container(i) for i in range(50)]
+    sampler = stats_sampler(fake_index(containers), workers=2)
+    before = threading.active_count()
+    for _ in range(2):
+        sampler.sync()
+        wait_idle(sampler)
+    assert threading.active_count() - before <= 2
+    usage = sampler.usage([c.id for c in containers])
+    assert len(usage) == 50
+    assert abs(usage[containers[0].id]["cpu"] - 0.5) < 1e-9
+
+def test_stopped_containers_are_forgotten():
+    container = fake_container(1)
+    index = fake_index([container])
+    sampler = stats_sampler(index, workers=1)
+    sampler.sync()
+    wait_idle(sampler)
+    index.items = []
+    sampler.sync()
+    assert sampler.stats()["containers"] == 0
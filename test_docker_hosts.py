@@ -0,0 +1,163 @@
+import collections
+import threading
+from container_index import container_index
+from docker_hosts import docker_endpoints
+from docker_information import docker_manager
+from file_cache import file_cache
+
+exec_result = collections.namedtuple("exec_result", ["exit_code", "output"])
+
+## Stand-ins for one Docker daemon each: just enough of the SDK for the index, placement,
+## file operations and the low-level listing
+class fake_container:
+    def __init__(self, client, container_id, user_id, container_name, status="running"):
+        self.client = client
+        self.id = container_id
+        self.name = f"user_{user_id}_{container_id}"
+        self.labels = {"user_id": user_id, "container_name": container_name}
+        self.status = status
+        self.attrs = {"State": {"Status": status}, "HostConfig": {}, "Image": f"sha256:{client.name}"}
+
+    def exec_run(self, cmd, **kwargs):
+        self.client.execs.append((self.id, cmd))
+        return exec_result(0, (b"", b""))
+
+class fake_containers:
+    def __init__(self, client):
+        self.client = client
+        self.items = []
+
+    def list(self, all=False, filters=None):
+        if "name" in (filters or {}):
+            return []
+        return list(self.items)
+
+class fake_api:
+    def __init__(self, client):
+        self.client = client
+        self.base_url = f"fake://{client.name}"
+
+    def containers(self, all=False, filters=None):
+        if "name" in (filters or {}):
+            return []
+        user_id = filters["label"].partition("=")[2]
+        return [
+            {"Id": c.id, "Names": [f"/{c.name}"], "Labels": c.labels, "ImageID": f"sha256:{self.client.name}",
+             "State": c.status, "Created": 0}
+            for c in self.client.containers.items if c.labels["user_id"] == user_id
+        ]
+
+    def inspect_image(self, image_id):
+        return {"RepoTags": [f"ubuntu:{self.client.name}"], "Os": "linux"}
+
+class fake_client:
+    def __init__(self, name):
+        self.name = name
+        self.api = fake_api(self)
+        self.containers = fake_containers(self)
+        self.execs = []
+
+class fake_endpoint:
+    def __init__(self, name, cpus=1):
+        self.name = name
+        self.client = fake_client(name)
+        self.api = self.client.api
+        self.capacity = {"cpus": cpus, "memory": 0}
+        self.healthy = True
+
+    def refresh(self):
+        pass
+
+    def add(self, user_id, container_name, status="running"):
+        number = len(self.client.containers.items)
+        container = fake_container(self.client, f"{self.name}-{number}", user_id, container_name, status)
+        self.client.containers.items.append(container)
+        return container
+
+class fake_idle:
+    def wake(self, container):
+        pass
+
+def loaded_index(endpoints):
+    index = container_index([endpoint.client for endpoint in endpoints])
+    for endpoint in endpoints:
+        index.load(endpoint.client)
+        index.mark_loaded(endpoint.client)
+    return index
+
+def manager_for(endpoints):
+    manager = docker_manager.__new__(docker_manager)
+    manager.endpoints = docker_endpoints(endpoints=endpoints)
+    manager.index = loaded_index(endpoints)
+    manager.idle = fake_idle()
+    manager.file_cache = file_cache()
+    manager.image_info = {}
+    manager.image_lock = threading.Lock()
+    return manager
+
+## 4 containers per CPU: "a" is half full, "b" a quarter
+def two_hosts():
+    a, b = fake_endpoint("a", cpus=2), fake_endpoint("b", cpus=2)
+    for i in range(4):
+        a.add("u", f"a{i}")
+    for i in range(2):
+        b.add("u", f"b{i}")
+    return a, b
+
+def test_least_loaded_picks_the_emptier_host():
+    a, b = two_hosts()
+    hosts = docker_endpoints(endpoints=[a, b], policy="least_loaded")
+    chosen, _ = hosts.choose(loaded_index([a, b]))
+    assert chosen is b
+
+def test_binpack_fills_the_busier_host_while_it_fits():
+    a, b = two_hosts()
+    hosts = docker_endpoints(endpoints=[a, b], policy="binpack")
+    chosen, _ = hosts.choose(loaded_index([a, b]))
+    assert chosen is a
+
+def test_burst_of_placements_spreads_before_the_index_catches_up():
+    a, b = fake_endpoint("a", cpus=2), fake_endpoint("b", cpus=2)
+    index = loaded_index([a, b])
+    hosts = docker_endpoints(endpoints=[a, b], policy="least_loaded")
+    chosen = [hosts.choose(index)[0].name for _ in range(6)]
+    assert sorted(chosen) == ["a", "a", "a", "b", "b", "b"]
+
+def test_placement_counts_until_indexed_running():
+    a, b = fake_endpoint("a"), fake_endpoint("b")
+    index = loaded_index([a, b])
+    hosts = docker_endpoints(endpoints=[a, b])
+    chosen, placement = hosts.choose(index)
+    container = chosen.add("u", "new")
+    hosts.placed(placement, container)
+    assert hosts.usage(index)[chosen.name]["running"] == 1
+    ## Once the index has it, it is counted once, not twice
+    index.add(container)
+    assert hosts.usage(index)[chosen.name]["running"] == 1
+    assert hosts.pending == []
+
+def test_failed_placement_stops_counting():
+    a, b = fake_endpoint("a"), fake_endpoint("b")
+    index = loaded_index([a, b])
+    hosts = docker_endpoints(endpoints=[a, b])
+    chosen, placement = hosts.choose(index)
+    hosts.placed(placement, None)
+    assert hosts.usage(index)[chosen.name]["running"] == 0
+
+def test_lookups_and_file_ops_go_to_the_owning_daemon():
+    a, b = two_hosts()
+    manager = manager_for([a, b])
+    container = manager.find_container_by_logical_name("u", "b1")
+    assert container.client is b.client
+    assert manager.delete_file("u", "b1", "notes.txt") == {"result": "success"}
+    assert a.client.execs == []
+    assert [container_id for container_id, _ in b.client.execs] == [container.id]
+
+def test_listing_merges_every_daemon():
+    a, b = two_hosts()
+    manager = manager_for([a, b])
+    result = manager.get_containers_by_user("u")
+    assert result["result"] == "success"
+    names = sorted(entry["name"] for entry in result["message"])
+    assert names == ["a0", "a1", "a2", "a3", "b0", "b1"]
+    assert {entry["image"] for entry in result["message"]} == {"ubuntu:a", "ubuntu:b"}
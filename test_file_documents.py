@@ -0,0 +1,37 @@
+from file_documents import document_store, document_mismatch, content_hash
+
+def test_patch_after_astral_character_uses_code_point_offsets():
+    store = document_store()
+    key = ("u", "box", "notes.txt")
+    store.load(key, "hi 😀 there")
+    ## "😀" is one code point (two UTF-16 units in the editor), so "there" starts at 5
+    text = store.apply(key, content_hash("hi 😀 there"), [{"start": 5, "end": 10, "text": "you"}], version=1)
+    assert text == "hi 😀 you"
+
+def test_stale_version_is_a_mismatch():
+    store = document_store()
+    key = ("u", "box", "notes.txt")
+    store.load(key, "abc", version=5)
+    try:
+        store.apply(key, content_hash("abc"), [{"start": 3, "end": 3, "text": "d"}], version=3)
+    except document_mismatch:
+        pass
+    else:
+        assert False, "stale patch was accepted"
+
+def test_on_change_runs_in_store_order():
+    store = document_store()
+    key = ("u", "box", "notes.txt")
+    seen = []
+    store.load(key, "a")
+    store.apply(key, content_hash("a"), [{"start": 1, "end": 1, "text": "b"}], version=1, on_change=seen.append)
+    store.apply(key, content_hash("ab"), [{"start": 2, "end": 2, "text": "c"}], version=2, on_change=seen.append)
+    assert seen == ["ab", "abc"]
+
+def test_cache_size_is_counted_in_bytes():
+    store = document_store(max_bytes=10)
+    store.load(("u", "box", "a.txt"), "é" * 4)
+    store.load(("u", "box", "b.txt"), "é" * 4)
+    ## 8 characters but 16 bytes: the older document has to go
+    assert ("u", "box", "a.txt") not in store
+    assert store.size == 8
@@ -0,0 +1,71 @@
+import collections
+import pytest
+from docker_information import docker_manager
+from file_cache import file_cache
+
+exec_result = collections.namedtuple("exec_result", ["exit_code", "output"])
+
+## Path checks happen before any Docker call, so no daemon (or __init__) is needed
+manager = docker_manager.__new__(docker_manager)
+
+@pytest.mark.parametrize("path", ["../../etc/cron.d/x", "a/../../b", "/", ""])
+def test_upload_rejects_paths_outside_home(path):
+    result = manager.upload_file("u", "box", path, 1, iter([b"x"]))
+    assert result["result"] == "error"
+
+@pytest.mark.parametrize("path", ["../../etc/shadow", "docs/../../x"])
+def test_download_rejects_paths_outside_home(path):
+    with pytest.raises(ValueError):
+        manager.open_file_stream("u", "box", path)
+
+class measured_container:
+    def __init__(self, container_id, status, used_kib):
+        self.id = container_id
+        self.name = container_id
+        self.status = status
+        self.attrs = {"State": {"Status": status}}
+        self.used_kib = used_kib
+
+    def exec_run(self, cmd, **kwargs):
+        assert self.status == "running"
+        return 0, f"{self.used_kib}\t/home/u\n".encode()
+
+class user_index:
+    def __init__(self, containers):
+        self.items = containers
+
+    def containers_for_user(self, user_id):
+        return list(self.items)
+
+def test_quota_usage_sums_every_container_of_the_user():
+    running = measured_container("a", "running", 100)
+    paused = measured_container("b", "running", 50)
+    quota = docker_manager.__new__(docker_manager)
+    quota.index = user_index([running, paused])
+    quota.workspace_sizes = {}
+    assert quota.user_usage("u") == 150 * 1024
+    ## Once hibernated it can't be measured, but still counts
+    paused.status = paused.attrs["State"]["Status"] = "paused"
+    assert quota.user_usage("u", running) == 150 * 1024
+
+@pytest.mark.parametrize("path", ["../../etc", "a/../..", "/", ""])
+def test_delete_rejects_paths_outside_home(path):
+    assert "error" in manager.delete_file("u", "box", path)
+
+class recording_container:
+    id = "c1"
+
+    def __init__(self):
+        self.commands = []
+
+    def exec_run(self, cmd, **kwargs):
+        self.commands.append(cmd)
+        return exec_result(0, (b"", b""))
+
+def test_delete_quotes_the_path():
+    container = recording_container()
+    deleting = docker_manager.__new__(docker_manager)
+    deleting.find_container_by_logical_name = lambda user_id, container_name: container
+    deleting.file_cache = file_cache()
+    assert deleting.delete_file("u", "box", "it's here.txt") == {"result": "success"}
+    assert container.commands == [["sh", "-c", "rm -rf -- 'it'\"'\"'s here.txt'"]]
@@ -0,0 +1,24 @@
+import threading
+from docker_executor import docker_executor
+from file_watcher import file_tree_watcher
+
+def test_slow_snapshot_does_not_hold_up_other_workspaces():
+    release = threading.Event()
+    quick_done = threading.Event()
+
+    def snapshot(user_id, container_name):
+        if container_name == "slow":
+            release.wait(5)
+        else:
+            quick_done.set()
+        return {"entries": []}
+
+    watcher = file_tree_watcher(snapshot, lambda *args, **kwargs: None, executor=docker_executor(), interval=60)
+    watcher.watch("u", "slow", "sid1")
+    watcher.watch("u", "quick", "sid2")
+    watcher.nudge("u", "slow", delay=0)
+    try:
+        watcher.nudge("u", "quick", delay=0.05)
+        assert quick_done.wait(2)
+    finally:
+        release.set()
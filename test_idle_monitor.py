@@ -0,0 +1,108 @@
+import time
+from idle_monitor import idle_monitor
+from session_registry import local_session_registry
+
+class fake_container:
+    def __init__(self, status):
+        self.id = "c1"
+        self.name = "box"
+        self.status = status
+        self.attrs = {"State": {"Status": status}}
+
+    def set_status(self, status):
+        self.status = status
+        self.attrs["State"]["Status"] = status
+
+    def pause(self):
+        self.set_status("paused")
+
+    def unpause(self):
+        self.set_status("running")
+
+    def stop(self):
+        self.set_status("exited")
+
+    def start(self):
+        self.set_status("running")
+
+    def reload(self):
+        pass
+
+class fake_index:
+    def __init__(self, container):
+        self.container = container
+
+    def get(self, user_id, container_name):
+        return self.container
+
+    def owner_of(self, container):
+        return "alice", "box"
+
+    def containers(self):
+        return [self.container]
+
+    def add(self, container):
+        pass
+
+class fake_sampler:
+    def usage(self, container_ids):
+        return {}
+
+class fake_rebalancer:
+    def schedule(self, user_id):
+        pass
+
+class fake_manager:
+    def __init__(self, container):
+        self.index = fake_index(container)
+        self.stats_sampler = fake_sampler()
+        self.rebalancer = fake_rebalancer()
+
+def test_touch_wakes_a_container_paused_by_another_process():
+    container = fake_container("paused")
+    monitor = idle_monitor(fake_manager(container), timeout=60)
+    monitor.touch("alice", "box")
+    assert container.status == "running"
+
+def test_activity_seen_by_another_process_keeps_a_container_awake():
+    registry = local_session_registry()
+    container = fake_container("running")
+    hibernating = idle_monitor(fake_manager(container), timeout=60)
+    hibernating.share(registry, interval=3600)
+    hibernating.started_at -= 120
+
+    ## Another worker saw terminal input on this container a moment ago
+    registry.record_activity({("alice", "box"): time.time()})
+    hibernating.check()
+    assert container.status == "running"
+
+    ## Without it the container has been idle longer than the timeout
+    registry.last_activity.clear()
+    hibernating.check()
+    assert container.status == "paused"
+
+def test_container_stopped_by_another_process_is_restarted():
+    registry = local_session_registry()
+    container = fake_container("running")
+    hibernating = idle_monitor(fake_manager(container), timeout=60, action="stop")
+    hibernating.share(registry, interval=3600)
+    hibernating.started_at -= 120
+    hibernating.check()
+    assert container.status == "exited"
+
+    ## Another worker has no hibernation entry of its own, only the shared mark
+    other = idle_monitor(fake_manager(container), timeout=60)
+    other.share(registry, interval=3600)
+    assert other.is_hibernated("alice", "box")
+    other.wake(container)
+    assert container.status == "running"
+    assert registry.hibernated(("alice", "box")) is None
+
+def test_container_the_user_stopped_stays_stopped():
+    registry = local_session_registry()
+    container = fake_container("exited")
+    monitor = idle_monitor(fake_manager(container), timeout=60)
+    monitor.share(registry, interval=3600)
+    assert not monitor.is_hibernated("alice", "box")
+    assert monitor.wake(container) is None
+    assert container.status == "exited"
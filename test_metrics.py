@@ -0,0 +1,25 @@
+import metrics
+
+class fake_terminal:
+    user_id = "alice-uid"
+    container_name = "secret-project"
+    tab_id = "tab-1"
+    closed = False
+    bytes_in = 10
+    bytes_out = 20
+
+def test_terminal_series_carry_no_user_labels():
+    metrics.add_terminal_source(lambda: [fake_terminal()])
+    text = "\n".join(metrics.collect_terminals())
+    assert "glitched_terminal_sessions 1" in text
+    assert "alice-uid" not in text and "secret-project" not in text and "tab-1" not in text
+
+def test_docker_api_paths_drop_ids():
+    assert metrics.api_call("GET", "http+docker://localhost/v1.45/containers/abc123/json") == "GET /containers/{id}/json"
+    assert metrics.api_call("POST", "http+docker://localhost/v1.45/exec/ff00/start") == "POST /exec/{id}/start"
+
+def test_running_totals_are_counters():
+    lines = metrics.stats_lines("terminal_stream", {"bytes_in": 5, "bytes_out": 7}, counters={"bytes_in", "bytes_out"})
+    assert "# TYPE glitched_terminal_stream_bytes_in_total counter" in lines
+    assert "glitched_terminal_stream_bytes_out_total 7" in lines
+    assert "# TYPE glitched_index_hits gauge" in metrics.stats_lines("index", {"hits": 1})
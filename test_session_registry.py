@@ -0,0 +1,65 @@
+from session_registry import local_session_registry, terminal_router
+
+class counting_registry(local_session_registry):
+    def __init__(self):
+        super().__init__()
+        self.owner_calls = 0
+
+    def owner(self, key):
+        self.owner_calls += 1
+        return super().owner(key)
+
+def make_worker(registry, worker_id, calls):
+    def handler(event):
+        return lambda user_id, sid, data: calls.append((worker_id, event, data.get("input")))
+    events = ["terminal_attach", "terminal_input", "terminal_ack", "terminal_close", "detach_sid"]
+    return terminal_router(registry, worker_id, {event: handler(event) for event in events})
+
+def test_events_are_delivered_to_the_owning_worker():
+    registry = counting_registry()
+    calls = []
+    a = make_worker(registry, "worker-a", calls)
+    b = make_worker(registry, "worker-b", calls)
+    data = {"container_name": "box", "tab_id": "t1", "input": "ls\r"}
+
+    ## worker-a opened the terminal; a keystroke arriving at worker-b runs on worker-a
+    a.claim(("alice", "box", "t1"))
+    b.dispatch("terminal_input", "alice", "sid-on-b", data)
+    assert calls == [("worker-a", "terminal_input", "ls\r")]
+    assert b.stats()["forwarded"] == 1
+
+def test_ownership_is_cached_between_keystrokes():
+    registry = counting_registry()
+    calls = []
+    a = make_worker(registry, "worker-a", calls)
+    b = make_worker(registry, "worker-b", calls)
+    data = {"container_name": "box", "tab_id": "t1", "input": "x"}
+    a.claim(("alice", "box", "t1"))
+
+    for _ in range(10):
+        a.dispatch("terminal_input", "alice", "sid", data)
+    assert registry.owner_calls == 0
+
+    for _ in range(10):
+        b.dispatch("terminal_input", "alice", "sid", data)
+    assert registry.owner_calls == 1
+    assert len(calls) == 20 and all(worker == "worker-a" for worker, _, _ in calls)
+
+def test_sessions_of_a_dead_worker_run_locally():
+    registry = counting_registry()
+    calls = []
+    a = make_worker(registry, "worker-a", calls)
+    b = make_worker(registry, "worker-b", calls)
+    a.claim(("alice", "box", "t1"))
+    del registry.subscribers["worker-a"]
+
+    b.dispatch("terminal_attach", "alice", "sid", {"container_name": "box", "tab_id": "t1"})
+    assert calls == [("worker-b", "terminal_attach", None)]
+
+def test_broadcast_reaches_every_worker():
+    registry = counting_registry()
+    calls = []
+    make_worker(registry, "worker-a", calls)
+    b = make_worker(registry, "worker-b", calls)
+    b.broadcast("detach_sid", None, "sid", {})
+    assert sorted(worker for worker, _, _ in calls) == ["worker-a", "worker-b"]
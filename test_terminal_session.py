@@ -0,0 +1,47 @@
+import os
+import resource
+import socket
+import threading
+import pytest
+from terminal_session import output_framer, terminal_session, TAIL_BYTES
+
+def test_drop_keeps_tail_bytes_of_multibyte_output():
+    framer = output_framer()
+    framer.feed(("é" * TAIL_BYTES).encode())
+    framer.trim("drop")
+    assert framer.pending_bytes <= TAIL_BYTES
+    assert len(framer.take().encode()) <= TAIL_BYTES
+
+def test_unacked_counts_encoded_bytes():
+    sent = []
+    ours, theirs = socket.socketpair()
+    terminal = terminal_session(ours, "u", "box", "tab", lambda event, data, to=None: sent.append(data))
+    terminal.sid = "sid"
+    terminal.framer.feed("héllo 😀".encode())
+    terminal.flush()
+    assert sent[0]["size"] == len("héllo 😀".encode())
+    assert terminal.unacked == sent[0]["size"]
+    ours.close()
+    theirs.close()
+
+def test_large_send_on_high_fd():
+    ours, theirs = socket.socketpair()
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard != resource.RLIM_INFINITY and hard < 2048:
+        pytest.skip("fd limit too low")
+    resource.setrlimit(resource.RLIMIT_NOFILE, (max(soft, 2048), hard))
+    high = socket.socket(fileno=os.dup2(ours.fileno(), 1500))
+    high.setblocking(False)
+    received = []
+    reader = threading.Thread(target=lambda: [received.append(len(chunk)) for chunk in iter(lambda: theirs.recv(65536), b"")])
+    reader.start()
+    try:
+        terminal = terminal_session(high, "u", "box", "tab", lambda *args, **kwargs: None)
+        terminal.send(b"x" * (4 * 1024 * 1024))
+    finally:
+        high.close()
+        ours.close()
+        reader.join(5)
+        theirs.close()
+        resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+    assert sum(received) == 4 * 1024 * 1024
@@ -0,0 +1,43 @@
+from warm_pool import warm_pool, POOL_LABEL
+
+class fake_container:
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.status = "running"
+        self.removed = False
+
+    def remove(self, force=False):
+        self.removed = True
+
+class fake_client:
+    def __init__(self, containers):
+        self.containers = self
+        self.items = containers
+
+    def list(self, all=False, filters=None):
+        return list(self.items)
+
+class fake_endpoint:
+    def __init__(self, containers):
+        self.client = fake_client(containers)
+
+class fake_manager:
+    def __init__(self, containers):
+        self.endpoints = [fake_endpoint(containers)]
+
+def test_adopt_leaves_claimed_containers_alone():
+    spare = fake_container("pool_ubuntu_java_1", {POOL_LABEL: "ubuntu/java"})
+    claimed = fake_container("claimed.alice.box", {POOL_LABEL: "ubuntu/java"})
+    extra = fake_container("pool_ubuntu_java_2", {POOL_LABEL: "ubuntu/java"})
+    pool = warm_pool(fake_manager([claimed, spare, extra]), spec="ubuntu/java=1")
+    pool.adopt()
+    assert list(pool.ready[("ubuntu", "java")]) == [spare]
+    assert not claimed.removed
+    assert extra.removed
+
+def test_claim_skips_claimed_containers():
+    claimed = fake_container("claimed.alice.box", {POOL_LABEL: "ubuntu/java"})
+    pool = warm_pool(fake_manager([]), spec="ubuntu/java=1")
+    pool.ready[("ubuntu", "java")].append(claimed)
+    assert pool.claim("ubuntu", "java", "bob", "box") is None
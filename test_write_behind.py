@@ -0,0 +1,80 @@
+import threading
+from docker_executor import docker_executor, operation_timeout
+from write_behind import write_behind_buffer
+
+def test_stuck_write_does_not_hold_up_other_files():
+    release = threading.Event()
+    flushed = {}
+    done = threading.Event()
+
+    def write(user_id, container_name, file_path, content):
+        if file_path == "stuck.txt":
+            release.wait(5)
+
+    def on_flushed(key, entry, error):
+        flushed[key[2]] = entry["content"]
+        if key[2] == "quick.txt":
+            done.set()
+
+    buffer = write_behind_buffer(write, on_flushed, executor=docker_executor(), idle_delay=0.01, max_delay=0.05)
+    buffer.submit("u", "box", "stuck.txt", "a", 1, "sid")
+    buffer.submit("u", "box", "quick.txt", "b", 1, "sid")
+    try:
+        assert done.wait(2)
+        assert flushed == {"quick.txt": "b"}
+    finally:
+        release.set()
+
+def test_explicit_flush_writes_latest_contents():
+    writes = []
+    buffer = write_behind_buffer(lambda *args: writes.append(args), lambda *args: None, idle_delay=60, max_delay=60)
+    buffer.submit("u", "box", "f.txt", "one", 1, "sid")
+    buffer.submit("u", "box", "f.txt", "two", 2, "sid")
+    assert buffer.flush("u", "box", "f.txt") == (True, None)
+    assert writes == [("u", "box", "f.txt", "two")]
+    assert buffer.flush("u", "box", "f.txt") == (False, None)
+
+class stuck_executor:
+    def run(self, queue, op, fn, *args):
+        raise operation_timeout()
+
+def test_timed_out_flush_is_not_saved():
+    buffer = write_behind_buffer(lambda *args: None, lambda *args: None, idle_delay=60, max_delay=60)
+    buffer.executor = stuck_executor()
+    buffer.submit("u", "box", "f.txt", "one", 1, "sid")
+    flushed, error = buffer.flush("u", "box", "f.txt")
+    assert not flushed and isinstance(error, operation_timeout)
+
+def test_discarded_generation_is_never_written():
+    writes = []
+    buffer = write_behind_buffer(lambda *args: writes.append(args), lambda *args: None, idle_delay=60, max_delay=60)
+    buffer.submit("u", "box", "dir/f.txt", "one", 1, "sid")
+    ## As if the folder was deleted between the flush taking the entry and writing it
+    with buffer.cond:
+        buffer.generations["u", "box", "dir/f.txt"] = 1
+    assert buffer.flush("u", "box", "dir/f.txt") == (False, None)
+    assert writes == []
+
+def test_discard_waits_for_a_write_in_flight():
+    started, release = threading.Event(), threading.Event()
+    events = []
+
+    def write(*args):
+        started.set()
+        release.wait(5)
+        events.append("written")
+
+    buffer = write_behind_buffer(write, lambda *args: None, idle_delay=60, max_delay=60)
+    buffer.submit("u", "box", "dir/f.txt", "one", 1, "sid")
+    flusher = threading.Thread(target=buffer.flush, args=("u", "box", "dir/f.txt"))
+    flusher.start()
+    assert started.wait(2)
+    discarder = threading.Thread(target=lambda: (buffer.discard("u", "box", "dir"), events.append("discarded")))
+    discarder.start()
+    discarder.join(0.1)
+    assert events == []
+    release.set()
+    discarder.join(2)
+    flusher.join(2)
+    ## The delete that follows discard() can't be overtaken by the write
+    assert events == ["written", "discarded"]
@@ -0,0 +1,155 @@
+import collections
+import os
+import threading
+import time
+import uuid
+import docker
+from container_index import claimed_name, owner_from, CLAIMED_PREFIX
+
+## e.g. WARM_POOL="ubuntu/java=2,alpine/python=1" keeps two started and provisioned
+## ubuntu containers with the java template ready, and one alpine with python
+POOL_SPEC = os.getenv("WARM_POOL", "")
+POOL_LABEL = "glitched_pool"
+REFILL_INTERVAL = float(os.getenv("WARM_POOL_REFILL_INTERVAL", "30"))
+
+def parse_pool_spec(spec: str):
+    targets = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        kind, _, size = item.partition("=")
+        os_image, _, template_type = kind.partition("/")
+        try:
+            targets[(os_image.strip(), template_type.strip())] = int(size or "1")
+        except ValueError:
+            print(f"Ignoring bad warm pool entry '{item}'")
+    return targets
+
+## Containers that are already running with their template's startup.sh done, waiting
+## for create_container to hand one out. Pool containers only carry the glitched_pool
+## label, so nothing else sees them until they are claimed (renamed, see container_index).
+## A background thread tops every pool back up after claims.
+class warm_pool:
+    def __init__(self, manager, spec=POOL_SPEC, refill_interval=REFILL_INTERVAL):
+        self.manager = manager
+        self.targets = parse_pool_spec(spec)
+        self.refill_interval = refill_interval
+        self.ready = {key: collections.deque() for key in self.targets}
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.hits = 0
+        self.misses = 0
+        self.provisioned = 0
+        self.claim_times = collections.deque(maxlen=256)
+        self.thread = None
+
+    def start(self):
+        if not self.targets or self.thread:
+            return
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    ## Claiming only renames a container, so claimed ones keep the pool label. Those belong
+    ## to a user now: never hand them out again, and never remove them.
+    def is_claimed(self, container):
+        return container.name.lstrip("/").startswith(CLAIMED_PREFIX) or owner_from(container.labels, container.name) is not None
+
+    ## Pick up pool containers left over from a previous run instead of starting new ones
+    def adopt(self):
+        containers = []
+        for endpoint in self.manager.endpoints:
+            containers += endpoint.client.containers.list(all=True, filters={"label": POOL_LABEL})
+        for container in containers:
+            if self.is_claimed(container):
+                continue
+            os_image, _, template_type = container.labels.get(POOL_LABEL, "").partition("/")
+            key = (os_image, template_type)
+            with self.lock:
+                queue = self.ready.get(key)
+                keep = queue is not None and container.status == "running" and len(queue) < self.targets[key]
+                if keep:
+                    queue.append(container)
+            if not keep:
+                self.discard(container)
+        print(f"Warm pool adopted {sum(len(q) for q in self.ready.values())} containers")
+
+    def discard(self, container):
+        try:
+            container.remove(force=True)
+        except docker.errors.APIError as e:
+            print(f"Could not remove pool container {container.name}: {e.explanation}")
+
+    def run(self):
+        try:
+            self.adopt()
+        except Exception as e:
+            print(f"Warm pool adopt error: {e}")
+        while True:
+            self.wake.clear()
+            for key, target in self.targets.items():
+                while len(self.ready[key]) < target:
+                    try:
+                        self.refill(*key)
+                    except Exception as e:
+                        print(f"Warm pool refill error for {key}: {e}")
+                        break
+            self.wake.wait(self.refill_interval)
+
+    def refill(self, os_image, template_type):
+        container = self.manager.provision_container(
+            os_image,
+            template_type,
+            name=f"pool_{os_image}_{template_type}_{uuid.uuid4()}",
+            labels={POOL_LABEL: f"{os_image}/{template_type}"}
+        )
+        with self.lock:
+            self.ready[(os_image, template_type)].append(container)
+            self.provisioned += 1
+
+    ## Hand a ready container to user_id as container_name, or None if the pool is empty
+    def claim(self, os_image, template_type, user_id, container_name):
+        started = time.monotonic()
+        with self.lock:
+            queue = self.ready.get((os_image, template_type))
+            container = None
+            while queue and container is None:
+                container = queue.popleft()
+                if self.is_claimed(container):
+                    container = None
+            if container is None:
+                self.misses += 1
+                return None
+        self.wake.set()
+
+        try:
+            container.rename(claimed_name(user_id, container_name))
+            container.reload()
+        except docker.errors.APIError as e:
+            print(f"Could not claim pool container {container.name}: {e.explanation}")
+            self.discard(container)
+            with self.lock:
+                self.misses += 1
+            return None
+        self.manager.index.add(container)
+        self.manager.ensure_user_in_container(container, user_id)
+
+        with self.lock:
+            self.hits += 1
+            self.claim_times.append(time.monotonic() - started)
+        return container
+
+    def stats(self):
+        with self.lock:
+            times = list(self.claim_times)
+            return {
+                "pools": {
+                    f"{os_image}/{template_type}": {"ready": len(self.ready[(os_image, template_type)]), "target": target}
+                    for (os_image, template_type), target in self.targets.items()
+                },
+                "hits": self.hits,
+                "misses": self.misses,
+                "provisioned": self.provisioned,
+                "claim_ms_avg": round(1000 * sum(times) / len(times), 1) if times else None,
+                "claim_ms_max": round(1000 * max(times), 1) if times else None,
+            }
@@ -0,0 +1,144 @@
+import os
+import threading
+import time
+from docker_executor import operation_timeout
+
+IDLE_DELAY = float(os.getenv("WRITE_BEHIND_IDLE_MS", "500")) / 1000
+MAX_DELAY = float(os.getenv("WRITE_BEHIND_MAX_MS", "3000")) / 1000
+## How long discard() waits for a write of the same file that is already under way
+DISCARD_WAIT = float(os.getenv("WRITE_BEHIND_DISCARD_WAIT_MS", "10000")) / 1000
+
+## Holds the latest editor contents per (user_id, container_name, file_path) and writes
+## them to the container later, so a burst of keystrokes becomes a single put_archive.
+## A file is flushed once edits stop for IDLE_DELAY, once MAX_DELAY has passed since
+## its first unsaved edit, or straight away on flush() (explicit save, disconnect, reads).
+## With an executor, each flush runs as its own job on the fast pool, so one stuck
+## put_archive only holds up its own file; without one, flushes run inline.
+class write_behind_buffer:
+    def __init__(self, write, on_flushed, executor=None, idle_delay=IDLE_DELAY, max_delay=MAX_DELAY):
+        self.write = write            # write(user_id, container_name, file_path, content)
+        self.on_flushed = on_flushed  # on_flushed(key, entry, error)
+        self.executor = executor
+        self.idle_delay = idle_delay
+        self.max_delay = max_delay
+        self.pending = {}
+        self.cond = threading.Condition()
+        ## Striped locks keep two flushes of the same file from racing each other
+        self.flush_locks = [threading.Lock() for _ in range(64)]
+        self.flushing = set()         # keys with a background flush queued or running
+        self.writing = set()          # keys whose contents are being written right now
+        ## Bumped by discard(); an entry from an older generation is never written, even if
+        ## its flush had already taken it out of pending when the file was deleted
+        self.generations = {}
+        self.edits_received = 0
+        self.writes_done = 0
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def submit(self, user_id, container_name, file_path, content, version, sid):
+        key = (user_id, container_name, file_path)
+        now = time.monotonic()
+        with self.cond:
+            entry = self.pending.get(key)
+            if entry is None:
+                entry = {"first_at": now, "edits": 0}
+                self.pending[key] = entry
+            entry.update(content=content, version=version, sid=sid, last_at=now, generation=self.generations.get(key, 0))
+            entry["edits"] += 1
+            self.edits_received += 1
+            self.cond.notify()
+
+    def deadline(self, entry):
+        return min(entry["last_at"] + self.idle_delay, entry["first_at"] + self.max_delay)
+
+    def run(self):
+        while True:
+            with self.cond:
+                now = time.monotonic()
+                waiting = {key: entry for key, entry in self.pending.items() if key not in self.flushing}
+                due = [key for key, entry in waiting.items() if self.deadline(entry) <= now]
+                if not due:
+                    deadlines = [self.deadline(entry) for entry in waiting.values()]
+                    self.cond.wait(min(deadlines) - now if deadlines else None)
+                    continue
+                self.flushing.update(due)
+            for key in due:
+                if self.executor:
+                    self.executor.submit("fast", "write_file", self.background_flush, key)
+                else:
+                    self.background_flush(key)
+
+    def background_flush(self, key):
+        try:
+            self.flush_key(key)
+        finally:
+            with self.cond:
+                self.flushing.discard(key)
+                ## Edits that arrived during the write may already be due
+                self.cond.notify()
+
+    def flush_key(self, key):
+        with self.flush_locks[hash(key) % len(self.flush_locks)]:
+            with self.cond:
+                entry = self.pending.pop(key, None)
+                if entry is None:
+                    return False, None
+                self.writing.add(key)
+            try:
+                with self.cond:
+                    if entry["generation"] != self.generations.get(key, 0):
+                        return False, None
+                self.write(*key, entry["content"])
+                self.writes_done += 1
+                self.on_flushed(key, entry, None)
+                return True, None
+            except Exception as e:
+                self.on_flushed(key, entry, e)
+                return False, e
+            finally:
+                with self.cond:
+                    self.writing.discard(key)
+                    if key not in self.pending:
+                        self.generations.pop(key, None)
+                    self.cond.notify_all()
+
+    ## Returns (flushed, error): flushed is True once buffered contents were written, and
+    ## error is why they weren't. (False, None) means nothing was buffered. On a timeout
+    ## the write carries on in the background and on_flushed reports it once it finishes.
+    def flush(self, user_id, container_name, file_path):
+        key = (user_id, container_name, file_path)
+        if not self.executor:
+            return self.flush_key(key)
+        try:
+            return self.executor.run("fast", "write_file", self.flush_key, key)
+        except operation_timeout as e:
+            return False, e
+
+    ## Flush everything a disconnecting client still has buffered
+    def flush_sid(self, sid):
+        with self.cond:
+            keys = [key for key, entry in self.pending.items() if entry["sid"] == sid]
+        for key in keys:
+            self.flush(*key)
+
+    ## Forget buffered edits, e.g. for a file that is about to be deleted, including any a
+    ## flush has already picked up but not yet written. A put_archive already in flight
+    ## can't be recalled, so wait (up to DISCARD_WAIT) for it to land before the delete runs.
+    def discard(self, user_id, container_name, file_path, wait=DISCARD_WAIT):
+        def matches(key):
+            return key[:2] == (user_id, container_name) and (
+                key[2] == file_path or key[2].startswith(file_path.rstrip("/") + "/")
+            )
+        with self.cond:
+            for key in set(self.pending) | self.writing:
+                if matches(key):
+                    self.pending.pop(key, None)
+                    self.generations[key] = self.generations.get(key, 0) + 1
+            self.cond.wait_for(lambda: not any(matches(key) for key in self.writing), timeout=wait)
+
+    def stats(self):
+        with self.cond:
+            return {
+                "pending": len(self.pending),
+                "edits": self.edits_received,
+                "writes": self.writes_done,
+            }